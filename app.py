@@ -3,11 +3,19 @@ WorkBase CRM — Full Stack
 Telegram Bot + WhatsApp KB Import + OpenClaw Skill API
 """
 
-from flask import Flask, request, jsonify, send_file, session
-import sqlite3, os, json, re, hashlib, hmac
+from flask import Flask, request, jsonify, session
+import sqlite3, os, sys, io, json, re, hashlib, hmac, base64, queue, threading, time, heapq, itertools, atexit, signal
+import http.client, codecs, tempfile, multiprocessing, bisect, gzip, shlex
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
 import urllib.request, urllib.parse
+try:
+    import brotli   # optional: pip install brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'crm-secret-change-me-2024')
@@ -21,92 +29,457 @@ CRM_URL       = os.environ.get('CRM_URL', 'https://your-app.railway.app')      #
 ALLOWED_USERS = os.environ.get('TELEGRAM_ALLOWED_USERS', '')                   # comma-separated Telegram user IDs
 
 # ── DB ────────────────────────────────────────────────────────────────────────
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Connections are pooled and handed out per thread through db(). Every
+# connection runs in WAL mode so readers never block on the single writer.
+DB_POOL_SIZE       = int(os.environ.get('DB_POOL_SIZE', 8))            # idle connections kept open
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))   # wait this long on a locked db
+DB_CACHE_KB        = int(os.environ.get('DB_CACHE_KB', 8192))          # page cache per connection
+DB_MMAP_SIZE       = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+
+_db_pool  = queue.LifoQueue()
+_db_local = threading.local()
+
+def _open_db():
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           factory=_MeteredConnection)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
-def init_db():
-    conn = get_db()
-    c = conn.cursor()
-    c.executescript('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            status TEXT DEFAULT 'todo',
-            priority TEXT DEFAULT 'medium',
-            assigned_to INTEGER,
-            assigned_by TEXT,
-            due_date TEXT,
-            tags TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS team_members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            role TEXT,
-            avatar_url TEXT,
-            email TEXT
-        );
-        CREATE TABLE IF NOT EXISTS comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            author TEXT,
-            content TEXT,
-            created_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT,
-            created_at TEXT DEFAULT (datetime('now')),
-            updated_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS kb_entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT,
-            category TEXT DEFAULT 'General',
-            created_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS activity_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            action TEXT,
-            details TEXT,
-            timestamp TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS reminders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            remind_at TEXT,
-            repeat_type TEXT DEFAULT 'none',
-            created_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS telegram_sessions (
+def _release_db(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    if _db_pool.qsize() < DB_POOL_SIZE:
+        _db_pool.put(conn)
+    else:
+        conn.close()
+
+@contextmanager
+def db():
+    """
+    Borrow a pooled connection for the current thread.
+    The outermost block commits on success and rolls back on error;
+    nested blocks share the same connection and transaction.
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        _db_local.depth += 1
+        try:
+            yield conn
+        finally:
+            _db_local.depth -= 1
+        return
+    try:
+        conn = _db_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_db()
+    _db_local.conn, _db_local.depth = conn, 1
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _db_local.conn = None
+        _release_db(conn)
+
+def _reset_db_pool():
+    # A forked child must never reuse the parent's sqlite handles.
+    global _db_pool, _db_local
+    _db_pool, _db_local = queue.LifoQueue(), threading.local()
+
+os.register_at_fork(after_in_child=_reset_db_pool)
+
+# ── METRICS ───────────────────────────────────────────────────────────────────
+# Process-local counters and histograms, rendered in Prometheus text format at
+# /metrics. Every connection from db() is metered, so query counts and time are
+# known globally and per HTTP request. Each worker process reports its own series.
+METRICS_BUCKETS   = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # seconds
+METRICS_GAUGE_TTL = float(os.environ.get('METRICS_GAUGE_TTL', 30))   # seconds between table-size refreshes
+METRICS_HELP = {
+    'crm_http_requests_total':           'HTTP responses by route, method and status.',
+    'crm_http_request_seconds':          'HTTP request latency by route and method.',
+    'crm_http_db_queries_total':         'Database statements executed while serving each route.',
+    'crm_http_db_seconds_total':         'Database time spent while serving each route.',
+    'crm_db_queries_total':              'Database statements executed by this process.',
+    'crm_db_seconds_total':              'Time spent in database calls by this process.',
+    'crm_telegram_send_seconds':         'Bot API call latency by method.',
+    'crm_telegram_sends_total':          'Bot API call attempts by method and outcome (ok, retry, fail).',
+    'crm_telegram_update_seconds':       'Time to process one incoming Telegram update.',
+    'crm_telegram_update_wait_seconds':  'Time an incoming Telegram update waited in the queue.',
+    'crm_telegram_update_errors_total':  'Telegram updates whose processing raised.',
+}
+
+class Metrics:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock       = threading.Lock()
+        self._counters   = {}    # (name, labels) -> value
+        self._hists      = {}    # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.db_queries  = 0
+        self.db_seconds  = 0.0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0]
+            h[bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+            h[-1] += seconds
+
+    def render(self, gauges=()):
+        """Prometheus text exposition; `gauges` is an iterable of (name, labels, value)."""
+        with self._lock:
+            counters = dict(self._counters)
+            hists    = {k: list(v) for k, v in self._hists.items()}
+            counters[('crm_db_queries_total', ())] = self.db_queries
+            counters[('crm_db_seconds_total', ())] = self.db_seconds
+        out, typed = [], set()
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in METRICS_HELP:
+                    out.append(f'# HELP {name} {METRICS_HELP[name]}')
+                out.append(f'# TYPE {name} {kind}')
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            out.append(f'{name}{_prom_labels(labels)} {float(value)!r}')
+        for (name, labels), h in sorted(hists.items()):
+            header(name, 'histogram')
+            count = 0
+            for bound, n in zip(METRICS_BUCKETS + ('+Inf',), h):
+                count += n
+                out.append(f'{name}_bucket{_prom_labels(labels + (("le", bound),))} {count}')
+            out.append(f'{name}_sum{_prom_labels(labels)} {h[-1]!r}')
+            out.append(f'{name}_count{_prom_labels(labels)} {count}')
+        for name, labels, value in sorted(gauges, key=lambda g: g[0]):   # a family's samples must be contiguous
+            header(name, 'gauge')
+            out.append(f'{name}{_prom_labels(labels)} {float(value)!r}')
+        return '\n'.join(out) + '\n'
+
+def _prom_labels(labels):
+    if not labels:
+        return ''
+    esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in labels) + '}'
+
+metrics = Metrics()
+os.register_at_fork(after_in_child=metrics._reset)
+
+class _DbMeter(threading.local):
+    queries = 0      # statements run by this thread since the current request began
+    seconds = 0.0
+    started = None   # perf_counter() at the start of the request being served
+
+_db_meter = _DbMeter()
+
+def _metered(method, counts):
+    def call(self, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            _db_meter.queries += counts
+            _db_meter.seconds += elapsed
+            with metrics._lock:
+                metrics.db_queries += counts
+                metrics.db_seconds += elapsed
+    return call
+
+class _MeteredCursor(sqlite3.Cursor):
+    execute       = _metered(sqlite3.Cursor.execute, 1)
+    executemany   = _metered(sqlite3.Cursor.executemany, 1)
+    executescript = _metered(sqlite3.Cursor.executescript, 1)
+    fetchone      = _metered(sqlite3.Cursor.fetchone, 0)
+    fetchmany     = _metered(sqlite3.Cursor.fetchmany, 0)
+    fetchall      = _metered(sqlite3.Cursor.fetchall, 0)
+
+class _MeteredConnection(sqlite3.Connection):
+    def cursor(self, factory=_MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+# ── MIGRATIONS ────────────────────────────────────────────────────────────────
+# Append-only schema steps; PRAGMA user_version records the last one applied.
+# Steps are idempotent so databases from before versioning (v0) replay cleanly.
+
+BASE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        status TEXT DEFAULT 'todo',
+        priority TEXT DEFAULT 'medium',
+        assigned_to INTEGER,
+        assigned_by TEXT,
+        due_date TEXT,
+        tags TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS team_members (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        role TEXT,
+        avatar_url TEXT,
+        email TEXT
+    );
+    CREATE TABLE IF NOT EXISTS comments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        author TEXT,
+        content TEXT,
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS kb_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT,
+        category TEXT DEFAULT 'General',
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS activity_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        action TEXT,
+        details TEXT,
+        timestamp TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        remind_at TEXT,
+        repeat_type TEXT DEFAULT 'none',
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS telegram_sessions (
+        chat_id TEXT PRIMARY KEY,
+        username TEXT,
+        state TEXT DEFAULT 'idle',
+        context TEXT DEFAULT '{}',
+        last_seen TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS group_knowledge (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id TEXT,
+        chat_title TEXT,
+        speaker TEXT,
+        message TEXT,
+        synced_to_kb INTEGER DEFAULT 0,
+        timestamp TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE IF NOT EXISTS import_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT DEFAULT 'queued',
+        category TEXT,
+        encoding TEXT,
+        bytes_total INTEGER DEFAULT 0,
+        bytes_done INTEGER DEFAULT 0,
+        imported INTEGER DEFAULT 0,
+        error TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        finished_at TEXT
+    );
+'''
+
+def _m_group_message_id(c):
+    _add_column(c, 'group_knowledge', 'message_id', 'INTEGER')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_group_knowledge_msg ON group_knowledge(chat_id, message_id)')
+
+MIGRATIONS = [
+    (1, 'base schema', BASE_SCHEMA),
+    (2, 'group_knowledge.message_id', _m_group_message_id),
+    (3, 'list and stats indexes', '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_created    ON tasks(created_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_status     ON tasks(status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_assignee   ON tasks(assigned_to, created_at);
+        CREATE INDEX IF NOT EXISTS idx_notes_updated    ON notes(updated_at);
+        CREATE INDEX IF NOT EXISTS idx_kb_category      ON kb_entries(category, title);
+        CREATE INDEX IF NOT EXISTS idx_tasks_overdue    ON tasks(due_date) WHERE status != 'done';
+        CREATE INDEX IF NOT EXISTS idx_tasks_done_at    ON tasks(status, updated_at);
+    '''),
+    (4, 'kb full-text index', lambda c: _init_kb_fts(c)),
+    (5, 'trigger-maintained counters', lambda c: _init_counters(c)),
+    (6, 'hot-path indexes', '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_status_priority ON tasks(status, priority);
+        CREATE INDEX IF NOT EXISTS idx_comments_task    ON comments(task_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_gk_unsynced      ON group_knowledge(synced_to_kb, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_activity_ts      ON activity_log(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_reminders_due    ON reminders(remind_at);
+        CREATE INDEX IF NOT EXISTS idx_reminders_list   ON reminders(COALESCE(remind_at,''), id);
+    '''),
+    (7, 'group sync watermarks', '''
+        CREATE TABLE IF NOT EXISTS group_sync_state (
             chat_id TEXT PRIMARY KEY,
-            username TEXT,
-            state TEXT DEFAULT 'idle',
-            context TEXT DEFAULT '{}',
-            last_seen TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS group_knowledge (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_id TEXT,
-            chat_title TEXT,
-            speaker TEXT,
-            message TEXT,
-            synced_to_kb INTEGER DEFAULT 0,
-            timestamp TEXT DEFAULT (datetime('now'))
+            last_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_gk_chat          ON group_knowledge(chat_id);
+        DROP INDEX IF EXISTS idx_gk_unsynced;
+    '''),
+    (8, 'reminder delivery', lambda c: _m_reminder_delivery(c)),
+    (9, 'resource versions', lambda c: _init_resource_versions(c)),
+    (10, 'change log', lambda c: _init_change_log(c)),
+    (11, 'activity rollups', lambda c: _init_activity_rollups(c)),
+    (12, 'telegram session versions',
+     lambda c: _add_column(c, 'telegram_sessions', 'version', 'INTEGER NOT NULL DEFAULT 0')),
+    (13, 'telegram update ids', '''
+        CREATE TABLE IF NOT EXISTS telegram_updates (
+            update_id   INTEGER PRIMARY KEY,
+            received_at TEXT NOT NULL DEFAULT (datetime('now'))
         );
+    '''),
+    (14, 'telegram poll offset', '''
+        CREATE TABLE IF NOT EXISTS telegram_poll_state (
+            bot_id      TEXT PRIMARY KEY,
+            next_offset INTEGER NOT NULL,
+            updated_at  TEXT NOT NULL
+        ) WITHOUT ROWID;
+    '''),
+    (15, 'unreadable reminder times', lambda c: _run_script(c, REMINDER_RETIRE_UNREADABLE_SQL)),
+    (16, 'null-safe list indexes', '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_list          ON tasks(COALESCE(created_at,''));
+        CREATE INDEX IF NOT EXISTS idx_tasks_status_list   ON tasks(status, COALESCE(created_at,''));
+        CREATE INDEX IF NOT EXISTS idx_tasks_assignee_list ON tasks(assigned_to, COALESCE(created_at,''));
+        CREATE INDEX IF NOT EXISTS idx_notes_list          ON notes(COALESCE(updated_at,''));
+        CREATE INDEX IF NOT EXISTS idx_kb_list             ON kb_entries(COALESCE(category,''), title);
+    '''),
+    (17, 'pending group messages',
+     'CREATE INDEX IF NOT EXISTS idx_gk_pending ON group_knowledge(chat_id, id) WHERE synced_to_kb = 0'),
+]
+
+# Free-text times saved before delivery existed ('tomorrow 9am') can never fire: retire them
+REMINDER_RETIRE_UNREADABLE_SQL = '''
+    UPDATE reminders SET fired_at = strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+    WHERE fired_at IS NULL AND remind_at IS NOT NULL AND strftime('%Y-%m-%dT%H:%M:%S', remind_at) IS NULL;
+'''
+
+def _m_reminder_delivery(c):
+    _add_column(c, 'reminders', 'chat_id', 'TEXT')
+    _add_column(c, 'reminders', 'fired_at', 'TEXT')
+    # Nothing was delivered before this step: past one-off reminders are history, not missed
+    _run_script(c, '''
+        UPDATE reminders SET remind_at = NULL WHERE remind_at = '';
+        UPDATE reminders SET remind_at = strftime('%Y-%m-%dT%H:%M:%S', remind_at)
+        WHERE strftime('%Y-%m-%dT%H:%M:%S', remind_at) IS NOT NULL;
+    ''' + REMINDER_RETIRE_UNREADABLE_SQL + '''
+        UPDATE reminders SET fired_at = remind_at
+        WHERE remind_at < strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+          AND COALESCE(repeat_type, 'none') NOT IN ('daily', 'weekly', 'monthly');
+        CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders(remind_at) WHERE fired_at IS NULL;
     ''')
-    c.execute('SELECT COUNT(*) FROM team_members')
-    if c.fetchone()[0] == 0:
-        _seed_data(c)
-    conn.commit()
-    conn.close()
+
+def _run_script(c, script):
+    """executescript() commits first; run statement by statement to stay inside the migration."""
+    stmt = ''
+    for piece in script.split(';'):
+        stmt += piece + ';'
+        if sqlite3.complete_statement(stmt):
+            if stmt.strip(' \t\n;'):
+                c.execute(stmt)
+            stmt = ''
+
+def migrate(conn):
+    """Apply pending MIGRATIONS in order, one transaction each; returns the schema version."""
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            step(conn) if callable(step) else _run_script(conn, step)
+            conn.execute(f'PRAGMA user_version={version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f'[DB] migrated to v{version}: {name}')
+        current = version
+    return current
+
+# Hot read paths; `python app.py check-indexes` fails if any of them falls back
+# to a full table scan or a temp b-tree sort.
+HOT_QUERIES = {
+    'tasks_by_status':   ("SELECT t.*, tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id "
+                          "WHERE t.status=? ORDER BY t.priority DESC LIMIT 10", ('todo',)),
+    'tasks_overdue':     ("SELECT t.*, tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id "
+                          "WHERE t.due_date < ? AND t.status!='done' ORDER BY t.due_date", ('2000-01-01',)),
+    'tasks_by_assignee': ('SELECT id FROM tasks WHERE assigned_to=? ORDER BY created_at DESC LIMIT 20', (1,)),
+    'task_comments':     ('SELECT * FROM comments WHERE task_id=? ORDER BY created_at', (1,)),
+    'group_next_chat':   ('SELECT MIN(chat_id) FROM group_knowledge WHERE chat_id > ?', ('',)),
+    'group_sync_batch':  ('SELECT id, chat_title, speaker, message FROM group_knowledge '
+                          'WHERE chat_id=? AND synced_to_kb=0 ORDER BY id LIMIT ?', ('1', 200)),
+    'activity_by_action': ('SELECT a.id FROM activity_log a WHERE a.action IN (?) ORDER BY a.id DESC LIMIT ?',
+                           ('Task created', 50)),
+    'activity_expired':  ('SELECT id FROM activity_log WHERE timestamp < ? LIMIT ?', ('2000-01-01', 5000)),
+    'activity_trend':    ('SELECT bucket, action, count FROM activity_hourly WHERE bucket >= ? ORDER BY bucket',
+                          ('2000-01-01',)),
+    'reminders_due':     ('SELECT * FROM reminders WHERE remind_at <= ? ORDER BY remind_at', ('2000-01-01',)),
+    'reminders_pending': ('SELECT remind_at, id FROM reminders WHERE fired_at IS NULL AND remind_at IS NOT NULL '
+                          'ORDER BY remind_at LIMIT ?', (500,)),
+    'reminders_list':    ("SELECT r.id FROM reminders r ORDER BY COALESCE(r.remind_at,''), r.id LIMIT 50", ()),
+}
+
+def check_query_plans(conn):
+    """Return {name: [plan lines]} for every HOT_QUERIES entry that scans or sorts."""
+    bad = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        if any((p.startswith('SCAN ') and ' USING ' not in p) or 'TEMP B-TREE' in p for p in plan):
+            bad[name] = plan
+    return bad
+
+def init_db():
+    conn = _open_db()
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+    with db() as conn:
+        c = conn.cursor()
+        # Jobs cannot survive a restart; don't leave them looking alive
+        c.execute("UPDATE import_jobs SET status='failed', error='Interrupted by restart' WHERE status IN ('queued','running')")
+        c.execute('SELECT COUNT(*) FROM team_members')
+        if c.fetchone()[0] == 0:
+            _seed_data(c)
+
+def _add_column(c, table, column, decl):
+    if column not in [r[1] for r in c.execute(f'PRAGMA table_info({table})')]:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
 
 def _seed_data(c):
     members = [
@@ -131,10 +504,880 @@ def _seed_data(c):
         ('Meeting Templates',   '## Weekly Sync\n- Done?\n- Blockers?\n- Plan?',              'Processes'),
     ])
     c.execute("INSERT INTO notes (title,content) VALUES (?,?)", ('Welcome Note', '# Welcome to WorkBase CRM!\n\nTelegram bot + WhatsApp KB import + OpenClaw skill — all connected.'))
-    c.execute("INSERT INTO activity_log (action,details) VALUES (?,?)", ('System init', 'Database seeded'))
+    log_action('System init', 'Database seeded')
+
+# ── ACTIVITY LOG ──────────────────────────────────────────────────────────────
+# log_action() only appends to memory; a flusher writes raw rows and the
+# hourly/daily rollups in one transaction per ACTIVITY_FLUSH_INTERVAL, and
+# prunes raw rows past the row/age caps. Rollups outlive the raw rows.
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 1.0))   # seconds
+ACTIVITY_BUFFER_MAX     = 10000                                                   # entries held before dropping
+ACTIVITY_MAX_ROWS       = int(os.environ.get('ACTIVITY_MAX_ROWS', 50000))         # raw rows kept
+ACTIVITY_MAX_DAYS       = int(os.environ.get('ACTIVITY_MAX_DAYS', 90))            # raw rows kept this long
+ACTIVITY_HOURLY_DAYS    = 35                                                      # hourly rollup history
+ACTIVITY_PRUNE_INTERVAL = 3600                                                    # seconds between prunes
+ACTIVITY_PRUNE_BATCH    = 5000                                                    # rows deleted per transaction
+
+ACTIVITY_ROLLUP_SQL = {
+    'activity_hourly': '''INSERT INTO activity_hourly (bucket,action,count) VALUES (?,?,?)
+                          ON CONFLICT(bucket,action) DO UPDATE SET count = count + excluded.count''',
+    'activity_daily':  '''INSERT INTO activity_daily (bucket,action,count) VALUES (?,?,?)
+                          ON CONFLICT(bucket,action) DO UPDATE SET count = count + excluded.count''',
+}
+
+def _init_activity_rollups(c):
+    _run_script(c, '''
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            bucket TEXT NOT NULL,          -- 'YYYY-MM-DD HH:00'
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, action)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            bucket TEXT NOT NULL,          -- 'YYYY-MM-DD'
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, action)
+        ) WITHOUT ROWID;
+        DELETE FROM activity_hourly;
+        DELETE FROM activity_daily;
+        INSERT INTO activity_hourly (bucket,action,count)
+        SELECT strftime('%Y-%m-%d %H:00', timestamp), COALESCE(action, ''), COUNT(*) FROM activity_log GROUP BY 1, 2;
+        INSERT INTO activity_daily (bucket,action,count)
+        SELECT substr(timestamp, 1, 10), COALESCE(action, ''), COUNT(*) FROM activity_log GROUP BY 1, 2;
+        CREATE INDEX IF NOT EXISTS idx_activity_action  ON activity_log(action, id);
+    ''')
+
+class ActivityLog:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock       = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rows       = []
+        self._flusher    = None
+        self._pruned_at  = time.monotonic()
+        self.stats       = {'logged': 0, 'dropped': 0, 'flushed_rows': 0, 'flushes': 0, 'flush_errors': 0,
+                            'pruned_rows': 0, 'last_flush_ms': 0.0}
+
+    def add(self, action, details):
+        row = (action, details, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))  # UTC, like datetime('now')
+        with self._lock:
+            if len(self._rows) >= ACTIVITY_BUFFER_MAX:
+                self.stats['dropped'] += 1
+                return
+            self._rows.append(row)
+            self.stats['logged'] += 1
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+                self._flusher.start()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, depth=len(self._rows))
+
+    def flush(self):
+        """Write everything buffered so far, with its rollup increments, in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            hourly, daily = {}, {}
+            for action, _, ts in rows:
+                key = (ts[:13] + ':00', action or '')
+                hourly[key] = hourly.get(key, 0) + 1
+                key = (ts[:10], action or '')
+                daily[key] = daily.get(key, 0) + 1
+            started = time.perf_counter()
+            try:
+                with db() as conn:
+                    conn.executemany('INSERT INTO activity_log (action,details,timestamp) VALUES (?,?,?)', rows)
+                    conn.executemany(ACTIVITY_ROLLUP_SQL['activity_hourly'], [(*k, n) for k, n in hourly.items()])
+                    conn.executemany(ACTIVITY_ROLLUP_SQL['activity_daily'], [(*k, n) for k, n in daily.items()])
+            except sqlite3.Error as e:
+                print(f'[ACTIVITY] flush error: {e}')
+                with self._lock:
+                    self._rows[:0] = rows
+                    self.stats['flush_errors'] += 1
+                return 0
+            with self._lock:
+                self.stats['flushes']      += 1
+                self.stats['flushed_rows'] += len(rows)
+                self.stats['last_flush_ms'] = (time.perf_counter() - started) * 1000
+            return len(rows)
+
+    def _run(self):
+        while True:
+            time.sleep(ACTIVITY_FLUSH_INTERVAL)
+            if self._rows:
+                self.flush()
+            if time.monotonic() - self._pruned_at >= ACTIVITY_PRUNE_INTERVAL:
+                self._pruned_at = time.monotonic()
+                try:
+                    n = prune_activity()
+                except sqlite3.Error as e:
+                    print(f'[ACTIVITY] prune error: {e}')
+                    continue
+                with self._lock:
+                    self.stats['pruned_rows'] += n
+
+activity_log = ActivityLog()
+os.register_at_fork(after_in_child=activity_log._reset)
+
+def log_action(action, details):
+    activity_log.add(action, details)
+
+def prune_activity(max_rows=None, max_days=None):
+    """Delete raw activity past the row/age caps, in short transactions. Returns rows deleted."""
+    max_rows = ACTIVITY_MAX_ROWS if max_rows is None else max_rows
+    max_days = ACTIVITY_MAX_DAYS if max_days is None else max_days
+    cutoff = (datetime.utcnow() - timedelta(days=max_days)).strftime('%Y-%m-%d %H:%M:%S')
+    with db() as conn:
+        row = conn.execute('SELECT id FROM activity_log ORDER BY id DESC LIMIT 1 OFFSET ?', (max_rows,)).fetchone()
+    keep_above = row[0] if row else 0
+    deleted = 0
+    while True:
+        with db() as conn:
+            n = conn.execute('''DELETE FROM activity_log WHERE id IN (
+                                  SELECT id FROM activity_log WHERE timestamp < ? LIMIT ?
+                              ) OR id IN (
+                                  SELECT id FROM activity_log WHERE id <= ? ORDER BY id LIMIT ?
+                              )''', (cutoff, ACTIVITY_PRUNE_BATCH, keep_above, ACTIVITY_PRUNE_BATCH)).rowcount
+        deleted += n
+        if n < ACTIVITY_PRUNE_BATCH:
+            break
+    hourly_cutoff = (datetime.utcnow() - timedelta(days=ACTIVITY_HOURLY_DAYS)).strftime('%Y-%m-%d %H:00')
+    with db() as conn:
+        conn.execute('DELETE FROM activity_hourly WHERE bucket < ?', (hourly_cutoff,))
+    return deleted
+
+def activity_trends(conn, bucket='day', since=None, actions=None):
+    """Counts per (bucket, action) from the rollups; bucket is 'hour' or 'day'."""
+    table = 'activity_hourly' if bucket == 'hour' else 'activity_daily'
+    if since is None:
+        since = (datetime.utcnow() - timedelta(days=2 if bucket == 'hour' else 30)).strftime('%Y-%m-%d')
+    sql, params = f'SELECT bucket, action, count FROM {table} WHERE bucket >= ?', [since]
+    if actions:
+        sql += f" AND action IN ({','.join('?' * len(actions))})"
+        params += actions
+    return [dict(r) for r in conn.execute(sql + ' ORDER BY bucket, action', params)]
+
+# ── KB SEARCH (FTS5) ──────────────────────────────────────────────────────────
+# kb_fts is an external-content index over kb_entries, kept in sync by triggers.
+def _init_kb_fts(c):
+    existed = c.execute("SELECT 1 FROM sqlite_master WHERE name='kb_fts'").fetchone()
+    _run_script(c, '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS kb_fts USING fts5(
+            title, content, category,
+            content='kb_entries', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS kb_fts_ai AFTER INSERT ON kb_entries BEGIN
+            INSERT INTO kb_fts(rowid,title,content,category) VALUES (new.id,new.title,new.content,new.category);
+        END;
+        CREATE TRIGGER IF NOT EXISTS kb_fts_ad AFTER DELETE ON kb_entries BEGIN
+            INSERT INTO kb_fts(kb_fts,rowid,title,content,category) VALUES ('delete',old.id,old.title,old.content,old.category);
+        END;
+        CREATE TRIGGER IF NOT EXISTS kb_fts_au AFTER UPDATE ON kb_entries BEGIN
+            INSERT INTO kb_fts(kb_fts,rowid,title,content,category) VALUES ('delete',old.id,old.title,old.content,old.category);
+            INSERT INTO kb_fts(rowid,title,content,category) VALUES (new.id,new.title,new.content,new.category);
+        END;
+    ''')
+    if not existed:
+        # Backfill databases created before the index existed
+        c.execute("INSERT INTO kb_fts(kb_fts) VALUES ('rebuild')")
+
+# ── COUNTERS ──────────────────────────────────────────────────────────────────
+# Exact row counts kept by triggers so stats never need COUNT(*) scans.
+# Names: tasks, tasks.status:<s>, tasks.priority:<p>, tasks.assignee:<id|none>, notes, kb_entries
+def _counter_sql(name_expr, delta):
+    return (f"INSERT INTO counters(name,value) VALUES ({name_expr},{delta}) "
+            f"ON CONFLICT(name) DO UPDATE SET value=value+({delta});")
+
+def _task_counter_sql(row, delta):
+    return '\n'.join([
+        _counter_sql("'tasks'", delta),
+        _counter_sql(f"'tasks.status:' || COALESCE({row}.status,'')", delta),
+        _counter_sql(f"'tasks.priority:' || COALESCE({row}.priority,'')", delta),
+        _counter_sql(f"'tasks.assignee:' || COALESCE({row}.assigned_to,'none')", delta),
+    ])
+
+def _init_counters(c):
+    existed = c.execute("SELECT 1 FROM sqlite_master WHERE name='counters'").fetchone()
+    _run_script(c, f'''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        CREATE TRIGGER IF NOT EXISTS counters_tasks_ai AFTER INSERT ON tasks BEGIN
+            {_task_counter_sql('new', 1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS counters_tasks_ad AFTER DELETE ON tasks BEGIN
+            {_task_counter_sql('old', -1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS counters_tasks_au AFTER UPDATE OF status, priority, assigned_to ON tasks BEGIN
+            {_task_counter_sql('old', -1)}
+            {_task_counter_sql('new', 1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS counters_notes_ai AFTER INSERT ON notes BEGIN {_counter_sql("'notes'", 1)} END;
+        CREATE TRIGGER IF NOT EXISTS counters_notes_ad AFTER DELETE ON notes BEGIN {_counter_sql("'notes'", -1)} END;
+        CREATE TRIGGER IF NOT EXISTS counters_kb_ai AFTER INSERT ON kb_entries BEGIN {_counter_sql("'kb_entries'", 1)} END;
+        CREATE TRIGGER IF NOT EXISTS counters_kb_ad AFTER DELETE ON kb_entries BEGIN {_counter_sql("'kb_entries'", -1)} END;
+    ''')
+    if not existed:
+        rebuild_counters(c)
+
+def rebuild_counters(c):
+    """Recompute every counter from the base tables (run after restores or manual edits)."""
+    c.execute('DELETE FROM counters')
+    c.execute('''
+        INSERT INTO counters(name,value)
+        SELECT 'tasks', COUNT(*) FROM tasks
+        UNION ALL SELECT 'tasks.status:' || COALESCE(status,''), COUNT(*) FROM tasks GROUP BY 1
+        UNION ALL SELECT 'tasks.priority:' || COALESCE(priority,''), COUNT(*) FROM tasks GROUP BY 1
+        UNION ALL SELECT 'tasks.assignee:' || COALESCE(assigned_to,'none'), COUNT(*) FROM tasks GROUP BY 1
+        UNION ALL SELECT 'notes', COUNT(*) FROM notes
+        UNION ALL SELECT 'kb_entries', COUNT(*) FROM kb_entries
+    ''')
+
+def task_stats(conn):
+    """Counter-backed totals plus the two date-dependent figures, each an indexed range count."""
+    counters = {r['name']: r['value'] for r in conn.execute('SELECT name,value FROM counters')}
+    today = datetime.now().strftime('%Y-%m-%d')
+    wd    = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+    return {
+        'total':          counters.get('tasks', 0),
+        'todo':           counters.get('tasks.status:todo', 0),
+        'in_progress':    counters.get('tasks.status:in_progress', 0),
+        'done':           counters.get('tasks.status:done', 0),
+        'by_priority':    {k.split(':', 1)[1]: v for k, v in counters.items() if k.startswith('tasks.priority:') and v},
+        'by_assignee':    {k.split(':', 1)[1]: v for k, v in counters.items() if k.startswith('tasks.assignee:') and v},
+        'notes':          counters.get('notes', 0),
+        'kb_entries':     counters.get('kb_entries', 0),
+        'overdue':        conn.execute("SELECT COUNT(*) FROM tasks WHERE due_date < ? AND status!='done'", (today,)).fetchone()[0],
+        'completed_week': conn.execute("SELECT COUNT(*) FROM tasks WHERE status='done' AND updated_at >= ?", (wd,)).fetchone()[0],
+    }
+
+TASK_STATUSES   = ('todo', 'in_progress', 'done')
+TASK_PRIORITIES = ('urgent', 'high', 'medium', 'low')
+
+def team_workload(conn):
+    """
+    Per-member workload in one grouped query: counts by status, open tasks by
+    priority, overdue count and the age of the oldest open task.
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    cols  = [f"COUNT(CASE WHEN t.status='{s}' THEN 1 END) AS s_{s}" for s in TASK_STATUSES]
+    cols += [f"COUNT(CASE WHEN t.status!='done' AND t.priority='{p}' THEN 1 END) AS p_{p}" for p in TASK_PRIORITIES]
+    rows  = conn.execute(f'''
+        SELECT tm.*, COUNT(t.id) AS task_count, {', '.join(cols)},
+               COUNT(CASE WHEN t.status!='done' AND t.due_date < ? THEN 1 END) AS overdue,
+               MIN(CASE WHEN t.status!='done' THEN t.created_at END) AS oldest_open_at
+        FROM team_members tm LEFT JOIN tasks t ON t.assigned_to = tm.id
+        GROUP BY tm.id ORDER BY tm.id
+    ''', (today,)).fetchall()
+    result = []
+    for r in rows:
+        m = {k: r[k] for k in r.keys() if not k.startswith(('s_', 'p_'))}
+        m['by_status']   = {s: r[f's_{s}'] for s in TASK_STATUSES}
+        m['by_priority'] = {p: r[f'p_{p}'] for p in TASK_PRIORITIES}
+        m['oldest_open_days'] = (
+            (datetime.now() - datetime.strptime(r['oldest_open_at'][:10], '%Y-%m-%d')).days
+            if r['oldest_open_at'] else None)
+        result.append(m)
+    return result
+
+_FTS_TOKEN = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+
+def fts_query(q):
+    """
+    Turns a user query into an FTS5 MATCH expression.
+      deploy fly        → both words (implicit AND)
+      onboard*          → prefix match
+      "weekly sync"     → exact phrase
+      git OR svn, NOT x → boolean operators (upper-case only)
+    Barewords are quoted so punctuation can never break the MATCH syntax.
+    """
+    parts = []
+    for tok in _FTS_TOKEN.findall(q or ''):
+        if tok in ('AND', 'OR', 'NOT', '(', ')'):
+            parts.append(tok)
+        elif tok.startswith('"'):
+            phrase = tok.strip('"').strip()
+            if phrase:
+                parts.append('"' + phrase + '"')
+        else:
+            word = tok.rstrip('*')
+            if word:
+                parts.append('"' + word + '"' + ('*' if tok.endswith('*') else ''))
+    while parts and parts[0] in ('AND', 'OR', 'NOT'):
+        parts.pop(0)
+    while parts and parts[-1] in ('AND', 'OR', 'NOT'):
+        parts.pop()
+    return ' '.join(parts)
+
+def kb_search(conn, q, limit=10, mark=('[', ']')):
+    """bm25-ranked KB search (title weighted over category over content) with highlighted snippets."""
+    match = fts_query(q)
+    if match:
+        try:
+            return conn.execute('''
+                SELECT k.id, k.title, k.category, substr(k.content,1,300) as preview,
+                       snippet(kb_fts, -1, ?, ?, '…', 24) as snippet,
+                       bm25(kb_fts, 10.0, 1.0, 4.0) as rank
+                FROM kb_fts JOIN kb_entries k ON k.id = kb_fts.rowid
+                WHERE kb_fts MATCH ? ORDER BY rank LIMIT ?
+            ''', (mark[0], mark[1], match, limit)).fetchall()
+        except sqlite3.OperationalError:
+            pass  # unbalanced parentheses etc. — fall back to a plain substring scan
+    return conn.execute('''
+        SELECT id, title, category, substr(content,1,300) as preview,
+               substr(content,1,120) as snippet, 0 as rank
+        FROM kb_entries WHERE title LIKE ? OR content LIKE ? OR category LIKE ? LIMIT ?
+    ''', (f'%{q}%', f'%{q}%', f'%{q}%', limit)).fetchall()
+
+# ── LIST QUERIES ──────────────────────────────────────────────────────────────
+# Shared filtering / keyset pagination for the collection endpoints. Bodies stay
+# plain JSON arrays; paging metadata travels in X-Next-Cursor / X-Total-Count.
+# Sort keys on nullable columns go through COALESCE: a row-value cursor never matches NULL.
+LIST_MAX_LIMIT = 500
+
+_TASK_FIELDS = {
+    'id': 't.id', 'title': 't.title', 'description': 't.description', 'status': 't.status',
+    'priority': 't.priority', 'assigned_to': 't.assigned_to', 'assigned_by': 't.assigned_by',
+    'due_date': 't.due_date', 'tags': 't.tags', 'created_at': 't.created_at', 'updated_at': 't.updated_at',
+    'assignee_name': 'tm.name', 'assignee_avatar': 'tm.avatar_url', 'assignee': 'tm.name',
+}
+
+LIST_SPECS = {
+    'tasks': {
+        'from':    'tasks t LEFT JOIN team_members tm ON t.assigned_to = tm.id',
+        'fields':  _TASK_FIELDS,
+        'default': [f for f in _TASK_FIELDS if f != 'assignee'],
+        'order':   (["COALESCE(t.created_at,'')", 't.id'], 'DESC'),
+        'filters': {'status': ('t.status', 'in'), 'priority': ('t.priority', 'in'),
+                    'assigned_to': ('t.assigned_to', 'in'), 'tag': ('t.tags', 'tag'),
+                    'due_from': ('t.due_date', '>='), 'due_to': ('t.due_date', '<=')},
+    },
+    'notes': {
+        'from':    'notes n',
+        'fields':  {f: f'n.{f}' for f in ('id', 'title', 'content', 'created_at', 'updated_at')},
+        'order':   (["COALESCE(n.updated_at,'')", 'n.id'], 'DESC'),
+        'filters': {'updated_from': ('n.updated_at', '>='), 'updated_to': ('n.updated_at', '<=')},
+    },
+    'kb': {
+        'from':    'kb_entries k',
+        'fields':  dict({f: f'k.{f}' for f in ('id', 'title', 'content', 'category', 'created_at')},
+                        updated_at='COALESCE(k.updated_at, k.created_at)'),
+        'order':   (["COALESCE(k.category,'')", 'k.title', 'k.id'], 'ASC'),
+        'filters': {'category': ("COALESCE(k.category,'')", 'in')},
+    },
+    'reminders': {
+        'from':    'reminders r',
+        'fields':  dict({f: f'r.{f}' for f in ('id', 'title', 'description', 'remind_at', 'repeat_type',
+                                               'chat_id', 'fired_at', 'created_at')},
+                        updated_at='COALESCE(r.updated_at, r.created_at)'),
+        'order':   (["COALESCE(r.remind_at,'')", 'r.id'], 'ASC'),
+        'filters': {'repeat_type': ('r.repeat_type', 'in'),
+                    'due_from': ('r.remind_at', '>='), 'due_to': ('r.remind_at', '<=')},
+    },
+    'team': {
+        'from':    'team_members m',
+        'fields':  {f: f'm.{f}' for f in ('id', 'name', 'role', 'avatar_url', 'email', 'updated_at')},
+        'order':   (['m.name', 'm.id'], 'ASC'),
+        'filters': {},
+    },
+    'activity': {
+        'from':    'activity_log a',
+        'fields':  {f: f'a.{f}' for f in ('id', 'action', 'details', 'timestamp')},
+        'order':   (['a.id'], 'DESC'),
+        'filters': {'action': ('a.action', 'in'), 'since': ('a.timestamp', '>='), 'until': ('a.timestamp', '<=')},
+    },
+    'group_knowledge': {
+        'from':    'group_knowledge g',
+        'fields':  {f: f'g.{f}' for f in ('id', 'chat_id', 'chat_title', 'speaker', 'message',
+                                          'message_id', 'synced_to_kb', 'timestamp')},
+        'order':   (['g.id'], 'DESC'),
+        'filters': {'chat_id': ('g.chat_id', 'in'), 'synced': ('g.synced_to_kb', '=')},
+    },
+}
+
+class BadListQuery(ValueError):
+    pass
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor, n):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadListQuery('invalid cursor')
+    if not isinstance(values, list) or len(values) != n:
+        raise BadListQuery('invalid cursor')
+    return values
+
+def list_rows(conn, name, args, limit=None, fields=None):
+    """
+    Runs a filtered, keyset-paginated query for one of LIST_SPECS.
+    Query args: <filters>, fields=a,b,c, limit=N, cursor=<X-Next-Cursor>, count=1.
+    Returns (rows, next_cursor, total); total is None unless count=1 was asked for.
+    """
+    spec = LIST_SPECS[name]
+    if args.get('fields'):
+        wanted = [f for f in args['fields'].split(',') if f in spec['fields']]
+        if not wanted:
+            raise BadListQuery('no known fields requested')
+    else:
+        wanted = fields or spec.get('default') or list(spec['fields'])
+
+    where, params = [], []
+    for key, (col, op) in spec['filters'].items():
+        val = args.get(key)
+        if val in (None, ''):
+            continue
+        if op == 'in':
+            vals = [v.strip() for v in val.split(',') if v.strip()]
+            if not vals:
+                continue
+            where.append(f"{col} IN ({','.join('?' * len(vals))})"); params += vals
+        elif op == 'tag':
+            where.append(f"(',' || REPLACE({col},' ','') || ',') LIKE ?"); params.append(f'%,{val.strip()},%')
+        else:
+            where.append(f'{col} {op} ?'); params.append(val)
+
+    total = None
+    if args.get('count') in ('1', 'true'):
+        sql = f"SELECT COUNT(*) FROM {spec['from']}" + (f" WHERE {' AND '.join(where)}" if where else '')
+        total = conn.execute(sql, params).fetchone()[0]
+
+    keys, direction = spec['order']
+    if args.get('cursor'):
+        values = _decode_cursor(args['cursor'], len(keys))
+        cmp = '<' if direction == 'DESC' else '>'
+        # The bound on the leading key alone lets SQLite seek an expression index; the row value can't
+        where.append(f"{keys[0]} {cmp}= ? AND ({', '.join(keys)}) {cmp} ({', '.join('?' * len(keys))})")
+        params += [values[0]] + values
+
+    if args.get('limit'):
+        try:
+            limit = int(args['limit'])
+        except ValueError:
+            raise BadListQuery('limit must be an integer')
+    if limit is not None:
+        limit = max(1, min(limit, LIST_MAX_LIMIT))
+
+    cols = [f"{spec['fields'][f]} AS {f}" for f in wanted] + [f'{k} AS _k{i}' for i, k in enumerate(keys)]
+    sql  = (f"SELECT {', '.join(cols)} FROM {spec['from']}"
+            + (f" WHERE {' AND '.join(where)}" if where else '')
+            + f" ORDER BY {', '.join(f'{k} {direction}' for k in keys)}")
+    if limit is not None:
+        sql += ' LIMIT ?'; params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([rows[-1][f'_k{i}'] for i in range(len(keys))])
+    items = [{f: r[f] for f in wanted} for r in rows]
+    return items, next_cursor, total
+
+def list_response(name, limit=None, fields=None):
+    try:
+        with db() as conn:
+            items, next_cursor, total = list_rows(conn, name, request.args, limit, fields)
+    except BadListQuery as e:
+        return jsonify({'error': str(e)}), 400
+    resp = jsonify(items)
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        resp.headers['X-Total-Count'] = str(total)
+    return resp
+
+# ── CHANGE LOG ────────────────────────────────────────────────────────────────
+# Triggers journal every insert/update/delete of the synced tables into
+# change_log, keeping one row per (entity, row_id) so it grows with data, not
+# churn. seq is the sync token; deletes stay behind as tombstones.
+CHANGE_FEEDS = {'tasks': 'tasks', 'notes': 'notes', 'kb_entries': 'kb',   # table -> LIST_SPECS name
+                'reminders': 'reminders', 'team_members': 'team'}
+CHANGES_PAGE = 500
+
+def _init_change_log(c):
+    _add_column(c, 'kb_entries', 'updated_at', 'TEXT')
+    _add_column(c, 'reminders', 'updated_at', 'TEXT')
+    _add_column(c, 'team_members', 'updated_at', 'TEXT')
+    _run_script(c, '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (entity, row_id)
+        );
+        UPDATE team_members SET updated_at = datetime('now') WHERE updated_at IS NULL;
+        CREATE TRIGGER IF NOT EXISTS stamp_team_members_ai AFTER INSERT ON team_members WHEN NEW.updated_at IS NULL BEGIN
+            UPDATE team_members SET updated_at = datetime('now') WHERE id = NEW.id;
+        END;
+        -- Only content edits need re-indexing, not updated_at stamps
+        DROP TRIGGER IF EXISTS kb_fts_au;
+        CREATE TRIGGER kb_fts_au AFTER UPDATE OF title, content, category ON kb_entries BEGIN
+            INSERT INTO kb_fts(kb_fts,rowid,title,content,category) VALUES ('delete',old.id,old.title,old.content,old.category);
+            INSERT INTO kb_fts(rowid,title,content,category) VALUES (new.id,new.title,new.content,new.category);
+        END;
+    ''')
+    for table in CHANGE_FEEDS:
+        # Stamp updated_at on any update whose writer didn't set it itself
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS stamp_{table}_au AFTER UPDATE ON {table} WHEN NEW.updated_at IS OLD.updated_at BEGIN
+                UPDATE {table} SET updated_at = datetime('now') WHERE id = NEW.id;
+            END
+        ''')
+        for op, event, ref, deleted in (('ai', 'INSERT', 'NEW', 0), ('au', 'UPDATE', 'NEW', 0), ('ad', 'DELETE', 'OLD', 1)):
+            # DELETE + INSERT rather than OR REPLACE: an outer INSERT OR IGNORE would override the trigger's policy
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS changes_{table}_{op} AFTER {event} ON {table} BEGIN
+                    DELETE FROM change_log WHERE entity = '{table}' AND row_id = {ref}.id;
+                    INSERT INTO change_log (entity,row_id,deleted) VALUES ('{table}', {ref}.id, {deleted});
+                END
+            ''')
+        c.execute(f"INSERT OR IGNORE INTO change_log (entity,row_id) SELECT '{table}', id FROM {table} ORDER BY id")
+
+def changes_since(conn, since, limit=CHANGES_PAGE):
+    """
+    Rows of CHANGE_FEEDS changed after sync token `since` (None = just return the current token).
+    Returns {'token', 'more', 'reset', <feed>: {'upserted': [...], 'deleted': [ids]}}.
+    reset=True means the client must reload everything, then continue from 'token'.
+    """
+    out  = {feed: {'upserted': [], 'deleted': []} for feed in CHANGE_FEEDS.values()}
+    conn.execute('BEGIN')  # one snapshot for the journal and the rows it points at
+    head = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    if since is None or since > head:
+        return dict(out, token=str(head), more=False, reset=True)
+    log = conn.execute('SELECT seq, entity, row_id, deleted FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+                       (since, limit)).fetchall()
+    upserts = {}
+    for r in log:
+        if r['deleted']:
+            out[CHANGE_FEEDS[r['entity']]]['deleted'].append(r['row_id'])
+        else:
+            upserts.setdefault(r['entity'], []).append(r['row_id'])
+    for table, ids in upserts.items():
+        feed  = CHANGE_FEEDS[table]
+        spec  = LIST_SPECS[feed]
+        alias = spec['from'].split()[1]
+        cols  = ', '.join(f'{spec["fields"][f]} AS {f}' for f in spec.get('default') or spec['fields'])
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows  = conn.execute(f"SELECT {cols} FROM {spec['from']} WHERE {alias}.id IN ({','.join('?' * len(chunk))})",
+                                 chunk).fetchall()
+            out[feed]['upserted'] += [dict(r) for r in rows]
+    token = log[-1]['seq'] if log else since
+    return dict(out, token=str(token), more=len(log) == limit, reset=False)
+
+# ── LIVE EVENTS (SSE) ─────────────────────────────────────────────────────────
+# A pump thread tails change_log and fans each row change out to /api/events
+# clients. Write requests in this process wake it at once; writes from
+# background threads and other workers arrive within EVENTS_POLL. With no
+# clients connected the pump sleeps and does no work.
+EVENTS_MAX_STREAMS  = int(os.environ.get('EVENTS_MAX_STREAMS', 20))    # concurrent streams per process
+EVENTS_POLL         = float(os.environ.get('EVENTS_POLL', 1.0))        # seconds between change_log reads
+EVENTS_HEARTBEAT    = 15                                               # seconds between keep-alive comments
+EVENTS_CLIENT_QUEUE = 256                                              # undelivered events before a client is cut off
+EVENTS_RING         = 1000                                             # recent events kept for Last-Event-ID resume
+EVENTS_RESET        = 'event: reset\ndata: {}\n\n'
+
+def _render_event(seq, entity, row_id, deleted):
+    data = json.dumps({'type': CHANGE_FEEDS[entity], 'id': row_id, 'op': 'delete' if deleted else 'upsert'})
+    return f'id: {seq}\nevent: change\ndata: {data}\n\n'
+
+class EventHub:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._cv     = threading.Condition()
+        self._thread = None
+        self._subs   = set()                     # one bounded queue.Queue per client
+        self._ring   = deque(maxlen=EVENTS_RING)  # (seq, rendered event)
+        self._last   = 0                         # highest seq fanned out
+        self._floor  = 0                         # the ring holds every event with seq > floor
+        self._poked  = False
+        self.stats   = {'published': 0, 'rejected': 0, 'cut_off': 0}
+
+    def subscribe(self, last_event_id=None):
+        """Register a client; returns (queue, backlog) or None when the stream limit is reached."""
+        with self._cv:
+            if len(self._subs) >= EVENTS_MAX_STREAMS:
+                self.stats['rejected'] += 1
+                return None
+            if not self._subs:
+                # The pump was idle, so the ring may have gaps: restart it from the head
+                with db() as conn:
+                    self._last = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+                self._ring.clear()
+                self._floor = self._last
+            backlog = []
+            if last_event_id is not None and last_event_id < self._last:
+                if last_event_id >= self._floor:
+                    backlog = [ev for seq, ev in self._ring if seq > last_event_id]
+                else:
+                    with db() as conn:
+                        rows = conn.execute('SELECT seq, entity, row_id, deleted FROM change_log '
+                                            'WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?',
+                                            (last_event_id, self._last, EVENTS_CLIENT_QUEUE + 1)).fetchall()
+                    backlog = ([EVENTS_RESET] if len(rows) > EVENTS_CLIENT_QUEUE
+                               else [_render_event(*r) for r in rows])
+            q = queue.Queue(EVENTS_CLIENT_QUEUE + 1)
+            self._subs.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='events', daemon=True)
+                self._thread.start()
+            self._cv.notify()
+            return q, backlog
+
+    def unsubscribe(self, q):
+        with self._cv:
+            self._subs.discard(q)
+
+    def poke(self):
+        """A write just committed in this process; deliver without waiting for the next poll."""
+        with self._cv:
+            if self._subs:
+                self._poked = True
+                self._cv.notify()
+
+    def stream(self, q, backlog):
+        try:
+            yield 'retry: 3000\n\n'
+            for ev in backlog:
+                yield ev
+                if ev is EVENTS_RESET:
+                    return
+            while True:
+                try:
+                    ev = q.get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield ev
+                if ev is EVENTS_RESET:
+                    return  # the browser reconnects and resumes from its Last-Event-ID
+        finally:
+            self.unsubscribe(q)
+
+    def snapshot(self):
+        with self._cv:
+            return dict(self.stats, streams=len(self._subs), last_seq=self._last, ring=len(self._ring))
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._subs:
+                    self._cv.wait()
+                self._cv.wait_for(lambda: self._poked, timeout=EVENTS_POLL)
+                self._poked = False
+                last = self._last
+            try:
+                with db() as conn:
+                    rows = conn.execute('SELECT seq, entity, row_id, deleted FROM change_log '
+                                        'WHERE seq > ? ORDER BY seq LIMIT 500', (last,)).fetchall()
+            except sqlite3.Error as e:
+                print(f'[EVENTS] read error: {e}')
+                continue
+            with self._cv:
+                if self._last != last:
+                    continue  # a subscriber restarted the pump from the head meanwhile
+                for r in rows:
+                    ev = _render_event(*r)
+                    if len(self._ring) == EVENTS_RING:
+                        self._floor = self._ring[0][0]
+                    self._ring.append((r['seq'], ev))
+                    for q in list(self._subs):
+                        if q.qsize() >= EVENTS_CLIENT_QUEUE:
+                            q.put_nowait(EVENTS_RESET)   # slow client: cut it off rather than buffer forever
+                            self._subs.discard(q)
+                            self.stats['cut_off'] += 1
+                        else:
+                            q.put_nowait(ev)
+                    self._last = r['seq']
+                    self.stats['published'] += 1
+                if len(rows) == 500:
+                    self._poked = True
+
+event_hub = EventHub()
+os.register_at_fork(after_in_child=event_hub._reset)
+
+# ── RESPONSE CACHE ────────────────────────────────────────────────────────────
+# Every write to a versioned table bumps its row in resource_versions (by
+# trigger, so web, bot, Telegram and other workers are all covered). Cached GET
+# routes derive a strong ETag from the versions they read: a matching
+# If-None-Match costs one indexed read and no rendering.
+VERSIONED_TABLES    = ('tasks', 'comments', 'team_members', 'notes', 'kb_entries', 'reminders', 'activity_log')
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))   # rendered responses kept per process
+_CACHED_HEADERS     = ('Content-Type', 'X-Next-Cursor', 'X-Total-Count')
+
+def _init_resource_versions(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS resource_versions (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for table in VERSIONED_TABLES:
+        c.execute('INSERT OR IGNORE INTO resource_versions (name,value) VALUES (?,0)', (table,))
+        for op, event in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS versions_{table}_{op} AFTER {event} ON {table} BEGIN
+                    UPDATE resource_versions SET value = value + 1 WHERE name = '{table}';
+                END
+            ''')
+
+def resource_versions(conn, tables):
+    rows = dict(conn.execute(f'SELECT name, value FROM resource_versions WHERE name IN ({",".join("?" * len(tables))})',
+                             tables).fetchall())
+    return tuple(rows.get(t, 0) for t in tables)
+
+class ResponseCache:
+    """Small LRU of rendered GET responses keyed by (path, query, versions)."""
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._reset()
+
+    def _reset(self):
+        self._lock  = threading.Lock()
+        self._items = OrderedDict()
+        self.stats  = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    def get(self, key):
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None:
+                self._items.move_to_end(key)
+            self.stats['hits' if hit is not None else 'misses'] += 1
+            return hit
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._items), maxsize=self.maxsize)
+
+response_cache = ResponseCache()
+os.register_at_fork(after_in_child=response_cache._reset)
+
+def cached_get(*tables, daily=False):
+    """
+    Conditional-GET caching for a read route that depends only on `tables`.
+    daily=True adds today's date to the key for responses that age (overdue counts).
+    """
+    def deco(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with db() as conn:
+                versions = resource_versions(conn, tables)
+            if daily:
+                versions += (datetime.now().strftime('%Y-%m-%d'),)
+            key  = (request.path, request.query_string, versions)
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()[:24]
+            held = matching_etag(etag)
+            if held:
+                with response_cache._lock:
+                    response_cache.stats['not_modified'] += 1
+                resp = app.response_class(status=304)
+                resp.vary.add('Accept-Encoding')   # _compress only sees 200s
+            else:
+                hit = response_cache.get(key)
+                if hit is not None:
+                    body, headers = hit
+                    resp = app.response_class(body, headers=headers)
+                else:
+                    resp = app.make_response(f(*args, **kwargs))
+                    if resp.status_code != 200:
+                        return resp
+                    response_cache.put(key, (resp.get_data(), [(h, resp.headers[h]) for h in _CACHED_HEADERS
+                                                               if h in resp.headers]))
+            resp.set_etag(held or etag)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return wrapper
+    return deco
+
+# ── COMPRESSION ───────────────────────────────────────────────────────────────
+# JSON bodies of COMPRESS_MIN_BYTES or more are gzipped for clients that accept
+# it. The compressed body is a different representation, so it carries its
+# own ETag ("<etag>-gz"), and conditional requests may name either one. A body
+# with an ETag is compressed once and kept in an LRU under that tag.
+COMPRESS_LEVEL     = int(os.environ.get('COMPRESS_LEVEL', 6))          # gzip level for JSON: 1 fastest .. 9 smallest
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))   # smaller bodies are sent as they are
+ETAG_SUFFIXES      = {'gzip': '-gz', 'br': '-br'}
+
+def accepts_encoding(name):
+    return request.accept_encodings[name] > 0   # quality from Accept-Encoding; 0 when absent or refused
+
+def matching_etag(etag):
+    """The tag in If-None-Match naming `etag` or one of its encoded variants, or None.
+
+    Variants the client accepts are tried first, so a 304 can carry the
+    validator of the representation the client holds."""
+    inm = request.if_none_match
+    if not inm:
+        return None
+    accepted = [etag + s for name, s in ETAG_SUFFIXES.items() if accepts_encoding(name)]
+    return next((t for t in accepted + [etag] + [etag + s for s in ETAG_SUFFIXES.values()] if inm.contains(t)), None)
+
+gzip_cache = ResponseCache()
+os.register_at_fork(after_in_child=gzip_cache._reset)
+
+class StaticAsset:
+    """
+    A file served from memory, precompressed once (gzip, plus brotli when installed)
+    and tagged with a hash of its content. Reloaded when the file's mtime changes.
+    """
+    def __init__(self, path, mimetype):
+        self.path, self.mimetype = path, mimetype
+        self._lock    = threading.Lock()
+        self._mtime   = None
+        self._current = None   # (etag, {encoding: bytes})
+
+    def refresh(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            variants = {'identity': data, 'gzip': gzip.compress(data, 9, mtime=0)}
+            if brotli:
+                variants['br'] = brotli.compress(data, quality=11)
+            self._current = (hashlib.sha256(data).hexdigest()[:20], variants)
+            self._mtime   = mtime
+
+    def response(self):
+        self.refresh()
+        etag, variants = self._current
+        encoding = next((e for e in ('br', 'gzip') if e in variants and accepts_encoding(e)), 'identity')
+        if matching_etag(etag):
+            resp = app.response_class(status=304)
+        else:
+            resp = app.response_class(variants[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                resp.headers['Content-Encoding'] = encoding
+        resp.set_etag(etag + ETAG_SUFFIXES.get(encoding, ''))
+        resp.headers['Cache-Control'] = 'no-cache'   # revalidate every load; unchanged costs a 304
+        resp.vary.add('Accept-Encoding')
+        return resp
 
-def log_action(c, action, details):
-    c.execute('INSERT INTO activity_log (action,details) VALUES (?,?)', (action, details))
+index_asset = StaticAsset(os.path.join(os.path.dirname(__file__), 'index.html'), 'text/html')
 
 # ── AUTH ──────────────────────────────────────────────────────────────────────
 def login_required(f):
@@ -155,21 +1398,192 @@ def bot_auth_required(f):
         return f(*args, **kwargs)
     return dec
 
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')   # bearer token for Prometheus scrapes
+
+def metrics_auth_required(f):
+    """A logged-in session, or `Authorization: Bearer <METRICS_TOKEN>` when one is configured."""
+    @wraps(f)
+    def dec(*args, **kwargs):
+        auth = request.headers.get('Authorization', '')
+        if not session.get('logged_in') and not (METRICS_TOKEN and hmac.compare_digest(auth, f'Bearer {METRICS_TOKEN}')):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return dec
+
 # ── TELEGRAM HELPERS ──────────────────────────────────────────────────────────
+# Outbound messages go through a background sender so webhook handlers only pay
+# for an enqueue. Telegram allows ~30 msg/s overall, ~1 msg/s per private chat
+# and ~20 msg/min per group; the outbox enforces those limits client-side.
+TG_API_URL        = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')   # or a local stand-in
+TG_OUTBOX_SIZE    = int(os.environ.get('TG_OUTBOX_SIZE', 1000))
+TG_GLOBAL_RATE    = int(os.environ.get('TG_GLOBAL_RATE', 30))          # messages per second, all chats
+TG_PRIVATE_GAP    = float(os.environ.get('TG_PRIVATE_GAP', 1.0))       # seconds between messages to one user
+TG_GROUP_GAP      = float(os.environ.get('TG_GROUP_GAP', 3.0))         # seconds between messages to one group
+TG_MAX_ATTEMPTS   = int(os.environ.get('TG_MAX_ATTEMPTS', 5))
+
+class TelegramOutbox:
+    """
+    Bounded, rate-limited delivery queue for Bot API calls.
+    Messages to the same chat are delivered in order; a slow or throttled
+    chat never holds up the others.
+    """
+    def __init__(self, maxsize=TG_OUTBOX_SIZE):
+        self.maxsize = maxsize
+        self._reset()
+
+    def _reset(self):
+        self._cv      = threading.Condition()
+        self._thread  = None
+        self._chats   = {}           # chat_id -> deque of pending [method, payload, attempts]
+        self._ready   = []           # heap of (not_before, seq, chat_id), one entry per chat with work
+        self._next_ok = {}           # chat_id -> earliest time the next message may go out
+        self._sent_at = deque()      # send timestamps in the last second (global limit)
+        self._seq     = itertools.count()
+        self._depth   = 0
+        self._http    = None
+        self.stats    = {'enqueued': 0, 'sent': 0, 'failed': 0, 'dropped': 0,
+                         'retried': 0, 'rate_limited': 0, 'send_ms_total': 0.0}
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='tg-outbox', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, chat_id, method, payload):
+        with self._cv:
+            self._ensure_started()
+            if self._depth >= self.maxsize:
+                self.stats['dropped'] += 1
+                return False
+            pending = self._chats.get(chat_id)
+            if pending is None:
+                pending = self._chats[chat_id] = deque()
+                not_before = max(time.monotonic(), self._next_ok.get(chat_id, 0))
+                heapq.heappush(self._ready, (not_before, next(self._seq), chat_id))
+            pending.append([method, payload, 0])
+            self._depth += 1
+            self.stats['enqueued'] += 1
+            self._cv.notify()
+            return True
+
+    def flush(self, timeout=10):
+        """Block until everything queued so far has been delivered or given up on."""
+        with self._cv:
+            return self._cv.wait_for(lambda: self._depth == 0, timeout)
+
+    def snapshot(self):
+        with self._cv:
+            return dict(self.stats, depth=self._depth, chats=len(self._chats))
+
+    def _run(self):
+        while True:
+            with self._cv:
+                chat_id, item = self._next_due()
+            started = time.perf_counter()
+            try:
+                outcome, delay = self._deliver(item)
+            except Exception as e:
+                print(f'[TG] outbox error: {e}')
+                outcome, delay = 'fail', 0
+            metrics.observe('crm_telegram_send_seconds', (('method', item[0]),), time.perf_counter() - started)
+            metrics.inc('crm_telegram_sends_total', (('method', item[0]), ('outcome', outcome)))
+            with self._cv:
+                self._settle(chat_id, item, outcome, delay)
+
+    def _next_due(self):
+        # Called with the lock held; waits until a chat is due and the global budget allows a send.
+        while True:
+            now = time.monotonic()
+            while self._sent_at and now - self._sent_at[0] >= 1:
+                self._sent_at.popleft()
+            if not self._ready:
+                self._cv.wait()
+            elif self._ready[0][0] > now:
+                self._cv.wait(self._ready[0][0] - now)
+            elif len(self._sent_at) >= TG_GLOBAL_RATE:
+                self._cv.wait(1 - (now - self._sent_at[0]))
+            else:
+                _, _, chat_id = heapq.heappop(self._ready)
+                self._sent_at.append(now)
+                return chat_id, self._chats[chat_id][0]
+
+    def _settle(self, chat_id, item, outcome, delay):
+        now     = time.monotonic()
+        pending = self._chats[chat_id]
+        if outcome == 'retry' and item[2] + 1 < TG_MAX_ATTEMPTS:
+            item[2] += 1
+            self.stats['retried'] += 1
+            not_before = now + delay
+        else:
+            pending.popleft()
+            self._depth -= 1
+            self.stats['sent' if outcome == 'ok' else 'failed'] += 1
+            gap = TG_GROUP_GAP if str(chat_id).startswith('-') else TG_PRIVATE_GAP
+            self._next_ok[chat_id] = not_before = max(now + gap, now + delay)
+            if not pending:
+                del self._chats[chat_id]
+                if len(self._next_ok) > 10000:
+                    self._next_ok = {k: v for k, v in self._next_ok.items() if v > now}
+                self._cv.notify_all()
+                return
+        heapq.heappush(self._ready, (not_before, next(self._seq), chat_id))
+        self._cv.notify_all()
+
+    def _deliver(self, item):
+        """Returns ('ok'|'retry'|'fail', seconds to wait before the chat's next send)."""
+        method, payload, attempts = item
+        started = time.perf_counter()
+        try:
+            status, body = self._post(method, payload)
+        except (http.client.HTTPException, OSError) as e:
+            print(f'[TG] send error: {e}')
+            return 'retry', min(30, 0.5 * 2 ** attempts)
+        finally:
+            self.stats['send_ms_total'] += (time.perf_counter() - started) * 1000
+        if status == 200:
+            return 'ok', 0
+        if status == 429:
+            self.stats['rate_limited'] += 1
+            try:
+                retry_after = json.loads(body)['parameters']['retry_after']
+            except (ValueError, KeyError, TypeError):
+                retry_after = 2 ** attempts
+            return 'retry', float(retry_after)
+        print(f'[TG] {method} failed: HTTP {status} {body[:200]!r}')
+        if status >= 500:
+            return 'retry', min(30, 0.5 * 2 ** attempts)
+        return 'fail', 0
+
+    def _post(self, method, payload):
+        # One keep-alive HTTPS connection, reopened once if the server dropped it.
+        data = json.dumps(payload).encode()
+        for attempt in (0, 1):
+            if self._http is None:
+                self._http = (http.client.HTTPSConnection if _tg_api.scheme == 'https'
+                              else http.client.HTTPConnection)(_tg_api.netloc, timeout=10)
+            try:
+                self._http.request('POST', f'{_tg_api.path}/bot{BOT_TOKEN}/{method}', data,
+                                   {'Content-Type': 'application/json'})
+                res = self._http.getresponse()
+                return res.status, res.read()
+            except (http.client.HTTPException, OSError):
+                self._http.close()
+                self._http = None
+                if attempt:
+                    raise
+
+_tg_api   = urllib.parse.urlsplit(TG_API_URL)
+tg_outbox = TelegramOutbox()
+os.register_at_fork(after_in_child=tg_outbox._reset)  # the sender thread does not survive a fork
+
 def tg_send(chat_id, text, parse_mode='Markdown', reply_markup=None):
     if BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
         return
     payload = {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}
     if reply_markup:
         payload['reply_markup'] = json.dumps(reply_markup)
-    try:
-        data = json.dumps(payload).encode()
-        req  = urllib.request.Request(
-            f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage',
-            data=data, headers={'Content-Type': 'application/json'})
-        urllib.request.urlopen(req, timeout=5)
-    except Exception as e:
-        print(f'[TG] send error: {e}')
+    if not tg_outbox.enqueue(chat_id, 'sendMessage', payload):
+        print(f'[TG] outbox full, dropped message to {chat_id}')
 
 def tg_set_webhook(url):
     if BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
@@ -177,7 +1591,7 @@ def tg_set_webhook(url):
     try:
         payload = json.dumps({'url': url}).encode()
         req = urllib.request.Request(
-            f'https://api.telegram.org/bot{BOT_TOKEN}/setWebhook',
+            f'{TG_API_URL}/bot{BOT_TOKEN}/setWebhook',
             data=payload, headers={'Content-Type': 'application/json'})
         res = json.loads(urllib.request.urlopen(req, timeout=8).read())
         return res.get('ok', False)
@@ -190,33 +1604,626 @@ def is_allowed_user(user_id):
         return True  # open to all if not configured
     return str(user_id) in [u.strip() for u in ALLOWED_USERS.split(',')]
 
+# Conversation state lives in an LRU; reads skip the DB and writes are flushed
+# in batches. With TG_SESSION_SHARED=1 (several workers on one DB) reads
+# revalidate against the row's version and writes go straight through.
+TG_SESSION_CACHE_SIZE     = int(os.environ.get('TG_SESSION_CACHE_SIZE', 1000))
+TG_SESSION_TTL            = float(os.environ.get('TG_SESSION_TTL', 1800))          # seconds untouched before eviction
+TG_SESSION_FLUSH_INTERVAL = float(os.environ.get('TG_SESSION_FLUSH_INTERVAL', 1.0))
+TG_SESSION_SHARED         = os.environ.get('TG_SESSION_SHARED', '0') == '1'
+
+TG_SESSION_UPSERT_SQL = '''
+    INSERT INTO telegram_sessions (chat_id, state, context, last_seen) VALUES (?,?,?,datetime('now'))
+    ON CONFLICT(chat_id) DO UPDATE SET state=excluded.state, context=excluded.context,
+                                       last_seen=excluded.last_seen, version=telegram_sessions.version + 1
+'''
+
+class SessionCache:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()   # chat_id -> [state, context, version, touched]; oldest first
+        self._dirty   = set()
+        self._flusher = None
+        self.stats    = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0,
+                         'flushes': 0, 'flushed_rows': 0, 'flush_errors': 0}
+
+    def get(self, chat_id):
+        key, now, check = str(chat_id), time.monotonic(), False
+        with self._lock:
+            e = self._entries.get(key)
+            if e and (key in self._dirty or now - e[3] < TG_SESSION_TTL):
+                e[3] = now
+                self._entries.move_to_end(key)
+                check = TG_SESSION_SHARED and key not in self._dirty
+                if not check:
+                    self.stats['hits'] += 1
+                    return self._view(key, e)
+        if e and check:
+            with db() as conn:
+                row = conn.execute('SELECT version FROM telegram_sessions WHERE chat_id=?', (key,)).fetchone()
+            if (row[0] if row else None) == e[2]:
+                with self._lock:
+                    self.stats['hits'] += 1
+                return self._view(key, e)
+            with self._lock:
+                self.stats['stale'] += 1
+        with db() as conn:
+            row = conn.execute('SELECT state, context, version FROM telegram_sessions WHERE chat_id=?', (key,)).fetchone()
+        e = [row['state'], json.loads(row['context'] or '{}'), row['version']] if row else ['idle', {}, None]
+        with self._lock:
+            self.stats['misses'] += 1
+            if key in self._dirty:
+                return self._view(key, self._entries[key])   # a save landed while we were reading
+            self._put(key, e + [now])
+            return self._view(key, e)
+
+    def save(self, chat_id, state, context=None):
+        key, context = str(chat_id), dict(context or {})
+        if TG_SESSION_SHARED:
+            with db() as conn:
+                conn.execute(TG_SESSION_UPSERT_SQL, (key, state, json.dumps(context)))
+                version = conn.execute('SELECT version FROM telegram_sessions WHERE chat_id=?', (key,)).fetchone()[0]
+            with self._lock:
+                self._put(key, [state, context, version, time.monotonic()])
+            return
+        with self._lock:
+            e = self._entries.get(key)
+            self._put(key, [state, context, e[2] if e else None, time.monotonic()])
+            self._dirty.add(key)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='tg-sessions', daemon=True)
+                self._flusher.start()
+
+    def flush(self):
+        """Persist every dirty session in one transaction."""
+        with self._lock:
+            keys, self._dirty = self._dirty, set()
+            rows = [(k, self._entries[k][0], json.dumps(self._entries[k][1])) for k in keys if k in self._entries]
+        if not rows:
+            return 0
+        try:
+            with db() as conn:
+                conn.executemany(TG_SESSION_UPSERT_SQL, rows)
+        except sqlite3.Error as e:
+            print(f'[TG] session flush error: {e}')
+            with self._lock:
+                self._dirty |= keys
+                self.stats['flush_errors'] += 1
+            return 0
+        with self._lock:
+            self.stats['flushes']      += 1
+            self.stats['flushed_rows'] += len(rows)
+        return len(rows)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses'] + self.stats['stale']
+            return dict(self.stats, size=len(self._entries), dirty=len(self._dirty), shared=TG_SESSION_SHARED,
+                        hit_rate=round(self.stats['hits'] / lookups, 4) if lookups else None)
+
+    def _view(self, key, e):
+        # Handlers mutate the context they get back; never hand out the cached dict
+        return {'chat_id': key, 'state': e[0], 'context': dict(e[1])}
+
+    def _put(self, key, e):
+        self._entries[key] = e
+        self._entries.move_to_end(key)
+        if len(self._entries) > TG_SESSION_CACHE_SIZE:
+            self._evict()
+
+    def _evict(self, cutoff=None):
+        # Least recently used first: trim to capacity, then anything untouched since cutoff.
+        # Dirty entries stay until flushed.
+        excess, victims = len(self._entries) - TG_SESSION_CACHE_SIZE, []
+        for k, e in self._entries.items():
+            if len(victims) >= excess and (cutoff is None or e[3] >= cutoff):
+                break
+            if k not in self._dirty:
+                victims.append(k)
+        for k in victims:
+            del self._entries[k]
+        self.stats['evictions'] += len(victims)
+
+    def _run(self):
+        while True:
+            time.sleep(TG_SESSION_FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+            with self._lock:
+                self._evict(time.monotonic() - TG_SESSION_TTL)
+
+tg_sessions = SessionCache()
+os.register_at_fork(after_in_child=tg_sessions._reset)
+
 def get_tg_session(chat_id):
-    conn = get_db()
-    row = conn.execute('SELECT * FROM telegram_sessions WHERE chat_id=?', (str(chat_id),)).fetchone()
-    conn.close()
-    if row:
-        s = dict(row)
-        s['context'] = json.loads(s['context'] or '{}')
-        return s
-    return {'chat_id': str(chat_id), 'state': 'idle', 'context': {}}
+    return tg_sessions.get(chat_id)
 
 def save_tg_session(chat_id, state, context=None):
-    conn = get_db()
-    conn.execute('''
-        INSERT INTO telegram_sessions (chat_id, state, context, last_seen)
-        VALUES (?,?,?,datetime('now'))
-        ON CONFLICT(chat_id) DO UPDATE SET state=excluded.state, context=excluded.context, last_seen=excluded.last_seen
-    ''', (str(chat_id), state, json.dumps(context or {})))
-    conn.commit()
-    conn.close()
+    tg_sessions.save(chat_id, state, context)
+
+# ── GROUP KNOWLEDGE INGEST ────────────────────────────────────────────────────
+# Group chatter is buffered in memory and written in one transaction per flush
+# instead of one fsync per message. Edits upsert on (chat_id, message_id).
+GK_INGEST_MODE     = os.environ.get('GK_INGEST_MODE', 'buffered')      # buffered | direct
+GK_FLUSH_ROWS      = int(os.environ.get('GK_FLUSH_ROWS', 200))
+GK_FLUSH_INTERVAL  = float(os.environ.get('GK_FLUSH_INTERVAL', 2.0))   # seconds
+
+GK_UPSERT_SQL = '''
+    INSERT INTO group_knowledge (chat_id,chat_title,speaker,message,message_id) VALUES (?,?,?,?,?)
+    ON CONFLICT(chat_id,message_id) DO UPDATE SET message=excluded.message, chat_title=excluded.chat_title,
+        synced_to_kb = CASE WHEN message IS excluded.message THEN synced_to_kb ELSE 0 END   -- edits sync again
+'''
+
+class GroupIngestBuffer:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock       = threading.Lock()
+        self._flush_lock = threading.Lock()   # serialises flushes so batches land in order
+        self._rows       = []
+        self._flusher    = None
+        self.stats       = {'buffered': 0, 'flushed_rows': 0, 'flushes': 0, 'flush_errors': 0,
+                            'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0}
+
+    def add(self, chat_id, chat_title, speaker, message, message_id=None):
+        row = (chat_id, chat_title, speaker, message, message_id)
+        if GK_INGEST_MODE != 'buffered':
+            with db() as conn:
+                conn.execute(GK_UPSERT_SQL, row)
+            return
+        with self._lock:
+            self._rows.append(row)
+            self.stats['buffered'] += 1
+            full = len(self._rows) >= GK_FLUSH_ROWS
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='gk-flush', daemon=True)
+                self._flusher.start()
+        if full:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, depth=len(self._rows), mode=GK_INGEST_MODE)
+
+    def flush(self):
+        """Write everything buffered so far in a single transaction. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            try:
+                with db() as conn:
+                    conn.executemany(GK_UPSERT_SQL, rows)
+            except sqlite3.Error as e:
+                print(f'[GK] flush error: {e}')
+                with self._lock:
+                    self._rows[:0] = rows  # keep them for the next attempt
+                    self.stats['flush_errors'] += 1
+                return 0
+            ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.stats['flushes']        += 1
+                self.stats['flushed_rows']   += len(rows)
+                self.stats['last_flush_ms']   = ms
+                self.stats['total_flush_ms'] += ms
+                self.stats['max_flush_ms']    = max(self.stats['max_flush_ms'], ms)
+            return len(rows)
+
+    def _run(self):
+        while True:
+            time.sleep(GK_FLUSH_INTERVAL)
+            if self._rows:
+                self.flush()
+
+group_ingest = GroupIngestBuffer()
+os.register_at_fork(after_in_child=group_ingest._reset)
+
+# ── GROUP → KB SYNC ───────────────────────────────────────────────────────────
+# A batch reads a chat's next GK_SYNC_BATCH unsynced rows through the partial
+# idx_gk_pending, writes one KB entry, marks exactly those rows and advances the
+# chat's watermark in group_sync_state in one transaction, so a crash resumes
+# where it stopped. An edited message is unsynced again and goes out in a later
+# entry, even when it sits below the watermark.
+GK_SYNC_BATCH = int(os.environ.get('GK_SYNC_BATCH', 200))   # messages per KB entry / transaction
+
+_group_sync_lock = threading.Lock()
+
+def _next_group_chat(conn, after):
+    # Skip-scan over idx_gk_chat: one index seek per chat, no DISTINCT pass
+    if after is None:
+        return conn.execute('SELECT MIN(chat_id) FROM group_knowledge').fetchone()[0]
+    return conn.execute('SELECT MIN(chat_id) FROM group_knowledge WHERE chat_id > ?', (after,)).fetchone()[0]
+
+def _sync_group_batch(chat_id, part):
+    """Move one batch of a chat into the KB; returns the number of messages consumed."""
+    with db() as conn:
+        conn.execute('BEGIN IMMEDIATE')  # watermark read and advance must not interleave with another syncer
+        row = conn.execute('SELECT last_id FROM group_sync_state WHERE chat_id=?', (chat_id,)).fetchone()
+        last_id = row[0] if row else 0
+        rows = conn.execute('''
+            SELECT id, chat_title, speaker, message FROM group_knowledge
+            WHERE chat_id=? AND synced_to_kb=0 ORDER BY id LIMIT ?
+        ''', (chat_id, GK_SYNC_BATCH)).fetchall()
+        if not rows:
+            return 0
+        hi    = rows[-1]['id']
+        title = f"Group: {rows[-1]['chat_title'] or chat_id} — {datetime.now().strftime('%Y-%m-%d')}"
+        if part > 1:
+            title += f' (part {part})'
+        conn.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
+                     (title, '\n'.join(f"[{r['speaker']}]: {r['message']}" for r in rows), 'Team Conversations'))
+        conn.execute('UPDATE group_knowledge SET synced_to_kb=1 WHERE chat_id=? AND synced_to_kb=0 AND id <= ?',
+                     (chat_id, hi))
+        conn.execute('''
+            INSERT INTO group_sync_state (chat_id,last_id,updated_at) VALUES (?,?,datetime('now'))
+            ON CONFLICT(chat_id) DO UPDATE SET last_id=excluded.last_id, updated_at=excluded.updated_at
+        ''', (chat_id, max(last_id, hi)))
+        return len(rows)
+
+def group_sync_backlog(conn):
+    """Group messages not yet in the KB, new or edited since: counted from the partial idx_gk_pending."""
+    return conn.execute('SELECT COUNT(*) FROM group_knowledge WHERE synced_to_kb=0').fetchone()[0]
+
+def sync_group_knowledge():
+    """Incrementally copy unsynced group messages into the KB. Returns {'synced','entries','chats'}."""
+    group_ingest.flush()
+    result = {'synced': 0, 'entries': 0, 'chats': 0}
+    with _group_sync_lock:
+        chat_id = None
+        while True:
+            with db() as conn:
+                chat_id = _next_group_chat(conn, chat_id)
+            if chat_id is None:
+                break
+            part = 0
+            while True:
+                n = _sync_group_batch(chat_id, part + 1)
+                if not n:
+                    break
+                part += 1
+                result['synced']  += n
+                result['entries'] += 1
+            result['chats'] += bool(part)
+    return result
+
+# ── REMINDER SCHEDULER ────────────────────────────────────────────────────────
+# Upcoming reminders sit in a min-heap loaded from the pending remind_at index,
+# a window at a time. The thread sleeps until the earliest one is due. Deletes
+# are lazy: a reminder only fires if its row still matches the heap entry.
+# Times are naive local ISO strings, so string order is chronological order.
+REMINDERS_ENABLED = os.environ.get('REMINDERS_ENABLED', '1') == '1'
+REMINDER_CHAT_ID  = os.environ.get('REMINDER_CHAT_ID', '')                # fallback for API-created reminders
+REMINDER_WINDOW   = int(os.environ.get('REMINDER_WINDOW', 500))           # reminders held in memory
+REMINDER_RESYNC   = float(os.environ.get('REMINDER_RESYNC', 300))         # seconds between window reloads
+REMINDER_LATE     = 60                                                    # seconds before a delivery counts as missed
+REMINDER_REPEATS  = ('none', 'daily', 'weekly', 'monthly')
+REMINDER_FMT      = '%Y-%m-%dT%H:%M:%S'
+
+def parse_remind_at(value):
+    """Normalise an ISO datetime (naive = server local time) to REMINDER_FMT; None stays None."""
+    if value in (None, ''):
+        return None
+    dt = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    if dt.tzinfo:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.strftime(REMINDER_FMT)
+
+def _reminder_schedule(d):
+    """Validated (remind_at, repeat_type) from a request body; raises ValueError."""
+    repeat = d.get('repeat_type') or 'none'
+    if repeat not in REMINDER_REPEATS:
+        raise ValueError(f"repeat_type must be one of {', '.join(REMINDER_REPEATS)}")
+    try:
+        return parse_remind_at(d.get('remind_at')), repeat
+    except ValueError:
+        raise ValueError('remind_at must be an ISO datetime, e.g. 2024-03-15T09:00:00')
+
+def _add_month(dt):
+    y, m = divmod(dt.month, 12)
+    year, month = dt.year + y, m + 1
+    last = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return dt.replace(year=year, month=month, day=min(dt.day, last))
+
+def next_occurrence(at, repeat_type, now):
+    """First occurrence after `now` for a recurring reminder; None when it doesn't repeat."""
+    if repeat_type not in ('daily', 'weekly', 'monthly'):
+        return None
+    while at <= now:
+        if repeat_type == 'monthly':
+            at = _add_month(at)
+        else:
+            at += timedelta(days=1 if repeat_type == 'daily' else 7)
+    return at
+
+class ReminderScheduler:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._cv      = threading.Condition()
+        self._thread  = None
+        self._heap    = []            # (remind_at, id)
+        self._horizon = None          # latest remind_at covered by the heap; None = everything pending
+        self._loaded  = None          # monotonic time of the last window load
+        self.stats    = {'fired': 0, 'missed': 0, 'undeliverable': 0, 'unreadable': 0, 'loads': 0}
+
+    def start(self):
+        with self._cv:
+            if self._thread is None and REMINDERS_ENABLED:
+                self._thread = threading.Thread(target=self._run, name='reminders', daemon=True)
+                self._thread.start()
+
+    def notify(self, rid, remind_at):
+        """Tell the scheduler about a reminder committed with this remind_at."""
+        if not remind_at:
+            return
+        with self._cv:
+            if self._horizon is None or remind_at <= self._horizon:
+                heapq.heappush(self._heap, (remind_at, rid))
+                self._cv.notify()
+
+    def snapshot(self):
+        with self._cv:
+            return dict(self.stats, queued=len(self._heap), next_at=self._heap[0][0] if self._heap else None,
+                        running=self._thread is not None)
+
+    def _load(self):
+        with db() as conn:
+            rows = conn.execute('''
+                SELECT remind_at, id FROM reminders
+                WHERE fired_at IS NULL AND remind_at IS NOT NULL ORDER BY remind_at LIMIT ?
+            ''', (REMINDER_WINDOW,)).fetchall()
+        self._heap    = [tuple(r) for r in rows if _reminder_time(r[0])]   # already sorted, so already a heap
+        self._horizon = rows[-1][0] if len(rows) == REMINDER_WINDOW else None
+        if len(self._heap) < len(rows):
+            self._retire([tuple(r) for r in rows if not _reminder_time(r[0])])
+        self._loaded  = time.monotonic()
+        self.stats['loads'] += 1
+
+    def _run(self):
+        while True:
+            with self._cv:
+                if (self._loaded is None or time.monotonic() - self._loaded >= REMINDER_RESYNC
+                        or (not self._heap and self._horizon is not None)):
+                    try:
+                        self._load()
+                    except sqlite3.Error as e:
+                        print(f'[REMIND] load error: {e}')
+                        self._loaded = time.monotonic()
+                now, due = datetime.now(), []
+                key = now.strftime(REMINDER_FMT)
+                while self._heap and self._heap[0][0] <= key:
+                    due.append(heapq.heappop(self._heap))
+                if not due:
+                    wait = REMINDER_RESYNC - (time.monotonic() - self._loaded)
+                    if self._heap:
+                        at = _reminder_time(self._heap[0][0])
+                        if at is None:
+                            self._retire([heapq.heappop(self._heap)])
+                            continue
+                        wait = min(wait, (at - now).total_seconds())
+                    self._cv.wait(max(wait, 0.05))
+                    continue
+            for remind_at, rid in due:
+                try:
+                    self._fire(rid, remind_at, now)
+                except Exception as e:
+                    print(f'[REMIND] fire error for {rid}: {e}')
+
+    def _retire(self, entries):
+        # A time that doesn't parse would stop the loop each time it reached the top of the heap
+        self.stats['unreadable'] += len(entries)
+        for remind_at, rid in entries:
+            print(f'[REMIND] reminder {rid} has an unreadable time {remind_at!r}; not scheduling it')
+        try:
+            with db() as conn:
+                conn.executemany('UPDATE reminders SET fired_at=? WHERE id=? AND remind_at=? AND fired_at IS NULL',
+                                 [(datetime.now().strftime(REMINDER_FMT), rid, at) for at, rid in entries])
+        except sqlite3.Error as e:
+            print(f'[REMIND] retire error: {e}')
+
+    def _fire(self, rid, remind_at, now):
+        with db() as conn:
+            r = conn.execute('SELECT * FROM reminders WHERE id=? AND remind_at=? AND fired_at IS NULL',
+                             (rid, remind_at)).fetchone()
+            if not r:
+                return  # deleted, rescheduled or already fired by another process
+            nxt = next_occurrence(datetime.strptime(remind_at, REMINDER_FMT), r['repeat_type'], now)
+            if nxt:
+                cur = conn.execute('UPDATE reminders SET remind_at=? WHERE id=? AND remind_at=? AND fired_at IS NULL',
+                                   (nxt.strftime(REMINDER_FMT), rid, remind_at))
+            else:
+                cur = conn.execute('UPDATE reminders SET fired_at=? WHERE id=? AND remind_at=? AND fired_at IS NULL',
+                                   (now.strftime(REMINDER_FMT), rid, remind_at))
+            if not cur.rowcount:
+                return
+        if nxt:
+            self.notify(rid, nxt.strftime(REMINDER_FMT))
+        late = (now - datetime.strptime(remind_at, REMINDER_FMT)).total_seconds() > REMINDER_LATE
+        with self._cv:
+            self.stats['fired'] += 1
+            self.stats['missed'] += late
+        chat_id = r['chat_id'] or REMINDER_CHAT_ID
+        if not chat_id:
+            with self._cv:
+                self.stats['undeliverable'] += 1
+            return
+        text = f"⏰ *Reminder*\n{r['title']}"
+        if r['description'] and not r['description'].startswith('From Telegram:'):
+            text += f"\n_{r['description']}_"
+        if late:
+            text += f"\n(missed — was due {remind_at.replace('T', ' ')[:16]})"
+        if nxt:
+            text += f"\n🔁 Next: {nxt.strftime('%a %d %b %H:%M')}"
+        tg_send(chat_id, text)
+
+def _reminder_time(remind_at):
+    try:
+        return datetime.strptime(remind_at, REMINDER_FMT)
+    except (TypeError, ValueError):
+        return None
+
+reminder_scheduler = ReminderScheduler()
+os.register_at_fork(after_in_child=reminder_scheduler._reset)
+
+# Free-text times for Telegram: "call John at 3pm", "standup tomorrow at 9:30 every day", "in 20 min"
+_RM_EVERY = re.compile(r'\b(?:every\s+(day|week|month)|(daily|weekly|monthly))\b', re.I)
+_RM_IN    = re.compile(r'\bin\s+(\d+)\s*(m|mins?|minutes?|h|hrs?|hours?|d|days?)\b', re.I)
+_RM_ON    = re.compile(r'\bon\s+(\d{4}-\d{2}-\d{2})\b', re.I)
+_RM_DAY   = re.compile(r'\b(today|tomorrow|tonight)\b', re.I)
+_RM_AT    = re.compile(r'\bat\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b', re.I)
+
+def parse_reminder_text(text, now=None):
+    """Split "remind me X at 3pm" style text into (title, remind_at datetime | None, repeat_type)."""
+    now    = now or datetime.now()
+    text   = re.sub(r'^\s*(?:/remind\s+|remind\s+me\s+)?(?:to\s+)?', '', text, flags=re.I)
+    repeat = 'none'
+    m = _RM_EVERY.search(text)
+    if m:
+        unit   = (m.group(1) or m.group(2)).lower()
+        repeat = {'day': 'daily', 'week': 'weekly', 'month': 'monthly'}.get(unit, unit)
+        text   = text[:m.start()] + text[m.end():]
+    at = None
+    m = _RM_IN.search(text)
+    if m:
+        unit = {'m': 'minutes', 'h': 'hours', 'd': 'days'}[m.group(2).lower()[0]]
+        at   = now + timedelta(**{unit: int(m.group(1))})
+        text = text[:m.start()] + text[m.end():]
+    else:
+        day, explicit = now, False
+        m = _RM_ON.search(text)
+        if m:
+            day, explicit = datetime.strptime(m.group(1), '%Y-%m-%d'), True
+            text = text[:m.start()] + text[m.end():]
+        m = _RM_DAY.search(text)
+        if m:
+            explicit = True
+            if m.group(1).lower() == 'tomorrow':
+                day = now + timedelta(days=1)
+            text = text[:m.start()] + text[m.end():]
+        m = _RM_AT.search(text)
+        hour = minute = None
+        if m:
+            hour, minute, ampm = int(m.group(1)), int(m.group(2) or 0), (m.group(3) or '').lower()
+            if ampm == 'pm' and hour < 12:
+                hour += 12
+            elif ampm == 'am' and hour == 12:
+                hour = 0
+            if hour > 23 or minute > 59:
+                hour = None
+            else:
+                text = text[:m.start()] + text[m.end():]
+        if hour is None and explicit:
+            hour, minute = 9, 0
+        if hour is not None:
+            at = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if at <= now and not explicit:
+                at += timedelta(days=1)
+    title = re.sub(r'\s{2,}', ' ', text).strip(' ,.-') or 'Reminder'
+    return title, at, repeat
 
 # ── TELEGRAM COMMAND ROUTER ───────────────────────────────────────────────────
+# Handlers register the /commands, whole-message phrases and leading phrases
+# they answer to. Routing is a dict lookup for the first two and one
+# precompiled alternation for the third; anything else goes to the
+# natural-language fallback. Every dispatch is timed per handler.
+BOT_HANDLERS = {}   # name -> fn(chat_id, rest, username)
+BOT_COMMANDS = {}   # '/cmd' -> name
+BOT_PHRASES  = {}   # whole message, lower-cased -> name
+BOT_PREFIXES = {}   # leading phrase, lower-cased -> name
+BOT_TIMING_SAMPLES = 1024   # recent durations kept per handler for percentiles
+_bot_prefix_re = None
+
+def bot_handler(name, commands=(), phrases=(), prefixes=()):
+    def deco(f):
+        global _bot_prefix_re
+        BOT_HANDLERS[name] = f
+        BOT_COMMANDS.update(dict.fromkeys(commands, name))
+        BOT_PHRASES.update(dict.fromkeys(phrases, name))
+        BOT_PREFIXES.update(dict.fromkeys(prefixes, name))
+        alts = sorted(BOT_PREFIXES, key=len, reverse=True)   # longest first wins
+        _bot_prefix_re = re.compile('|'.join(map(re.escape, alts)), re.I) if alts else None
+        return f
+    return deco
+
+def route_message(text):
+    """(handler name, text after the trigger) for a message; 'natural' when nothing matches."""
+    if text.startswith('/'):
+        head, _, rest = text.partition(' ')
+        name = BOT_COMMANDS.get(head.lower().split('@')[0])
+        if name:
+            return name, rest.strip()
+    name = BOT_PHRASES.get(text.lower())
+    if name:
+        return name, ''
+    m = _bot_prefix_re and _bot_prefix_re.match(text)
+    if m:
+        return BOT_PREFIXES[m.group(0).lower()], text[m.end():].strip()
+    return 'natural', text
+
+class BotTimings:
+    """Per-handler call counts, errors and wall/CPU time; wall minus CPU is mostly DB and network wait."""
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock  = threading.Lock()
+        self._stats = {}   # name -> [count, errors, wall_s, cpu_s, deque of recent wall_s]
+
+    def run(self, name, fn, *args):
+        t0, c0, ok = time.perf_counter(), time.thread_time(), False
+        try:
+            result = fn(*args)
+            ok = True
+            return result
+        finally:
+            wall, cpu = time.perf_counter() - t0, time.thread_time() - c0
+            with self._lock:
+                s = self._stats.get(name)
+                if s is None:
+                    s = self._stats[name] = [0, 0, 0.0, 0.0, deque(maxlen=BOT_TIMING_SAMPLES)]
+                s[0] += 1
+                s[1] += not ok
+                s[2] += wall
+                s[3] += cpu
+                s[4].append(wall)
+
+    def snapshot(self):
+        with self._lock:
+            stats = {name: (s[:4], sorted(s[4])) for name, s in self._stats.items()}
+        out = {}
+        for name, ((count, errors, wall, cpu), recent) in stats.items():
+            pct = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2)
+            out[name] = {'count': count, 'errors': errors, 'total_ms': round(wall * 1000, 1),
+                         'cpu_ms': round(cpu * 1000, 1), 'p50_ms': pct(0.50), 'p99_ms': pct(0.99)}
+        return dict(sorted(out.items(), key=lambda kv: -kv[1]['total_ms']))
+
+bot_timings = BotTimings()
+os.register_at_fork(after_in_child=bot_timings._reset)
+
+def group_chatter_row(update):
+    """The group_knowledge row for plain group chatter; None for anything a handler must see."""
+    msg = update.get('message') or update.get('edited_message')
+    if not msg or msg['chat']['type'] not in ('group', 'supergroup'):
+        return None
+    text = msg.get('text', '').strip()
+    if not text or text.startswith('/'):
+        return None
+    return (str(msg['chat']['id']), msg['chat'].get('title', 'Group'), msg.get('from', {}).get('username', 'unknown'),
+            text, msg.get('message_id'))
+
 def handle_telegram_update(update):
     msg  = update.get('message') or update.get('edited_message')
     cb   = update.get('callback_query')
 
     if cb:
-        handle_callback(cb)
+        bot_timings.run(f"callback:{cb.get('data', '').split(':')[0]}", handle_callback, cb)
         return
 
     if not msg:
@@ -230,16 +2237,11 @@ def handle_telegram_update(update):
 
     # ── Group / supergroup: absorb messages as knowledge ──────────────────────
     if chat_type in ('group', 'supergroup'):
-        chat_title = msg['chat'].get('title', 'Group')
-        if text and not text.startswith('/'):
-            conn = get_db()
-            conn.execute(
-                'INSERT INTO group_knowledge (chat_id,chat_title,speaker,message) VALUES (?,?,?,?)',
-                (str(chat_id), chat_title, username, text))
-            conn.commit()
-            conn.close()
-        # Only respond to /commands in groups
-        if not text.startswith('/'):
+        row = group_chatter_row(update)
+        if row:
+            group_ingest.add(*row)
+        # Only respond to /commands in groups, and never re-run an edited one
+        if not text.startswith('/') or 'edited_message' in update:
             return
 
     # ── Private: check allow-list ─────────────────────────────────────────────
@@ -251,78 +2253,84 @@ def handle_telegram_update(update):
 
     # ── Multi-step state machine ──────────────────────────────────────────────
     if sess['state'] != 'idle' and not text.startswith('/'):
-        handle_state(chat_id, text, sess)
+        bot_timings.run(f"state:{sess['state']}", handle_state, chat_id, text, sess)
         return
 
-    # ── Commands ──────────────────────────────────────────────────────────────
-    cmd = text.split()[0].lower().split('@')[0] if text.startswith('/') else ''
-    rest = text[len(cmd):].strip() if cmd else text
-
-    if cmd == '/start' or cmd == '/help':
-        tg_send(chat_id, HELP_TEXT, reply_markup=main_keyboard())
-
-    elif cmd == '/tasks' or text.lower() in ('tasks', 'show tasks', 'list tasks'):
-        send_task_summary(chat_id)
-
-    elif cmd == '/todo':
-        send_tasks_by_status(chat_id, 'todo')
-
-    elif cmd == '/inprogress':
-        send_tasks_by_status(chat_id, 'in_progress')
-
-    elif cmd == '/done':
-        send_tasks_by_status(chat_id, 'done')
-
-    elif cmd == '/newtask' or text.lower().startswith('create task') or text.lower().startswith('add task'):
-        title = rest or text.replace('create task','').replace('add task','').strip()
-        if title and len(title) > 2:
-            quick_create_task(chat_id, title, username)
-        else:
-            tg_send(chat_id, '📝 *New Task*\n\nWhat\'s the task title?')
-            save_tg_session(chat_id, 'await_task_title')
-
-    elif cmd == '/note' or text.lower().startswith('add note') or text.lower().startswith('note:'):
-        content = rest or re.sub(r'^(add note|note:)', '', text, flags=re.I).strip()
-        if content and len(content) > 2:
-            quick_create_note(chat_id, content, username)
-        else:
-            tg_send(chat_id, '📓 *New Note*\n\nWhat\'s the note? (first line = title)')
-            save_tg_session(chat_id, 'await_note')
+    name, rest = route_message(text)
+    bot_timings.run(name, BOT_HANDLERS[name], chat_id, rest, username)
 
-    elif cmd == '/kb' or text.lower().startswith('search kb') or text.lower().startswith('kb:'):
-        query = rest or re.sub(r'^(search kb|kb:)', '', text, flags=re.I).strip()
-        search_kb(chat_id, query)
+@bot_handler('help', commands=('/start', '/help'))
+def tg_cmd_help(chat_id, rest, username):
+    tg_send(chat_id, HELP_TEXT, reply_markup=main_keyboard())
 
-    elif cmd == '/addkb':
-        tg_send(chat_id, '📚 *Add to Knowledge Base*\n\nSend in format:\n`Title | Content | Category`')
-        save_tg_session(chat_id, 'await_kb_entry')
+@bot_handler('tasks', commands=('/tasks',), phrases=('tasks', 'show tasks', 'list tasks'))
+def tg_cmd_tasks(chat_id, rest, username):
+    send_task_summary(chat_id)
 
-    elif cmd == '/stats' or text.lower() in ('stats', 'status', 'dashboard'):
-        send_stats(chat_id)
+@bot_handler('todo', commands=('/todo',))
+def tg_cmd_todo(chat_id, rest, username):
+    send_tasks_by_status(chat_id, 'todo')
 
-    elif cmd == '/team' or text.lower() in ('team', 'show team'):
-        send_team(chat_id)
+@bot_handler('inprogress', commands=('/inprogress',))
+def tg_cmd_inprogress(chat_id, rest, username):
+    send_tasks_by_status(chat_id, 'in_progress')
 
-    elif cmd == '/overdue' or text.lower() in ('overdue', 'overdue tasks'):
-        send_overdue(chat_id)
+@bot_handler('done', commands=('/done',))
+def tg_cmd_done(chat_id, rest, username):
+    send_tasks_by_status(chat_id, 'done')
 
-    elif cmd == '/remind' or text.lower().startswith('remind me'):
-        content = rest or re.sub(r'^remind me', '', text, flags=re.I).strip()
-        if content:
-            quick_create_reminder(chat_id, content, username)
-        else:
-            tg_send(chat_id, '⏰ *New Reminder*\n\nSend: `remind me [what] at [time]`\nExample: `remind me call John at 3pm`')
+@bot_handler('newtask', commands=('/newtask',), prefixes=('create task', 'add task'))
+def tg_cmd_newtask(chat_id, rest, username):
+    if len(rest) > 2:
+        quick_create_task(chat_id, rest, username)
+    else:
+        tg_send(chat_id, '📝 *New Task*\n\nWhat\'s the task title?')
+        save_tg_session(chat_id, 'await_task_title')
 
-    elif cmd == '/syncgroups':
-        sync_group_knowledge_to_kb(chat_id)
+@bot_handler('note', commands=('/note',), prefixes=('add note', 'note:'))
+def tg_cmd_note(chat_id, rest, username):
+    if len(rest) > 2:
+        quick_create_note(chat_id, rest, username)
+    else:
+        tg_send(chat_id, '📓 *New Note*\n\nWhat\'s the note? (first line = title)')
+        save_tg_session(chat_id, 'await_note')
+
+@bot_handler('kb', commands=('/kb',), prefixes=('search kb', 'kb:'))
+def tg_cmd_kb(chat_id, rest, username):
+    search_kb(chat_id, rest)
+
+@bot_handler('addkb', commands=('/addkb',))
+def tg_cmd_addkb(chat_id, rest, username):
+    tg_send(chat_id, '📚 *Add to Knowledge Base*\n\nSend in format:\n`Title | Content | Category`')
+    save_tg_session(chat_id, 'await_kb_entry')
+
+@bot_handler('stats', commands=('/stats',), phrases=('stats', 'status', 'dashboard'))
+def tg_cmd_stats(chat_id, rest, username):
+    send_stats(chat_id)
+
+@bot_handler('team', commands=('/team',), phrases=('team', 'show team'))
+def tg_cmd_team(chat_id, rest, username):
+    send_team(chat_id)
+
+@bot_handler('overdue', commands=('/overdue',), phrases=('overdue', 'overdue tasks'))
+def tg_cmd_overdue(chat_id, rest, username):
+    send_overdue(chat_id)
+
+@bot_handler('remind', commands=('/remind',), prefixes=('remind me',))
+def tg_cmd_remind(chat_id, rest, username):
+    if rest:
+        quick_create_reminder(chat_id, rest, username)
+    else:
+        tg_send(chat_id, '⏰ *New Reminder*\n\nSend: `remind me [what] at [time]`\nExample: `remind me call John at 3pm`')
 
-    elif cmd == '/setwebhook':
-        ok = tg_set_webhook(f'{CRM_URL}/telegram/webhook')
-        tg_send(chat_id, f'{"✅ Webhook set!" if ok else "❌ Failed. Check BOT_TOKEN and CRM_URL."}')
+@bot_handler('syncgroups', commands=('/syncgroups',))
+def tg_cmd_syncgroups(chat_id, rest, username):
+    sync_group_knowledge_to_kb(chat_id)
 
-    else:
-        # Natural language fallback — try to understand intent
-        handle_natural_language(chat_id, text, username)
+@bot_handler('setwebhook', commands=('/setwebhook',))
+def tg_cmd_setwebhook(chat_id, rest, username):
+    ok = tg_set_webhook(f'{CRM_URL}/telegram/webhook')
+    tg_send(chat_id, f'{"✅ Webhook set!" if ok else "❌ Failed. Check BOT_TOKEN and CRM_URL."}')
 
 def handle_state(chat_id, text, sess):
     state = sess['state']
@@ -341,13 +2349,12 @@ def handle_state(chat_id, text, sess):
 
     elif state == 'await_task_due':
         ctx['due_date'] = text if re.match(r'\d{4}-\d{2}-\d{2}', text) else None
-        conn = get_db()
-        c    = conn.cursor()
-        c.execute('INSERT INTO tasks (title,priority,due_date,assigned_by) VALUES (?,?,?,?)',
-                  (ctx['title'], ctx.get('priority','medium'), ctx.get('due_date'), 'Telegram'))
-        tid = c.lastrowid
-        log_action(c, 'Task created via Telegram', ctx['title'])
-        conn.commit(); conn.close()
+        with db() as conn:
+            c = conn.cursor()
+            c.execute('INSERT INTO tasks (title,priority,due_date,assigned_by) VALUES (?,?,?,?)',
+                      (ctx['title'], ctx.get('priority','medium'), ctx.get('due_date'), 'Telegram'))
+            tid = c.lastrowid
+            log_action('Task created via Telegram', ctx['title'])
         tg_send(chat_id, f'✅ Task #{tid} created!\n*{ctx["title"]}*\nPriority: {ctx.get("priority","medium")}'
                 + (f'\nDue: {ctx["due_date"]}' if ctx.get('due_date') else ''))
         save_tg_session(chat_id, 'idle')
@@ -356,11 +2363,10 @@ def handle_state(chat_id, text, sess):
         lines   = text.split('\n')
         title   = lines[0][:120]
         content = text
-        conn = get_db()
-        c    = conn.cursor()
-        c.execute('INSERT INTO notes (title,content) VALUES (?,?)', (title, content))
-        log_action(c, 'Note created via Telegram', title)
-        conn.commit(); conn.close()
+        with db() as conn:
+            c = conn.cursor()
+            c.execute('INSERT INTO notes (title,content) VALUES (?,?)', (title, content))
+            log_action('Note created via Telegram', title)
         tg_send(chat_id, f'📓 Note saved!\n*{title}*')
         save_tg_session(chat_id, 'idle')
 
@@ -370,11 +2376,10 @@ def handle_state(chat_id, text, sess):
             title    = parts[0]
             content  = parts[1]
             category = parts[2] if len(parts) > 2 else 'General'
-            conn = get_db()
-            c    = conn.cursor()
-            c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)', (title, content, category))
-            log_action(c, 'KB entry via Telegram', title)
-            conn.commit(); conn.close()
+            with db() as conn:
+                c = conn.cursor()
+                c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)', (title, content, category))
+                log_action('KB entry via Telegram', title)
             tg_send(chat_id, f'📚 KB entry added!\n*{title}* → _{category}_')
         else:
             tg_send(chat_id, '❌ Format: `Title | Content | Category`')
@@ -390,34 +2395,38 @@ def handle_callback(cb):
 
     if data.startswith('status:'):
         _, tid, status = data.split(':')
-        conn = get_db()
-        c    = conn.cursor()
-        c.execute("UPDATE tasks SET status=?,updated_at=datetime('now') WHERE id=?", (status, int(tid)))
-        log_action(c, 'Status updated via Telegram', f'Task #{tid} → {status}')
-        conn.commit(); conn.close()
+        with db() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE tasks SET status=?,updated_at=datetime('now') WHERE id=?", (status, int(tid)))
+            log_action('Status updated via Telegram', f'Task #{tid} → {status}')
         tg_send(chat_id, f'✅ Task #{tid} → *{status}*')
 
     elif data.startswith('done:'):
         tid = data.split(':')[1]
-        conn = get_db()
-        c    = conn.cursor()
-        c.execute("UPDATE tasks SET status='done',updated_at=datetime('now') WHERE id=?", (int(tid),))
-        log_action(c, 'Task done via Telegram', f'Task #{tid}')
-        conn.commit(); conn.close()
+        with db() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE tasks SET status='done',updated_at=datetime('now') WHERE id=?", (int(tid),))
+            log_action('Task done via Telegram', f'Task #{tid}')
         tg_send(chat_id, f'✅ Task #{tid} marked *Done*!')
 
+_NL_TASK       = re.compile(r'task|todo|do', re.I)
+_NL_TASK_WORDS = re.compile(r'\b(create|add|make|new|task|todo)\b', re.I)
+_NL_NOTE       = re.compile(r'note|remember|write down', re.I)
+_NL_NOTE_WORDS = re.compile(r'\b(note|remember|write down)\b', re.I)
+_NL_REMIND     = re.compile(r'remind', re.I)
+
+@bot_handler('natural')
 def handle_natural_language(chat_id, text, username):
-    t = text.lower()
-    if any(w in t for w in ['task', 'todo', 'do']):
-        title = re.sub(r'\b(create|add|make|new|task|todo)\b', '', text, flags=re.I).strip(' :-')
+    if _NL_TASK.search(text):
+        title = _NL_TASK_WORDS.sub('', text).strip(' :-')
         if len(title) > 2:
-            quick_create_task(chat_id, title or text, username)
+            quick_create_task(chat_id, title, username)
             return
-    if any(w in t for w in ['note', 'remember', 'write down']):
-        content = re.sub(r'\b(note|remember|write down)\b', '', text, flags=re.I).strip(' :-')
+    if _NL_NOTE.search(text):
+        content = _NL_NOTE_WORDS.sub('', text).strip(' :-')
         quick_create_note(chat_id, content or text, username)
         return
-    if any(w in t for w in ['remind', 'reminder']):
+    if _NL_REMIND.search(text):
         quick_create_reminder(chat_id, text, username)
         return
     tg_send(chat_id,
@@ -428,6 +2437,291 @@ def handle_natural_language(chat_id, text, username):
         '• /help for all commands',
         reply_markup=main_keyboard())
 
+# ── TELEGRAM UPDATE QUEUE ─────────────────────────────────────────────────────
+# The webhook only records and queues an update, so Telegram gets its 200 at
+# once and has no reason to redeliver. A small thread pool does the work: one
+# chat's updates run one at a time in arrival order, different chats in
+# parallel. Every update_id is inserted into telegram_updates before it is
+# queued, so a redelivery to this worker, another worker or after a restart is
+# dropped. Ids are kept for TG_UPDATE_RETENTION hours rather than compared with
+# a high-water mark, because Telegram restarts the sequence at a random value
+# after a week without updates.
+TG_UPDATE_MODE      = os.environ.get('TG_UPDATE_MODE', 'queued')        # queued | inline
+TG_UPDATE_WORKERS   = int(os.environ.get('TG_UPDATE_WORKERS', 4))
+TG_UPDATE_QUEUE     = int(os.environ.get('TG_UPDATE_QUEUE', 1000))      # pending updates before the webhook answers 503
+TG_UPDATE_RETENTION = float(os.environ.get('TG_UPDATE_RETENTION', 48))  # hours a seen update_id is remembered
+TG_UPDATE_RECENT    = 10000                                             # ids also remembered in memory
+
+def update_chat_key(update):
+    """The chat an update belongs to ('' when it has none); one chat's updates are handled in order."""
+    msg = (update.get('message') or update.get('edited_message') or update.get('channel_post')
+           or update.get('edited_channel_post') or (update.get('callback_query') or {}).get('message') or {})
+    chat_id = (msg.get('chat') or {}).get('id')
+    return '' if chat_id is None else str(chat_id)
+
+class UpdateQueue:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._cv        = threading.Condition()
+        self._workers   = []
+        self._chats     = {}            # chat key -> deque of (update, queued_at); present while the chat has work
+        self._ready     = deque()       # chats with work that no worker holds, longest waiting first
+        self._depth     = 0             # queued or in progress
+        self._recent    = OrderedDict() # update_id -> None, newest last
+        self._pruned_at = time.monotonic()
+        self.stats      = {'received': 0, 'duplicates': 0, 'rejected': 0, 'processed': 0, 'errors': 0}
+
+    def submit(self, update):
+        """Record and process an update. Returns 'queued', 'handled' (inline mode), 'duplicate' or 'full'."""
+        uid = update['update_id']
+        with self._cv:
+            if uid in self._recent:
+                self.stats['duplicates'] += 1
+                return 'duplicate'
+            if self._depth >= TG_UPDATE_QUEUE:
+                self.stats['rejected'] += 1
+                return 'full'   # not recorded, so Telegram's redelivery will be accepted
+        if not self._record(uid):
+            with self._cv:
+                self.stats['duplicates'] += 1
+            return 'duplicate'
+        with self._cv:
+            self._recent[uid] = None
+            if len(self._recent) > TG_UPDATE_RECENT:
+                self._recent.popitem(last=False)
+        return self.enqueue(update)
+
+    def enqueue(self, update):
+        """Process an update without the redelivery check (the poller's offset already rules it out)."""
+        with self._cv:
+            self.stats['received'] += 1
+            if TG_UPDATE_MODE != 'queued':
+                self._depth += 1
+        if TG_UPDATE_MODE != 'queued':
+            self._handle(update, None)
+            with self._cv:
+                self._depth -= 1
+                self._cv.notify_all()
+            return 'handled'
+        with self._cv:
+            key = update_chat_key(update)
+            pending = self._chats.get(key)
+            if pending is None:
+                pending = self._chats[key] = deque()
+                self._ready.append(key)
+            pending.append((update, time.perf_counter()))
+            self._depth += 1
+            while len(self._workers) < TG_UPDATE_WORKERS:
+                t = threading.Thread(target=self._run, name=f'tg-updates-{len(self._workers)}', daemon=True)
+                self._workers.append(t)
+                t.start()
+            self._cv.notify_all()
+        return 'queued'
+
+    def drain(self, timeout=10):
+        """Block until every accepted update has been processed (timeout None waits for good)."""
+        with self._cv:
+            return self._cv.wait_for(lambda: self._depth == 0, timeout)
+
+    def snapshot(self):
+        with self._cv:
+            return dict(self.stats, depth=self._depth, chats=len(self._chats), workers=len(self._workers),
+                        mode=TG_UPDATE_MODE)
+
+    def _record(self, uid):
+        # The row is what other workers and later restarts see; losing the insert means it was seen
+        try:
+            with db() as conn:
+                return conn.execute('INSERT OR IGNORE INTO telegram_updates (update_id) VALUES (?)', (uid,)).rowcount == 1
+        except sqlite3.Error as e:
+            print(f'[TG] update {uid} not recorded: {e}')
+            return True   # a rare duplicate beats a lost update
+
+    def _handle(self, update, queued_at):
+        started = time.perf_counter()
+        if queued_at is not None:
+            metrics.observe('crm_telegram_update_wait_seconds', (), started - queued_at)
+        try:
+            handle_telegram_update(update)
+            outcome = 'processed'
+        except Exception as e:
+            print(f"[TG] update {update.get('update_id')} error: {e}")
+            metrics.inc('crm_telegram_update_errors_total')
+            outcome = 'errors'
+        metrics.observe('crm_telegram_update_seconds', (), time.perf_counter() - started)
+        with self._cv:
+            self.stats[outcome] += 1
+
+    def _prune(self):
+        try:
+            with db() as conn:
+                conn.execute("DELETE FROM telegram_updates WHERE received_at < datetime('now', ?)",
+                             (f'-{TG_UPDATE_RETENTION} hours',))
+        except sqlite3.Error as e:
+            print(f'[TG] update id prune error: {e}')
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._ready:
+                    self._cv.wait()
+                key = self._ready.popleft()
+                update, queued_at = self._chats[key][0]
+            self._handle(update, queued_at)
+            with self._cv:
+                pending = self._chats[key]
+                pending.popleft()
+                self._depth -= 1
+                if pending:
+                    self._ready.append(key)   # back of the line, behind chats that were waiting
+                else:
+                    del self._chats[key]
+                self._cv.notify_all()
+                prune = time.monotonic() - self._pruned_at >= 3600
+                if prune:
+                    self._pruned_at = time.monotonic()
+            if prune:
+                self._prune()
+
+tg_updates = UpdateQueue()
+os.register_at_fork(after_in_child=tg_updates._reset)
+
+# ── TELEGRAM POLLING ──────────────────────────────────────────────────────────
+# `python app.py poll` fetches updates with getUpdates instead of receiving
+# webhooks; run it as its own process (Telegram allows one or the other, and
+# one poller per bot). Each batch of up to TG_POLL_LIMIT updates is handled as
+# a unit: one transaction upserts its group chatter into group_knowledge and
+# records the other update ids in telegram_updates, the rest go through
+# tg_updates (per-chat order, in parallel), and only then is the next offset
+# stored. A batch fetched again after a crash skips the updates it recorded.
+TG_POLL_TIMEOUT = int(os.environ.get('TG_POLL_TIMEOUT', 50))   # seconds Telegram holds an empty long poll
+TG_POLL_LIMIT   = int(os.environ.get('TG_POLL_LIMIT', 100))    # updates per batch (Telegram's maximum)
+TG_POLL_UPDATES = ['message', 'edited_message', 'callback_query']
+
+class TelegramApiError(Exception):
+    def __init__(self, method, status, description):
+        super().__init__(f'{method}: HTTP {status} {description}')
+        self.status = status
+
+class TelegramPoller:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._thread = None
+        self._stop   = threading.Event()
+        self._http   = None
+        self._offset = None        # next update_id to ask for; None = whatever Telegram has unconfirmed
+        self._pending = None       # offset past the batch being handled, stored once it is done
+        self._loaded = False
+        self.stats   = {'batches': 0, 'updates': 0, 'chatter': 0, 'errors': 0, 'max_batch': 0}
+
+    def start(self):
+        """Poll from a background thread (the `poll` command runs in the foreground instead)."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='tg-poll', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        backoff, webhook = 0, True
+        while not self._stop.is_set():
+            try:
+                if webhook:
+                    self._call('deleteWebhook', {})   # getUpdates is refused while a webhook is set
+                    webhook = False
+                self.poll_once()
+                backoff = 0
+            except (TelegramApiError, http.client.HTTPException, OSError, ValueError, sqlite3.Error) as e:
+                webhook = getattr(e, 'status', None) == 409   # Conflict: a webhook was set again, or another poller
+                self.stats['errors'] += 1
+                backoff = min(30, backoff * 2 or 1)
+                print(f'[TG] poll error: {e}; retrying in {backoff}s')
+                self._stop.wait(backoff)
+
+    def poll_once(self):
+        """Fetch one batch and handle it completely. Returns the number of updates."""
+        bot_id = BOT_TOKEN.split(':')[0]
+        if not self._loaded:
+            with db() as conn:
+                # Telegram restarts update ids at random after a week without updates
+                row = conn.execute("SELECT next_offset FROM telegram_poll_state "
+                                   "WHERE bot_id=? AND updated_at > datetime('now', '-7 days')", (bot_id,)).fetchone()
+            self._offset, self._loaded = row[0] if row else None, True
+        payload = {'timeout': TG_POLL_TIMEOUT, 'limit': TG_POLL_LIMIT, 'allowed_updates': TG_POLL_UPDATES}
+        if self._offset is not None:
+            payload['offset'] = self._offset
+        updates = self._call('getUpdates', payload)
+        if not updates:
+            return 0
+        chatter, rest = [], []
+        for u in updates:
+            row = group_chatter_row(u)
+            if row:
+                chatter.append(row)
+            else:
+                rest.append(u)
+        with db() as conn:
+            if chatter:
+                conn.executemany(GK_UPSERT_SQL, chatter)
+            # Recorded with the chatter, so a refetch after a crash doesn't run commands twice
+            fresh = [u for u in rest if conn.execute('INSERT OR IGNORE INTO telegram_updates (update_id) VALUES (?)',
+                                                     (u['update_id'],)).rowcount == 1]
+        self._pending = updates[-1]['update_id'] + 1
+        for u in fresh:
+            tg_updates.enqueue(u)
+        tg_updates.drain(None)
+        self.save()
+        self.stats['batches']  += 1
+        self.stats['updates']  += len(updates)
+        self.stats['chatter']  += len(chatter)
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(updates))
+        return len(updates)
+
+    def save(self):
+        """Store the offset past the current batch. Shutdown calls it once the batch has drained."""
+        if self._pending is None:
+            return
+        offset, self._pending = self._pending, None
+        with db() as conn:
+            conn.execute("INSERT INTO telegram_poll_state (bot_id, next_offset, updated_at) VALUES (?,?,datetime('now')) "
+                         "ON CONFLICT(bot_id) DO UPDATE SET next_offset=excluded.next_offset, updated_at=excluded.updated_at",
+                         (BOT_TOKEN.split(':')[0], offset))
+        self._offset = offset
+
+    def snapshot(self):
+        return dict(self.stats, offset=self._offset, running=self._thread is not None)
+
+    def _call(self, method, payload):
+        # A keep-alive connection of its own: a long poll can hold it for TG_POLL_TIMEOUT seconds
+        data = json.dumps(payload).encode()
+        for attempt in (0, 1):
+            if self._http is None:
+                self._http = (http.client.HTTPSConnection if _tg_api.scheme == 'https'
+                              else http.client.HTTPConnection)(_tg_api.netloc, timeout=TG_POLL_TIMEOUT + 15)
+            try:
+                self._http.request('POST', f'{_tg_api.path}/bot{BOT_TOKEN}/{method}', data,
+                                   {'Content-Type': 'application/json'})
+                res  = self._http.getresponse()
+                body = json.loads(res.read() or b'{}')
+                break
+            except (http.client.HTTPException, OSError):
+                self._http.close()
+                self._http = None
+                if attempt:
+                    raise
+        if not body.get('ok'):
+            raise TelegramApiError(method, res.status, body.get('description', ''))
+        return body.get('result')
+
+tg_poller = TelegramPoller()
+os.register_at_fork(after_in_child=tg_poller._reset)
+
 # ── SEND HELPERS ──────────────────────────────────────────────────────────────
 HELP_TEXT = """🦞 *WorkBase CRM Bot*
 
@@ -464,10 +2758,8 @@ def main_keyboard():
     ], 'resize_keyboard': True}
 
 def send_task_summary(chat_id):
-    conn = get_db()
-    rows = conn.execute("SELECT status, COUNT(*) as c FROM tasks GROUP BY status").fetchall()
-    conn.close()
-    counts = {r['status']: r['c'] for r in rows}
+    with db() as conn:
+        counts = task_stats(conn)
     msg = (f"📋 *Task Summary*\n\n"
            f"📌 To Do:       {counts.get('todo', 0)}\n"
            f"🔄 In Progress: {counts.get('in_progress', 0)}\n"
@@ -476,11 +2768,10 @@ def send_task_summary(chat_id):
     tg_send(chat_id, msg)
 
 def send_tasks_by_status(chat_id, status):
-    conn  = get_db()
-    tasks = conn.execute(
-        'SELECT t.*, tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id WHERE t.status=? ORDER BY t.priority DESC LIMIT 10',
-        (status,)).fetchall()
-    conn.close()
+    with db() as conn:
+        tasks = conn.execute(
+            'SELECT t.*, tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id WHERE t.status=? ORDER BY t.priority DESC LIMIT 10',
+            (status,)).fetchall()
     if not tasks:
         tg_send(chat_id, f'No *{status}* tasks.')
         return
@@ -497,45 +2788,35 @@ def send_tasks_by_status(chat_id, status):
     tg_send(chat_id, '\n'.join(lines), reply_markup={'inline_keyboard': buttons} if buttons else None)
 
 def send_stats(chat_id):
-    conn   = get_db()
-    total  = conn.execute('SELECT COUNT(*) as c FROM tasks').fetchone()['c']
-    inprog = conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='in_progress'").fetchone()['c']
-    done   = conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='done'").fetchone()['c']
-    today  = datetime.now().strftime('%Y-%m-%d')
-    wd     = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    odue   = conn.execute("SELECT COUNT(*) as c FROM tasks WHERE due_date < ? AND status!='done'", (today,)).fetchone()['c']
-    cweek  = conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='done' AND updated_at >= ?", (wd,)).fetchone()['c']
-    notes  = conn.execute('SELECT COUNT(*) as c FROM notes').fetchone()['c']
-    kb     = conn.execute('SELECT COUNT(*) as c FROM kb_entries').fetchone()['c']
-    conn.close()
+    with db() as conn:
+        st = task_stats(conn)
     tg_send(chat_id,
         f"📊 *Dashboard*\n\n"
-        f"📋 Total Tasks:     {total}\n"
-        f"🔄 In Progress:     {inprog}\n"
-        f"✅ Done This Week:  {cweek}\n"
-        f"⚠️  Overdue:         {odue}\n"
-        f"📝 Notes:           {notes}\n"
-        f"📚 KB Entries:      {kb}")
+        f"📋 Total Tasks:     {st['total']}\n"
+        f"🔄 In Progress:     {st['in_progress']}\n"
+        f"✅ Done This Week:  {st['completed_week']}\n"
+        f"⚠️  Overdue:         {st['overdue']}\n"
+        f"📝 Notes:           {st['notes']}\n"
+        f"📚 KB Entries:      {st['kb_entries']}")
 
 def send_team(chat_id):
-    conn    = get_db()
-    members = conn.execute('SELECT * FROM team_members').fetchall()
-    conn.close()
+    with db() as conn:
+        members = team_workload(conn)
     if not members:
         tg_send(chat_id, 'No team members yet.'); return
     lines = ['👥 *Team*\n']
     for m in members:
-        tc = get_db().execute('SELECT COUNT(*) as c FROM tasks WHERE assigned_to=?', (m['id'],)).fetchone()['c']
-        lines.append(f"• *{m['name']}* [{m['role']}] — {tc} tasks")
+        open_count = m['by_status']['todo'] + m['by_status']['in_progress']
+        extra = f", ⚠️ {m['overdue']} overdue" if m['overdue'] else ''
+        lines.append(f"• *{m['name']}* [{m['role']}] — {m['task_count']} tasks ({open_count} open{extra})")
     tg_send(chat_id, '\n'.join(lines))
 
 def send_overdue(chat_id):
     today = datetime.now().strftime('%Y-%m-%d')
-    conn  = get_db()
-    tasks = conn.execute(
-        "SELECT t.*, tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id WHERE t.due_date < ? AND t.status!='done' ORDER BY t.due_date",
-        (today,)).fetchall()
-    conn.close()
+    with db() as conn:
+        tasks = conn.execute(
+            "SELECT t.*, tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id WHERE t.due_date < ? AND t.status!='done' ORDER BY t.due_date",
+            (today,)).fetchall()
     if not tasks:
         tg_send(chat_id, '🎉 No overdue tasks!'); return
     lines = [f"⚠️ *Overdue Tasks* ({len(tasks)})\n"]
@@ -545,26 +2826,22 @@ def send_overdue(chat_id):
     tg_send(chat_id, '\n'.join(lines))
 
 def search_kb(chat_id, query):
-    conn    = get_db()
-    entries = conn.execute(
-        "SELECT * FROM kb_entries WHERE title LIKE ? OR content LIKE ? OR category LIKE ? LIMIT 5",
-        (f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
-    conn.close()
+    with db() as conn:
+        entries = kb_search(conn, query, limit=5, mark=('*', '*'))
     if not entries:
         tg_send(chat_id, f'🔍 No KB results for `{query}`'); return
     lines = [f"📚 *KB: {query}*\n"]
     for e in entries:
-        preview = (e['content'] or '')[:120].replace('\n', ' ')
-        lines.append(f"*{e['title']}* [{e['category']}]\n_{preview}_\n")
+        preview = (e['snippet'] or '').replace('\n', ' ')
+        lines.append(f"*{e['title']}* [{e['category']}]\n{preview}\n")
     tg_send(chat_id, '\n'.join(lines))
 
 def quick_create_task(chat_id, title, username):
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO tasks (title, assigned_by) VALUES (?,?)', (title, f'Telegram:{username}'))
-    tid = c.lastrowid
-    log_action(c, 'Task created via Telegram', title)
-    conn.commit(); conn.close()
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO tasks (title, assigned_by) VALUES (?,?)', (title, f'Telegram:{username}'))
+        tid = c.lastrowid
+        log_action('Task created via Telegram', title)
     tg_send(chat_id, f'✅ Task #{tid} created!\n*{title}*',
             reply_markup={'inline_keyboard': [
                 [{'text': '🔄 In Progress', 'callback_data': f'status:{tid}:in_progress'},
@@ -574,91 +2851,372 @@ def quick_create_task(chat_id, title, username):
 def quick_create_note(chat_id, text, username):
     lines   = text.split('\n')
     title   = lines[0][:120]
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO notes (title, content) VALUES (?,?)', (title, text))
-    log_action(c, 'Note created via Telegram', title)
-    conn.commit(); conn.close()
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO notes (title, content) VALUES (?,?)', (title, text))
+        log_action('Note created via Telegram', title)
     tg_send(chat_id, f'📓 Note saved!\n*{title}*')
 
 def quick_create_reminder(chat_id, text, username):
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO reminders (title, description) VALUES (?,?)', (text[:200], f'From Telegram: {username}'))
-    log_action(c, 'Reminder via Telegram', text[:100])
-    conn.commit(); conn.close()
-    tg_send(chat_id, f'⏰ Reminder set!\n_{text}_')
+    title, at, repeat = parse_reminder_text(text)
+    remind_at = at.strftime(REMINDER_FMT) if at else None
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO reminders (title,description,remind_at,repeat_type,chat_id) VALUES (?,?,?,?,?)',
+                  (title[:200], f'From Telegram: {username}', remind_at, repeat, str(chat_id)))
+        rid = c.lastrowid
+        log_action('Reminder via Telegram', title[:100])
+    reminder_scheduler.notify(rid, remind_at)
+    if not at:
+        tg_send(chat_id, f'⏰ Reminder saved, but no time found.\n_{title}_\nAdd `at 3pm`, `tomorrow at 9` or `in 30 min` next time.')
+        return
+    when = at.strftime('%a %d %b %H:%M') + ('' if repeat == 'none' else f' 🔁 {repeat}')
+    tg_send(chat_id, f'⏰ Reminder set!\n_{title}_\n🕒 {when}')
 
 def sync_group_knowledge_to_kb(chat_id):
     """Summarise unsynced group messages → KB entries."""
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM group_knowledge WHERE synced_to_kb=0 ORDER BY timestamp').fetchall()
-    if not rows:
+    result = sync_group_knowledge()
+    if not result['synced']:
         tg_send(chat_id, '📚 No new group messages to sync.')
-        conn.close(); return
-
-    # Group by chat
-    by_chat = {}
-    for r in rows:
-        key = r['chat_title'] or r['chat_id']
-        by_chat.setdefault(key, []).append(f"[{r['speaker']}]: {r['message']}")
-
-    count = 0
-    for chat_title, messages in by_chat.items():
-        batch = '\n'.join(messages[:50])  # cap at 50 msgs per sync
-        title = f"Group: {chat_title} — {datetime.now().strftime('%Y-%m-%d')}"
-        conn.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
-                     (title, batch, 'Team Conversations'))
-        count += len(messages)
-
-    conn.execute('UPDATE group_knowledge SET synced_to_kb=1 WHERE synced_to_kb=0')
-    conn.commit(); conn.close()
-    tg_send(chat_id, f'✅ Synced {count} group messages → KB\nCategory: *Team Conversations*')
+        return
+    tg_send(chat_id, f"✅ Synced {result['synced']} group messages → KB\nCategory: *Team Conversations*")
 
 # ── WHATSAPP KB IMPORT ────────────────────────────────────────────────────────
-def parse_whatsapp_export(text, category='WhatsApp Import'):
-    """
-    Parses WhatsApp exported .txt chat format.
-    Lines look like:
-      [25/02/2024, 10:30:00] John: Hello there
-      or
-      25/02/2024, 10:30 - John: Hello there
-    Returns list of (title, content, category) tuples.
-    """
-    # Normalise both bracket and dash formats
-    pattern = re.compile(
-        r'[\["]?(\d{1,2}[\/\.\-]\d{1,2}[\/\.\-]\d{2,4}),?\s+(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)["\]]?\s*[-–]\s*([^:]+):\s*(.*)',
-        re.IGNORECASE)
-
-    entries   = []
-    by_date   = {}
+# Exports are streamed line by line, one day of chat in memory at a time, and
+# written in bounded executemany batches. Uploads run as background jobs.
+IMPORT_BATCH_ROWS   = int(os.environ.get('IMPORT_BATCH_ROWS', 500))          # KB entries per transaction
+IMPORT_WORKERS      = int(os.environ.get('IMPORT_WORKERS', 1))               # >1 enables multi-process parsing
+IMPORT_CHUNK_BYTES  = int(os.environ.get('IMPORT_CHUNK_BYTES', 16 * 1024 * 1024))
+
+# Normalise both bracket and dash formats
+WA_LINE = re.compile(
+    r'[\["]?(\d{1,2}[\/\.\-]\d{1,2}[\/\.\-]\d{2,4}),?\s+(\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AP]M)?)["\]]?\s*[-–]\s*([^:]+):\s*(.*)',
+    re.IGNORECASE)
+
+def _wa_date_key(date_str):
+    return date_str.replace('.','/').replace('-','/')
+
+def iter_whatsapp_days(lines):
+    """Yields (date_key, lines) for each run of messages from the same day."""
     cur_date  = None
     cur_lines = []
-
-    for line in text.splitlines():
-        m = pattern.match(line)
+    for line in lines:
+        line = line.rstrip('\r\n')
+        m = WA_LINE.match(line)
         if m:
             date_str, time_str, speaker, msg = m.groups()
-            # normalise date key
-            date_key = date_str.replace('.','/').replace('-','/')
+            date_key = _wa_date_key(date_str)
             if date_key != cur_date:
                 if cur_date and cur_lines:
-                    by_date[cur_date] = cur_lines[:]
+                    yield cur_date, cur_lines
                 cur_date  = date_key
                 cur_lines = []
             cur_lines.append(f"[{time_str}] {speaker.strip()}: {msg.strip()}")
         elif cur_lines and line.strip():
             cur_lines[-1] += f' {line.strip()}'  # continuation
-
     if cur_date and cur_lines:
-        by_date[cur_date] = cur_lines
+        yield cur_date, cur_lines
 
-    for date_key, lines in by_date.items():
-        title   = f"WhatsApp · {date_key}"
-        content = '\n'.join(lines)
-        entries.append((title, content, category))
+def iter_whatsapp_entries(lines, category='WhatsApp Import'):
+    for date_key, day in iter_whatsapp_days(lines):
+        yield (f"WhatsApp · {date_key}", '\n'.join(day), category)
 
-    return entries
+def parse_whatsapp_export(text, category='WhatsApp Import'):
+    """
+    Parses WhatsApp exported .txt chat format.
+    Lines look like:
+      [25/02/2024, 10:30:00] John: Hello there
+      or
+      25/02/2024, 10:30 - John: Hello there
+    Returns list of (title, content, category) tuples.
+    """
+    return list(iter_whatsapp_entries(text.splitlines(), category))
+
+def spool_upload(stream, path):
+    """Copies an upload to disk in 1 MB chunks, sniffing UTF-8 validity on the way. Returns (size, encoding)."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    utf8, size = True, 0
+    with open(path, 'wb') as out:
+        while True:
+            chunk = stream.read(1 << 20)
+            if not chunk:
+                break
+            out.write(chunk)
+            size += len(chunk)
+            if utf8:
+                try:
+                    decoder.decode(chunk)
+                except UnicodeDecodeError:
+                    utf8 = False
+    if utf8:
+        try:
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            utf8 = False
+    return size, 'utf-8-sig' if utf8 else 'latin-1'
+
+def _day_boundaries(path, encoding, chunk_bytes):
+    """Byte offsets that cut the file into ~chunk_bytes pieces, each starting on a new day's first message."""
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, 'rb') as f:
+        for target in range(chunk_bytes, size, chunk_bytes):
+            if target <= cuts[-1]:
+                continue
+            f.seek(target)
+            f.readline()  # skip the partial line
+            prev = None
+            while True:
+                pos  = f.tell()
+                line = f.readline()
+                if not line:
+                    pos = size
+                    break
+                m = WA_LINE.match(line.decode(encoding, 'replace'))
+                if m:
+                    key = _wa_date_key(m.group(1))
+                    if prev is not None and key != prev:
+                        break
+                    prev = key
+            if cuts[-1] < pos < size:
+                cuts.append(pos)
+    return list(zip(cuts, cuts[1:] + [size]))
+
+def _parse_byte_range(path, encoding, start, end, category):
+    # Runs in a worker process; the range always starts on a line boundary.
+    def lines():
+        with open(path, 'rb') as f:
+            f.seek(start)
+            pos = start
+            while pos < end:
+                raw = f.readline()
+                if not raw:
+                    break
+                pos += len(raw)
+                yield raw.decode(encoding, 'replace')
+    return list(iter_whatsapp_entries(lines(), category)), end
+
+def _iter_file_entries(path, encoding, category, state):
+    """
+    Yields KB entries from an export on disk, parsing day-aligned chunks in
+    parallel when enabled. state['bytes_done'] tracks how far the parse got.
+    """
+    size = os.path.getsize(path)
+    if IMPORT_WORKERS > 1 and size > IMPORT_CHUNK_BYTES:
+        ranges = iter(_day_boundaries(path, encoding, IMPORT_CHUNK_BYTES))
+        with ProcessPoolExecutor(IMPORT_WORKERS, mp_context=multiprocessing.get_context('spawn')) as pool:
+            # A fixed window in flight: parsed chunks wait for the inserts, not pile up behind them
+            pending = deque(pool.submit(_parse_byte_range, path, encoding, a, b, category)
+                            for a, b in itertools.islice(ranges, 2 * IMPORT_WORKERS))
+            while pending:
+                entries, done = pending.popleft().result()
+                for a, b in itertools.islice(ranges, 1):
+                    pending.append(pool.submit(_parse_byte_range, path, encoding, a, b, category))
+                state['bytes_done'] = done
+                yield from entries
+        return
+    with open(path, 'rb') as raw, io.TextIOWrapper(raw, encoding=encoding, errors='replace') as text:
+        for entry in iter_whatsapp_entries(text, category):
+            state['bytes_done'] = raw.tell()
+            yield entry
+
+def import_kb_entries(entries, job_id=None, state=None):
+    """Inserts entries in IMPORT_BATCH_ROWS-sized transactions, updating the job row after each. Returns the count."""
+    count, batch = 0, []
+    def flush():
+        with db() as conn:
+            conn.executemany('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)', batch)
+            if job_id:
+                conn.execute('UPDATE import_jobs SET imported=?, bytes_done=? WHERE id=?',
+                             (count, (state or {}).get('bytes_done', 0), job_id))
+        batch.clear()
+    for entry in entries:
+        batch.append(entry)
+        count += 1
+        if len(batch) >= IMPORT_BATCH_ROWS:
+            flush()
+    if batch:
+        flush()
+    return count
+
+_import_slots = threading.Semaphore(1)  # one import at a time per process
+
+def run_import_job(job_id, path, encoding, category):
+    with _import_slots:
+        with db() as conn:
+            conn.execute("UPDATE import_jobs SET status='running' WHERE id=?", (job_id,))
+        state = {'bytes_done': 0}
+        try:
+            try:
+                count = import_kb_entries(_iter_file_entries(path, encoding, category, state), job_id, state)
+            finally:
+                os.unlink(path)
+            if count:
+                log_action('WhatsApp KB import', f'Imported {count} days of chat as KB entries')
+            with db() as conn:
+                if count:
+                    conn.execute("UPDATE import_jobs SET status='done', imported=?, bytes_done=bytes_total, "
+                                 "finished_at=datetime('now') WHERE id=?", (count, job_id))
+                else:
+                    conn.execute("UPDATE import_jobs SET status='failed', error=?, finished_at=datetime('now') WHERE id=?",
+                                 (WA_NOTHING_PARSED, job_id))
+        except Exception as e:
+            print(f'[IMPORT] job {job_id} failed: {e}')
+            with db() as conn:
+                conn.execute("UPDATE import_jobs SET status='failed', error=?, finished_at=datetime('now') WHERE id=?",
+                             (str(e), job_id))
+
+WA_NOTHING_PARSED = 'No parseable messages found. Make sure this is an exported WhatsApp chat .txt file.'
+
+# ── BULK TASK OPS ─────────────────────────────────────────────────────────────
+# A batch of create/update/delete operations is validated in full, then applied
+# in input order inside one write transaction: each run of consecutive
+# operations with the same shape is a single executemany. Nothing is written
+# unless every operation is valid, and one activity row summarises the batch.
+BULK_MAX_OPS = 1000
+BULK_TASK_SOURCES = {
+    'web': {'create':   ('title', 'description', 'status', 'priority', 'assigned_to', 'assigned_by', 'due_date', 'tags'),
+            'update':   ('title', 'description', 'status', 'priority', 'assigned_to', 'due_date', 'tags'),
+            'defaults': {'description': '', 'status': 'todo', 'priority': 'medium', 'assigned_by': 'Admin', 'tags': ''},
+            'action':   'Tasks bulk edit'},
+    'bot': {'create':   ('title', 'description', 'priority', 'due_date', 'assigned_by', 'tags'),
+            'update':   ('title', 'status', 'priority', 'due_date', 'tags', 'description'),
+            'defaults': {'title': 'Untitled', 'description': '', 'priority': 'medium', 'assigned_by': 'OpenClaw', 'tags': ''},
+            'action':   'Tasks bulk edit via OpenClaw'},
+}
+
+class BadTaskOps(ValueError):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or {}   # op index -> reason
+
+def _task_value(field, value):
+    """Normalised value for a task field; raises ValueError when it can't be stored."""
+    if field == 'title':
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError('title must be a non-empty string')
+    elif field == 'status' and value not in TASK_STATUSES:
+        raise ValueError(f'status must be one of {", ".join(TASK_STATUSES)}')
+    elif field == 'priority' and value not in TASK_PRIORITIES:
+        raise ValueError(f'priority must be one of {", ".join(TASK_PRIORITIES)}')
+    elif field == 'assigned_to':
+        if value in (None, ''):
+            return None
+        if isinstance(value, bool) or not str(value).isdigit():
+            raise ValueError('assigned_to must be a team member id')
+        return int(value)
+    elif field == 'due_date':
+        if value in (None, ''):
+            return None
+        try:
+            if not re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+                raise ValueError
+            datetime.strptime(value, '%Y-%m-%d')   # the pattern alone lets 2024-13-45 through
+        except (TypeError, ValueError):
+            raise ValueError('due_date must be a YYYY-MM-DD date') from None
+    elif value is not None and not isinstance(value, str):
+        raise ValueError(f'{field} must be a string')
+    return value
+
+def _parse_task_op(op, spec):
+    if not isinstance(op, dict):
+        raise ValueError('operation must be an object')
+    kind = op.get('op')
+    if kind not in ('create', 'update', 'delete'):
+        raise ValueError('op must be create, update or delete')
+    tid = op.get('id')
+    if kind != 'create' and (isinstance(tid, bool) or not isinstance(tid, int)):
+        raise ValueError('id must be an integer')
+    allowed = spec.get(kind, ())
+    unknown = set(op) - {'op'} - ({'id'} if kind != 'create' else set()) - set(allowed)
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(sorted(unknown))}')
+    fields = {f: _task_value(f, op[f]) for f in allowed if f in op}
+    if kind == 'create':
+        fields = {f: fields[f] if f in fields else spec['defaults'].get(f) for f in allowed}
+        _task_value('title', fields['title'])
+    elif kind == 'update' and not fields:
+        raise ValueError('nothing to update')
+    return kind, tid, fields
+
+def _existing_ids(conn, table, ids):
+    ids, found = list(ids), set()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        found.update(r[0] for r in conn.execute(f"SELECT id FROM {table} WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+    return found
+
+def apply_task_ops(ops, source):
+    """
+    Validate and apply task operations atomically for `source` ('web' or 'bot').
+    Returns {'results': [...], 'created', 'updated', 'deleted'}; raises BadTaskOps with
+    per-operation errors, in which case nothing was written.
+    """
+    spec = BULK_TASK_SOURCES[source]
+    if not isinstance(ops, list) or not ops:
+        raise BadTaskOps('ops must be a non-empty list')
+    if len(ops) > BULK_MAX_OPS:
+        raise BadTaskOps(f'at most {BULK_MAX_OPS} operations per request')
+    parsed, errors = [], {}
+    for i, op in enumerate(ops):
+        try:
+            parsed.append(_parse_task_op(op, spec))
+        except ValueError as e:
+            parsed.append(None)
+            errors[i] = str(e)
+    with db() as conn:
+        conn.execute('BEGIN IMMEDIATE')   # existence checks and writes see the same state
+        valid    = [p for p in parsed if p]
+        tasks    = _existing_ids(conn, 'tasks', {tid for _, tid, _ in valid if tid is not None})
+        members  = _existing_ids(conn, 'team_members', {f['assigned_to'] for _, _, f in valid if f.get('assigned_to') is not None})
+        deleted  = set()
+        for i, p in enumerate(parsed):
+            if p is None:
+                continue
+            kind, tid, fields = p
+            if tid is not None and (tid not in tasks or tid in deleted):
+                errors[i] = f'task #{tid} not found'
+            elif fields.get('assigned_to') is not None and fields['assigned_to'] not in members:
+                errors[i] = f"team member #{fields['assigned_to']} not found"
+            elif kind == 'delete':
+                deleted.add(tid)
+        if errors:
+            raise BadTaskOps(f'{len(errors)} invalid operation(s); nothing was applied', errors)
+
+        results, counts = [None] * len(parsed), {'created': 0, 'updated': 0, 'deleted': 0}
+        for (kind, cols), run in itertools.groupby(enumerate(parsed), key=lambda x: (x[1][0], tuple(x[1][2]))):
+            run = list(run)
+            if kind == 'create':
+                conn.executemany(f'INSERT INTO tasks ({", ".join(cols)}) VALUES ({",".join("?" * len(cols))})',
+                                 [tuple(f.values()) for _, (_, _, f) in run])
+                # We hold the write lock, so AUTOINCREMENT handed this run consecutive ids
+                last = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                for k, (i, _) in enumerate(run):
+                    results[i] = {'op': kind, 'id': last - len(run) + 1 + k, 'ok': True}
+            elif kind == 'update':
+                conn.executemany(f"UPDATE tasks SET {', '.join(f'{c}=?' for c in cols)}, updated_at=datetime('now') WHERE id=?",
+                                 [(*f.values(), tid) for _, (_, tid, f) in run])
+            else:
+                ids = [(tid,) for _, (_, tid, _) in run]
+                conn.executemany('DELETE FROM comments WHERE task_id=?', ids)
+                conn.executemany('DELETE FROM tasks WHERE id=?', ids)
+            if kind != 'create':
+                for i, (_, tid, _) in run:
+                    results[i] = {'op': kind, 'id': tid, 'ok': True}
+            counts[kind + 'd'] += len(run)
+        log_action(spec['action'], ', '.join(f'{k} {n}' for k, n in counts.items() if n))
+    return dict(counts, results=results)
+
+def bulk_task_response(source):
+    d = request.get_json(silent=True)
+    ops = d.get('ops') if isinstance(d, dict) else d
+    try:
+        result = apply_task_ops(ops, source)
+    except BadTaskOps as e:
+        results = ([{'ok': False, 'error': e.errors[i]} if i in e.errors else {'ok': True} for i in range(len(ops))]
+                   if e.errors else None)
+        return jsonify({'error': str(e), 'results': results}), 400
+    return jsonify(dict(result, success=True))
 
 # ── FLASK ROUTES ──────────────────────────────────────────────────────────────
 
@@ -683,266 +3241,372 @@ def check_auth():
 # ── Tasks ────────────────────────────────────────────────────────
 @app.route('/api/tasks', methods=['GET'])
 @login_required
+@cached_get('tasks', 'team_members')
 def get_tasks():
-    conn  = get_db()
-    tasks = conn.execute('''
-        SELECT t.*, tm.name as assignee_name, tm.avatar_url as assignee_avatar
-        FROM tasks t LEFT JOIN team_members tm ON t.assigned_to = tm.id
-        ORDER BY t.created_at DESC
-    ''').fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in tasks])
+    return list_response('tasks')
 
 @app.route('/api/tasks', methods=['POST'])
 @login_required
 def create_task():
-    d    = request.json
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO tasks (title,description,status,priority,assigned_to,assigned_by,due_date,tags) VALUES (?,?,?,?,?,?,?,?)',
-              (d['title'], d.get('description',''), d.get('status','todo'), d.get('priority','medium'),
-               d.get('assigned_to'), d.get('assigned_by','Admin'), d.get('due_date'), d.get('tags','')))
-    tid = c.lastrowid
-    log_action(c, 'Task created', d['title'])
-    conn.commit(); conn.close()
+    d = request.json
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO tasks (title,description,status,priority,assigned_to,assigned_by,due_date,tags) VALUES (?,?,?,?,?,?,?,?)',
+                  (d['title'], d.get('description',''), d.get('status','todo'), d.get('priority','medium'),
+                   d.get('assigned_to'), d.get('assigned_by','Admin'), d.get('due_date'), d.get('tags','')))
+        tid = c.lastrowid
+        log_action('Task created', d['title'])
     return jsonify({'id': tid, 'success': True})
 
+@app.route('/api/tasks/bulk', methods=['POST'])
+@login_required
+def bulk_tasks():
+    """Body: {"ops": [{"op": "create"|"update"|"delete", "id": .., <fields>}, ...]}; all or nothing."""
+    return bulk_task_response('web')
+
 @app.route('/api/tasks/<int:tid>', methods=['PUT'])
 @login_required
 def update_task(tid):
-    d      = request.json
-    conn   = get_db()
-    c      = conn.cursor()
-    fields = []
-    vals   = []
-    for f in ['title','description','status','priority','assigned_to','due_date','tags']:
-        if f in d:
-            fields.append(f'{f}=?')
-            vals.append(d[f])
-    fields.append('updated_at=?')
-    vals += [datetime.now().strftime('%Y-%m-%d %H:%M:%S'), tid]
-    c.execute(f'UPDATE tasks SET {", ".join(fields)} WHERE id=?', vals)
-    log_action(c, 'Task updated', f'#{tid}')
-    conn.commit(); conn.close()
+    d = request.json
+    with db() as conn:
+        c = conn.cursor()
+        fields = []
+        vals   = []
+        for f in ['title','description','status','priority','assigned_to','due_date','tags']:
+            if f in d:
+                fields.append(f'{f}=?')
+                vals.append(d[f])
+        fields.append('updated_at=?')
+        vals += [datetime.now().strftime('%Y-%m-%d %H:%M:%S'), tid]
+        c.execute(f'UPDATE tasks SET {", ".join(fields)} WHERE id=?', vals)
+        log_action('Task updated', f'#{tid}')
     return jsonify({'success': True})
 
 @app.route('/api/tasks/<int:tid>', methods=['DELETE'])
 @login_required
 def delete_task(tid):
-    conn = get_db()
-    c    = conn.cursor()
-    t    = c.execute('SELECT title FROM tasks WHERE id=?', (tid,)).fetchone()
-    c.execute('DELETE FROM tasks WHERE id=?', (tid,))
-    c.execute('DELETE FROM comments WHERE task_id=?', (tid,))
-    if t: log_action(c, 'Task deleted', t['title'])
-    conn.commit(); conn.close()
+    with db() as conn:
+        c = conn.cursor()
+        t = c.execute('SELECT title FROM tasks WHERE id=?', (tid,)).fetchone()
+        c.execute('DELETE FROM tasks WHERE id=?', (tid,))
+        c.execute('DELETE FROM comments WHERE task_id=?', (tid,))
+        if t: log_action('Task deleted', t['title'])
     return jsonify({'success': True})
 
 @app.route('/api/tasks/<int:tid>/comments', methods=['GET'])
 @login_required
 def get_comments(tid):
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM comments WHERE task_id=? ORDER BY created_at', (tid,)).fetchall()
-    conn.close()
+    with db() as conn:
+        rows = conn.execute('SELECT * FROM comments WHERE task_id=? ORDER BY created_at', (tid,)).fetchall()
     return jsonify([dict(r) for r in rows])
 
 @app.route('/api/tasks/<int:tid>/comments', methods=['POST'])
 @login_required
 def add_comment(tid):
-    d    = request.json
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO comments (task_id,author,content) VALUES (?,?,?)',
-              (tid, d.get('author','Admin'), d['content']))
-    log_action(c, 'Comment added', f'on task #{tid}')
-    conn.commit(); conn.close()
+    d = request.json
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO comments (task_id,author,content) VALUES (?,?,?)',
+                  (tid, d.get('author','Admin'), d['content']))
+        log_action('Comment added', f'on task #{tid}')
     return jsonify({'success': True})
 
 # ── Team ─────────────────────────────────────────────────────────
 @app.route('/api/team', methods=['GET'])
 @login_required
+@cached_get('team_members', 'tasks', daily=True)
 def get_team():
-    conn    = get_db()
-    members = conn.execute('SELECT * FROM team_members').fetchall()
-    result  = []
-    for m in members:
-        m = dict(m)
-        m['task_count'] = conn.execute('SELECT COUNT(*) as c FROM tasks WHERE assigned_to=?', (m['id'],)).fetchone()['c']
-        result.append(m)
-    conn.close()
+    with db() as conn:
+        result = team_workload(conn)
     return jsonify(result)
 
 @app.route('/api/team', methods=['POST'])
 @login_required
 def add_member():
-    d      = request.json
-    conn   = get_db()
-    c      = conn.cursor()
-    avatar = d.get('avatar_url') or f"https://api.dicebear.com/7.x/adventurer/svg?seed={d['name'].replace(' ','')}"
-    c.execute('INSERT INTO team_members (name,role,avatar_url,email) VALUES (?,?,?,?)',
-              (d['name'], d.get('role','Member'), avatar, d.get('email','')))
-    mid = c.lastrowid
-    log_action(c, 'Team member added', d['name'])
-    conn.commit(); conn.close()
+    d = request.json
+    with db() as conn:
+        c = conn.cursor()
+        avatar = d.get('avatar_url') or f"https://api.dicebear.com/7.x/adventurer/svg?seed={d['name'].replace(' ','')}"
+        c.execute('INSERT INTO team_members (name,role,avatar_url,email) VALUES (?,?,?,?)',
+                  (d['name'], d.get('role','Member'), avatar, d.get('email','')))
+        mid = c.lastrowid
+        log_action('Team member added', d['name'])
     return jsonify({'id': mid, 'success': True})
 
 @app.route('/api/team/<int:mid>', methods=['DELETE'])
 @login_required
 def delete_member(mid):
-    conn = get_db()
-    c    = conn.cursor()
-    m    = c.execute('SELECT name FROM team_members WHERE id=?', (mid,)).fetchone()
-    c.execute('DELETE FROM team_members WHERE id=?', (mid,))
-    if m: log_action(c, 'Team member removed', m['name'])
-    conn.commit(); conn.close()
+    with db() as conn:
+        c = conn.cursor()
+        m = c.execute('SELECT name FROM team_members WHERE id=?', (mid,)).fetchone()
+        c.execute('DELETE FROM team_members WHERE id=?', (mid,))
+        if m: log_action('Team member removed', m['name'])
     return jsonify({'success': True})
 
 # ── Notes ────────────────────────────────────────────────────────
 @app.route('/api/notes', methods=['GET'])
 @login_required
+@cached_get('notes')
 def get_notes():
-    conn  = get_db()
-    notes = conn.execute('SELECT * FROM notes ORDER BY updated_at DESC').fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in notes])
+    return list_response('notes')
 
 @app.route('/api/notes', methods=['POST'])
 @login_required
 def create_note():
-    d    = request.json
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO notes (title,content) VALUES (?,?)', (d['title'], d.get('content','')))
-    nid = c.lastrowid
-    log_action(c, 'Note created', d['title'])
-    conn.commit(); conn.close()
+    d = request.json
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO notes (title,content) VALUES (?,?)', (d['title'], d.get('content','')))
+        nid = c.lastrowid
+        log_action('Note created', d['title'])
     return jsonify({'id': nid, 'success': True})
 
 @app.route('/api/notes/<int:nid>', methods=['PUT'])
 @login_required
 def update_note(nid):
     d = request.json
-    conn = get_db()
-    conn.execute('UPDATE notes SET title=?,content=?,updated_at=? WHERE id=?',
-                 (d['title'], d['content'], datetime.now().strftime('%Y-%m-%d %H:%M:%S'), nid))
-    conn.commit(); conn.close()
+    with db() as conn:
+        conn.execute('UPDATE notes SET title=?,content=?,updated_at=? WHERE id=?',
+                     (d['title'], d['content'], datetime.now().strftime('%Y-%m-%d %H:%M:%S'), nid))
     return jsonify({'success': True})
 
 @app.route('/api/notes/<int:nid>', methods=['DELETE'])
 @login_required
 def delete_note(nid):
-    conn = get_db()
-    conn.execute('DELETE FROM notes WHERE id=?', (nid,))
-    conn.commit(); conn.close()
+    with db() as conn:
+        conn.execute('DELETE FROM notes WHERE id=?', (nid,))
     return jsonify({'success': True})
 
 # ── KB ───────────────────────────────────────────────────────────
 @app.route('/api/kb', methods=['GET'])
 @login_required
+@cached_get('kb_entries')
 def get_kb():
-    conn    = get_db()
-    entries = conn.execute('SELECT * FROM kb_entries ORDER BY category,title').fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in entries])
+    return list_response('kb')
 
 @app.route('/api/kb', methods=['POST'])
 @login_required
 def create_kb():
-    d    = request.json
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
-              (d['title'], d.get('content',''), d.get('category','General')))
-    kid = c.lastrowid
-    log_action(c, 'KB entry created', d['title'])
-    conn.commit(); conn.close()
+    d = request.json
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
+                  (d['title'], d.get('content',''), d.get('category','General')))
+        kid = c.lastrowid
+        log_action('KB entry created', d['title'])
     return jsonify({'id': kid, 'success': True})
 
 @app.route('/api/kb/<int:kid>', methods=['PUT'])
 @login_required
 def update_kb(kid):
     d = request.json
-    conn = get_db()
-    conn.execute('UPDATE kb_entries SET title=?,content=?,category=? WHERE id=?',
-                 (d['title'], d['content'], d.get('category','General'), kid))
-    conn.commit(); conn.close()
+    with db() as conn:
+        conn.execute('UPDATE kb_entries SET title=?,content=?,category=? WHERE id=?',
+                     (d['title'], d['content'], d.get('category','General'), kid))
     return jsonify({'success': True})
 
 @app.route('/api/kb/<int:kid>', methods=['DELETE'])
 @login_required
 def delete_kb(kid):
-    conn = get_db()
-    conn.execute('DELETE FROM kb_entries WHERE id=?', (kid,))
-    conn.commit(); conn.close()
+    with db() as conn:
+        conn.execute('DELETE FROM kb_entries WHERE id=?', (kid,))
     return jsonify({'success': True})
 
 # ── Reminders ────────────────────────────────────────────────────
 @app.route('/api/reminders', methods=['GET'])
 @login_required
+@cached_get('reminders')
 def get_reminders():
-    conn      = get_db()
-    reminders = conn.execute('SELECT * FROM reminders ORDER BY remind_at').fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in reminders])
+    return list_response('reminders')
 
 @app.route('/api/reminders', methods=['POST'])
 @login_required
 def create_reminder():
-    d    = request.json
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO reminders (title,description,remind_at,repeat_type) VALUES (?,?,?,?)',
-              (d['title'], d.get('description',''), d.get('remind_at'), d.get('repeat_type','none')))
-    rid = c.lastrowid
-    log_action(c, 'Reminder created', d['title'])
-    conn.commit(); conn.close()
+    d = request.json
+    try:
+        remind_at, repeat = _reminder_schedule(d)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO reminders (title,description,remind_at,repeat_type,chat_id) VALUES (?,?,?,?,?)',
+                  (d['title'], d.get('description',''), remind_at, repeat, d.get('chat_id')))
+        rid = c.lastrowid
+        log_action('Reminder created', d['title'])
+    reminder_scheduler.notify(rid, remind_at)
     return jsonify({'id': rid, 'success': True})
 
+@app.route('/api/reminders/scheduler', methods=['GET'])
+@login_required
+def reminder_scheduler_status():
+    return jsonify(reminder_scheduler.snapshot())
+
 @app.route('/api/reminders/<int:rid>', methods=['DELETE'])
 @login_required
 def delete_reminder(rid):
-    conn = get_db()
-    conn.execute('DELETE FROM reminders WHERE id=?', (rid,))
-    conn.commit(); conn.close()
+    with db() as conn:
+        conn.execute('DELETE FROM reminders WHERE id=?', (rid,))
     return jsonify({'success': True})
 
 # ── Activity / Stats ─────────────────────────────────────────────
 @app.route('/api/activity')
 @login_required
+@cached_get('activity_log')
 def get_activity():
-    conn = get_db()
-    lim  = request.args.get('limit', 20)
-    logs = conn.execute('SELECT * FROM activity_log ORDER BY timestamp DESC LIMIT ?', (lim,)).fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in logs])
+    return list_response('activity', limit=20)
+
+@app.route('/api/activity/trends')
+@login_required
+def get_activity_trends():
+    """?bucket=hour|day&since=YYYY-MM-DD[ HH:00]&action=a,b from the rollup tables."""
+    bucket  = request.args.get('bucket', 'day')
+    if bucket not in ('hour', 'day'):
+        return jsonify({'error': 'bucket must be hour or day'}), 400
+    actions = [a for a in request.args.get('action', '').split(',') if a]
+    with db() as conn:
+        rows = activity_trends(conn, bucket, request.args.get('since') or None, actions)
+    return jsonify(rows)
+
+@app.route('/api/changes')
+@login_required
+def get_changes():
+    """Delta sync: everything created, updated or deleted since ?since=<token>."""
+    since = request.args.get('since')
+    try:
+        since = int(since) if since not in (None, '') else None
+        limit = max(1, min(int(request.args.get('limit', CHANGES_PAGE)), LIST_MAX_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    with db() as conn:
+        result = changes_since(conn, since, limit)
+    return jsonify(result)
+
+@app.route('/api/events')
+@login_required
+def events_stream():
+    """Server-Sent Events: a `change` event per row written; resumes from Last-Event-ID."""
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    sub = event_hub.subscribe(last_id)
+    if sub is None:
+        return jsonify({'error': 'Too many event streams'}), 503, {'Retry-After': '10'}
+    return app.response_class(event_hub.stream(*sub), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.after_request
+def _poke_events(resp):
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        event_hub.poke()
+    return resp
 
 @app.route('/api/stats')
 @login_required
+@cached_get('tasks', 'notes', 'kb_entries', daily=True)
 def get_stats():
-    conn  = get_db()
-    today = datetime.now().strftime('%Y-%m-%d')
-    wd    = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    r = {
-        'total':          conn.execute('SELECT COUNT(*) as c FROM tasks').fetchone()['c'],
-        'in_progress':    conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='in_progress'").fetchone()['c'],
-        'done':           conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='done'").fetchone()['c'],
-        'todo':           conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='todo'").fetchone()['c'],
-        'completed_week': conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='done' AND updated_at >= ?", (wd,)).fetchone()['c'],
-        'overdue':        conn.execute("SELECT COUNT(*) as c FROM tasks WHERE due_date < ? AND status!='done'", (today,)).fetchone()['c'],
-    }
-    conn.close()
+    with db() as conn:
+        r = task_stats(conn)
     return jsonify(r)
 
+# ── Metrics ──────────────────────────────────────────────────────
+METRICS_TABLES = ('comments', 'reminders', 'activity_log', 'group_knowledge', 'telegram_sessions', 'change_log')
+METRICS_SNAPSHOTS = {     # subsystem -> snapshot(); numeric fields are exported as crm_<subsystem>_<field>
+    'telegram_outbox': lambda: tg_outbox.snapshot(),
+    'telegram_updates': lambda: tg_updates.snapshot(),
+    'telegram_sessions': lambda: tg_sessions.snapshot(),
+    'group_ingest': lambda: group_ingest.snapshot(),
+    'activity_log': lambda: activity_log.snapshot(),
+    'reminders': lambda: reminder_scheduler.snapshot(),
+    'events': lambda: event_hub.snapshot(),
+    'response_cache': lambda: response_cache.snapshot(),
+    'gzip_cache': lambda: gzip_cache.snapshot(),
+}
+_metrics_gauges = {'at': None, 'rows': []}
+_metrics_gauges_lock = threading.Lock()
+
+@app.before_request
+def _metrics_start():
+    _db_meter.queries, _db_meter.seconds, _db_meter.started = 0, 0.0, time.perf_counter()
+
+@app.after_request
+def _metrics_record(resp):
+    started = _db_meter.started
+    if started is None:
+        return resp
+    route  = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (('route', route), ('method', request.method))
+    metrics.observe('crm_http_request_seconds', labels, time.perf_counter() - started)
+    metrics.inc('crm_http_requests_total', labels + (('status', str(resp.status_code)),))
+    metrics.inc('crm_http_db_queries_total', labels, _db_meter.queries)
+    metrics.inc('crm_http_db_seconds_total', labels, _db_meter.seconds)
+    _db_meter.started = None
+    return resp
+
+def _table_gauges():
+    # Table sizes are O(rows) to count; refresh at most every METRICS_GAUGE_TTL seconds
+    with _metrics_gauges_lock:
+        now = time.monotonic()
+        if _metrics_gauges['at'] is None or now - _metrics_gauges['at'] >= METRICS_GAUGE_TTL:
+            with db() as conn:
+                counts = dict(conn.execute("SELECT name, value FROM counters WHERE name IN ('tasks','notes','kb_entries')"))
+                for table in METRICS_TABLES:
+                    counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                backlog = group_sync_backlog(conn)
+            _metrics_gauges['rows'] = ([('crm_table_rows', (('table', t),), n) for t, n in sorted(counts.items())]
+                                       + [('crm_group_sync_backlog', (), backlog)])
+            _metrics_gauges['at'] = now
+        return _metrics_gauges['rows']
+
+@app.route('/metrics')
+@metrics_auth_required
+def metrics_endpoint():
+    """Prometheus text format. Scrape with `Authorization: Bearer $METRICS_TOKEN`."""
+    gauges = list(_table_gauges())
+    for name, s in bot_timings.snapshot().items():
+        labels = (('handler', name),)
+        gauges += [('crm_bot_handler_calls', labels, s['count']), ('crm_bot_handler_errors', labels, s['errors']),
+                   ('crm_bot_handler_seconds', labels, s['total_ms'] / 1000),
+                   ('crm_bot_handler_cpu_seconds', labels, s['cpu_ms'] / 1000)]
+    for subsystem, snapshot in METRICS_SNAPSHOTS.items():
+        for field, value in snapshot().items():
+            if isinstance(value, (int, float)):
+                gauges.append((f'crm_{subsystem}_{field}', (), value))
+    return app.response_class(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 # ── TELEGRAM WEBHOOK ──────────────────────────────────────────────────────────
 @app.route('/telegram/webhook', methods=['POST'])
 def telegram_webhook():
-    try:
-        update = request.json
-        handle_telegram_update(update)
-    except Exception as e:
-        print(f'[TG webhook] error: {e}')
+    """Acknowledge at once; the update is processed by tg_updates."""
+    update = request.get_json(silent=True)
+    uid    = update.get('update_id') if isinstance(update, dict) else None
+    if not isinstance(uid, int) or isinstance(uid, bool):
+        return jsonify({'ok': False, 'error': 'Not a Telegram update'}), 400
+    if tg_updates.submit(update) == 'full':
+        return jsonify({'ok': False, 'error': 'Busy'}), 503, {'Retry-After': '5'}
     return jsonify({'ok': True})
 
+@app.route('/api/telegram/updates')
+@login_required
+def telegram_update_stats():
+    return jsonify(tg_updates.snapshot())
+
+@app.route('/api/telegram/outbox')
+@login_required
+def telegram_outbox_stats():
+    return jsonify(tg_outbox.snapshot())
+
+@app.route('/api/telegram/commands', methods=['GET'])
+@login_required
+def telegram_command_timings():
+    return jsonify(bot_timings.snapshot())
+
+@app.route('/api/telegram/sessions', methods=['GET'])
+@login_required
+def telegram_sessions_status():
+    return jsonify(tg_sessions.snapshot())
+
 @app.route('/telegram/setup')
 @login_required
 def telegram_setup():
@@ -957,6 +3621,8 @@ def import_whatsapp():
     """
     POST with JSON: { "text": "<full whatsapp export text>", "category": "optional" }
     OR as multipart/form-data with file field "file".
+    JSON is imported inline. Uploads are spooled to disk and imported by a
+    background job; the 202 response carries job_id for /api/import/jobs/<id>.
     """
     category = 'WhatsApp Import'
 
@@ -964,68 +3630,75 @@ def import_whatsapp():
         f    = request.files.get('file')
         if not f:
             return jsonify({'error': 'No file uploaded'}), 400
-        try:
-            text = f.read().decode('utf-8')
-        except Exception:
-            text = f.read().decode('latin-1')
         category = request.form.get('category', category)
-    else:
-        d        = request.json or {}
-        text     = d.get('text', '')
-        category = d.get('category', category)
+        fd, path = tempfile.mkstemp(prefix='wa-import-', suffix='.txt')
+        os.close(fd)
+        size, encoding = spool_upload(f.stream, path)
+        if not size:
+            os.unlink(path)
+            return jsonify({'error': 'Empty text'}), 400
+        with db() as conn:
+            c = conn.cursor()
+            c.execute('INSERT INTO import_jobs (category,encoding,bytes_total) VALUES (?,?,?)', (category, encoding, size))
+            job_id = c.lastrowid
+            job = dict(c.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone())
+        threading.Thread(target=run_import_job, args=(job_id, path, encoding, category),
+                         name=f'wa-import-{job_id}', daemon=True).start()
+        return jsonify(dict(job, job_id=job_id, status_url=f'/api/import/jobs/{job_id}')), 202
+
+    d = request.json or {}
+    text     = d.get('text', '')
+    category = d.get('category', category)
 
     if not text.strip():
         return jsonify({'error': 'Empty text'}), 400
 
-    entries = parse_whatsapp_export(text, category)
-    if not entries:
-        return jsonify({'error': 'No parseable messages found. Make sure this is an exported WhatsApp chat .txt file.'}), 400
-
-    conn  = get_db()
-    c     = conn.cursor()
-    count = 0
-    for title, content, cat in entries:
-        c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)', (title, content, cat))
-        count += 1
-    log_action(c, 'WhatsApp KB import', f'Imported {count} days of chat as KB entries')
-    conn.commit(); conn.close()
+    count = import_kb_entries(iter_whatsapp_entries(text.splitlines(), category))
+    if not count:
+        return jsonify({'error': WA_NOTHING_PARSED}), 400
+    log_action('WhatsApp KB import', f'Imported {count} days of chat as KB entries')
 
     return jsonify({'success': True, 'imported': count, 'category': category})
 
+@app.route('/api/import/jobs', methods=['GET'])
+@login_required
+def list_import_jobs():
+    with db() as conn:
+        rows = conn.execute('SELECT * FROM import_jobs ORDER BY id DESC LIMIT 20').fetchall()
+    return jsonify([dict(r) for r in rows])
+
+@app.route('/api/import/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_import_job(job_id):
+    with db() as conn:
+        row = conn.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone()
+    if not row:
+        return jsonify({'error': 'Not found'}), 404
+    job = dict(row, job_id=row['id'], status_url=f'/api/import/jobs/{job_id}')
+    if job['status'] == 'done':
+        job['success'] = True
+    return jsonify(job)
+
 # ── GROUP KNOWLEDGE ───────────────────────────────────────────────────────────
 @app.route('/api/group-knowledge', methods=['GET'])
 @login_required
 def get_group_knowledge():
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM group_knowledge ORDER BY timestamp DESC LIMIT 100').fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in rows])
+    group_ingest.flush()
+    return list_response('group_knowledge', limit=100)
+
+@app.route('/api/group-knowledge/ingest', methods=['GET'])
+@login_required
+def group_ingest_stats():
+    return jsonify(group_ingest.snapshot())
 
 @app.route('/api/group-knowledge/sync', methods=['POST'])
 @login_required
 def manual_sync_groups():
     """Manually trigger group → KB sync from the dashboard."""
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM group_knowledge WHERE synced_to_kb=0 ORDER BY timestamp').fetchall()
-    if not rows:
-        conn.close()
-        return jsonify({'synced': 0})
-    by_chat = {}
-    for r in rows:
-        key = r['chat_title'] or r['chat_id']
-        by_chat.setdefault(key, []).append(f"[{r['speaker']}]: {r['message']}")
-    count = 0
-    c = conn.cursor()
-    for chat_title, messages in by_chat.items():
-        batch = '\n'.join(messages[:50])
-        title = f"Group: {chat_title} — {datetime.now().strftime('%Y-%m-%d')}"
-        c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
-                  (title, batch, 'Team Conversations'))
-        count += len(messages)
-    c.execute('UPDATE group_knowledge SET synced_to_kb=1 WHERE synced_to_kb=0')
-    log_action(c, 'Group KB sync', f'Synced {count} messages')
-    conn.commit(); conn.close()
-    return jsonify({'synced': count})
+    result = sync_group_knowledge()
+    if result['synced']:
+        log_action('Group KB sync', f"Synced {result['synced']} messages")
+    return jsonify(result)
 
 # ── BOT / OPENCLAW SKILL API ──────────────────────────────────────────────────
 # These routes use X-Bot-Key header auth (no session needed) so OpenClaw skill
@@ -1034,110 +3707,125 @@ def manual_sync_groups():
 @app.route('/bot/tasks', methods=['GET'])
 @bot_auth_required
 def bot_get_tasks():
-    conn  = get_db()
-    tasks = conn.execute(
-        "SELECT t.id,t.title,t.status,t.priority,t.due_date,tm.name as assignee FROM tasks t LEFT JOIN team_members tm ON t.assigned_to=tm.id ORDER BY t.created_at DESC LIMIT 20"
-    ).fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in tasks])
+    return list_response('tasks', limit=20, fields=['id', 'title', 'status', 'priority', 'due_date', 'assignee'])
 
 @app.route('/bot/tasks', methods=['POST'])
 @bot_auth_required
 def bot_create_task():
-    d    = request.json or {}
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO tasks (title,description,priority,due_date,assigned_by,tags) VALUES (?,?,?,?,?,?)',
-              (d.get('title','Untitled'), d.get('description',''), d.get('priority','medium'),
-               d.get('due_date'), d.get('assigned_by','OpenClaw'), d.get('tags','')))
-    tid = c.lastrowid
-    log_action(c, 'Task created via OpenClaw', d.get('title',''))
-    conn.commit(); conn.close()
+    d = request.json or {}
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO tasks (title,description,priority,due_date,assigned_by,tags) VALUES (?,?,?,?,?,?)',
+                  (d.get('title','Untitled'), d.get('description',''), d.get('priority','medium'),
+                   d.get('due_date'), d.get('assigned_by','OpenClaw'), d.get('tags','')))
+        tid = c.lastrowid
+        log_action('Task created via OpenClaw', d.get('title',''))
     return jsonify({'id': tid, 'success': True})
 
+@app.route('/bot/tasks/bulk', methods=['POST'])
+@bot_auth_required
+def bot_bulk_tasks():
+    return bulk_task_response('bot')
+
 @app.route('/bot/tasks/<int:tid>', methods=['PATCH'])
 @bot_auth_required
 def bot_update_task(tid):
-    d      = request.json or {}
-    conn   = get_db()
-    c      = conn.cursor()
-    fields = []; vals = []
-    for f in ['title','status','priority','due_date','tags','description']:
-        if f in d:
-            fields.append(f'{f}=?'); vals.append(d[f])
-    if fields:
-        fields.append("updated_at=datetime('now')")
-        vals.append(tid)
-        c.execute(f'UPDATE tasks SET {", ".join(fields)} WHERE id=?', vals)
-        log_action(c, 'Task updated via OpenClaw', f'#{tid}')
-    conn.commit(); conn.close()
+    d = request.json or {}
+    with db() as conn:
+        c = conn.cursor()
+        fields = []; vals = []
+        for f in ['title','status','priority','due_date','tags','description']:
+            if f in d:
+                fields.append(f'{f}=?'); vals.append(d[f])
+        if fields:
+            fields.append("updated_at=datetime('now')")
+            vals.append(tid)
+            c.execute(f'UPDATE tasks SET {", ".join(fields)} WHERE id=?', vals)
+            log_action('Task updated via OpenClaw', f'#{tid}')
     return jsonify({'success': True})
 
+@app.route('/bot/notes', methods=['GET'])
+@bot_auth_required
+def bot_get_notes():
+    return list_response('notes', limit=20, fields=['id', 'title', 'updated_at'])
+
 @app.route('/bot/notes', methods=['POST'])
 @bot_auth_required
 def bot_create_note():
-    d    = request.json or {}
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO notes (title,content) VALUES (?,?)',
-              (d.get('title','Untitled'), d.get('content','')))
-    nid = c.lastrowid
-    log_action(c, 'Note created via OpenClaw', d.get('title',''))
-    conn.commit(); conn.close()
+    d = request.json or {}
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO notes (title,content) VALUES (?,?)',
+                  (d.get('title','Untitled'), d.get('content','')))
+        nid = c.lastrowid
+        log_action('Note created via OpenClaw', d.get('title',''))
     return jsonify({'id': nid, 'success': True})
 
 @app.route('/bot/kb', methods=['GET'])
 @bot_auth_required
 def bot_search_kb():
-    q       = request.args.get('q', '')
-    conn    = get_db()
-    entries = conn.execute(
-        "SELECT id,title,category,substr(content,1,300) as preview FROM kb_entries WHERE title LIKE ? OR content LIKE ? LIMIT 10",
-        (f'%{q}%', f'%{q}%')).fetchall()
-    conn.close()
+    q = request.args.get('q', '')
+    if not q.strip():
+        return list_response('kb', limit=10, fields=['id', 'title', 'category'])
+    with db() as conn:
+        entries = kb_search(conn, q, limit=10)
     return jsonify([dict(r) for r in entries])
 
 @app.route('/bot/kb', methods=['POST'])
 @bot_auth_required
 def bot_create_kb():
-    d    = request.json or {}
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
-              (d.get('title','Untitled'), d.get('content',''), d.get('category','General')))
-    kid = c.lastrowid
-    log_action(c, 'KB entry via OpenClaw', d.get('title',''))
-    conn.commit(); conn.close()
+    d = request.json or {}
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO kb_entries (title,content,category) VALUES (?,?,?)',
+                  (d.get('title','Untitled'), d.get('content',''), d.get('category','General')))
+        kid = c.lastrowid
+        log_action('KB entry via OpenClaw', d.get('title',''))
     return jsonify({'id': kid, 'success': True})
 
 @app.route('/bot/stats', methods=['GET'])
 @bot_auth_required
 def bot_stats():
-    conn  = get_db()
-    today = datetime.now().strftime('%Y-%m-%d')
-    r = {
-        'total':       conn.execute('SELECT COUNT(*) as c FROM tasks').fetchone()['c'],
-        'in_progress': conn.execute("SELECT COUNT(*) as c FROM tasks WHERE status='in_progress'").fetchone()['c'],
-        'overdue':     conn.execute("SELECT COUNT(*) as c FROM tasks WHERE due_date < ? AND status!='done'", (today,)).fetchone()['c'],
-        'notes':       conn.execute('SELECT COUNT(*) as c FROM notes').fetchone()['c'],
-        'kb_entries':  conn.execute('SELECT COUNT(*) as c FROM kb_entries').fetchone()['c'],
-    }
-    conn.close()
+    with db() as conn:
+        st = task_stats(conn)
+    r = {k: st[k] for k in ('total', 'in_progress', 'overdue', 'notes', 'kb_entries')}
     return jsonify(r)
 
+@app.route('/bot/team', methods=['GET'])
+@bot_auth_required
+def bot_team():
+    with db() as conn:
+        result = team_workload(conn)
+    return jsonify(result)
+
+@app.route('/bot/reminders', methods=['GET'])
+@bot_auth_required
+def bot_get_reminders():
+    return list_response('reminders', limit=20)
+
 @app.route('/bot/reminders', methods=['POST'])
 @bot_auth_required
 def bot_create_reminder():
-    d    = request.json or {}
-    conn = get_db()
-    c    = conn.cursor()
-    c.execute('INSERT INTO reminders (title,description,remind_at,repeat_type) VALUES (?,?,?,?)',
-              (d.get('title',''), d.get('description',''), d.get('remind_at'), d.get('repeat_type','none')))
-    rid = c.lastrowid
-    log_action(c, 'Reminder via OpenClaw', d.get('title',''))
-    conn.commit(); conn.close()
+    d = request.json or {}
+    try:
+        remind_at, repeat = _reminder_schedule(d)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with db() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO reminders (title,description,remind_at,repeat_type,chat_id) VALUES (?,?,?,?,?)',
+                  (d.get('title',''), d.get('description',''), remind_at, repeat, d.get('chat_id')))
+        rid = c.lastrowid
+        log_action('Reminder via OpenClaw', d.get('title',''))
+    reminder_scheduler.notify(rid, remind_at)
     return jsonify({'id': rid, 'success': True})
 
+@app.route('/bot/group-knowledge', methods=['GET'])
+@bot_auth_required
+def bot_get_group_knowledge():
+    group_ingest.flush()
+    return list_response('group_knowledge', limit=50)
+
 @app.route('/bot/ping', methods=['GET'])
 @bot_auth_required
 def bot_ping():
@@ -1146,8 +3834,188 @@ def bot_ping():
 # ── FRONTEND ──────────────────────────────────────────────────────────────────
 @app.route('/')
 def index():
-    return send_file(os.path.join(os.path.dirname(__file__), 'index.html'))
+    return index_asset.response()
+
+@app.after_request
+def _compress(resp):
+    # Registered after _metrics_record, so it runs first and request timings include it
+    if (resp.status_code != 200 or resp.mimetype != 'application/json' or resp.direct_passthrough
+            or resp.is_streamed or 'Content-Encoding' in resp.headers):
+        return resp
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    if not accepts_encoding('gzip'):
+        return resp
+    # Uncached routes have no ETag; a body digest costs far less than recompressing
+    etag = resp.get_etag()[0]
+    key  = etag or hashlib.blake2b(body, digest_size=16).digest()
+    gz   = gzip_cache.get(key)
+    if gz is None:
+        gz = gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+        gzip_cache.put(key, gz)
+    resp.set_data(gz)
+    resp.headers['Content-Encoding'] = 'gzip'
+    if etag:
+        resp.set_etag(etag + ETAG_SUFFIXES['gzip'])
+    return resp
+
+# ── SERVING ───────────────────────────────────────────────────────────────────
+# `python app.py serve` runs gunicorn with the app preloaded: the master
+# migrates the schema once, then forks workers that share only the database
+# file. Each worker starts its reminder scheduler after the fork (firing is
+# compare-and-set, so only one worker sends a given reminder) and drains its
+# buffers when it is stopped gracefully.
+PORT                   = int(os.environ.get('PORT', 8090))
+SERVE_WORKERS          = int(os.environ.get('WEB_CONCURRENCY', 0))          # 0 = 2 per CPU + 1, capped
+SERVE_MAX_WORKERS      = int(os.environ.get('SERVE_MAX_WORKERS', 4))        # SQLite has one writer; more rarely helps
+SERVE_WORKER_CLASS     = os.environ.get('SERVE_WORKER_CLASS', 'gthread')    # gthread | gevent
+SERVE_THREADS          = int(os.environ.get('SERVE_THREADS', 16))           # per gthread worker
+SERVE_CONNECTIONS      = int(os.environ.get('SERVE_CONNECTIONS', 500))      # per gevent worker
+SERVE_TIMEOUT          = int(os.environ.get('SERVE_TIMEOUT', 60))
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', 10))  # seconds to wait on each Telegram queue
+
+_app_ready     = False
+_scheduler_pid = None
+
+def init_app():
+    """Migrate the schema and load static assets; once per process tree."""
+    global _app_ready
+    if not _app_ready:
+        init_db()
+        index_asset.refresh()   # loaded and compressed before the workers fork
+        _app_ready = True
+
+def create_app(workers=None, threads=None):
+    """WSGI factory (`gunicorn 'app:create_app()' --preload`).
+
+    Sized from gunicorn's -w/--threads, else WEB_CONCURRENCY and SERVE_THREADS.
+    With no known worker count, sessions are shared: assuming one worker is the
+    unsafe guess. Each worker starts its reminder scheduler on its first request."""
+    global TG_SESSION_SHARED, EVENTS_MAX_STREAMS
+    init_app()
+    if workers is None:
+        cli_workers, cli_threads = _gunicorn_counts()
+        workers = cli_workers or SERVE_WORKERS or None
+        if threads is None:
+            threads = cli_threads
+    if threads is None:
+        threads = SERVE_THREADS if SERVE_WORKER_CLASS == 'gthread' else 0
+    if workers is None or workers > 1:
+        TG_SESSION_SHARED = True   # a chat's next message may land on another worker
+    if threads:
+        # An SSE stream holds a thread for as long as it is open; leave room for requests
+        EVENTS_MAX_STREAMS = min(EVENTS_MAX_STREAMS, max(1, threads // 2))
+    if _start_scheduler not in app.before_request_funcs.get(None, ()):
+        app.before_request(_start_scheduler)
+    return app
+
+def _gunicorn_counts():
+    """(workers, threads) from the gunicorn command line loading this factory; None where not given."""
+    if 'gunicorn' not in sys.modules:
+        return None, None
+    try:
+        from gunicorn.config import Config
+        args, _ = Config().parser().parse_known_args(shlex.split(os.environ.get('GUNICORN_CMD_ARGS', ''))
+                                                      + sys.argv[1:])
+    except (ImportError, SystemExit, ValueError):
+        return None, None
+    return args.workers, args.threads
+
+def _start_scheduler():
+    global _scheduler_pid
+    if _scheduler_pid != os.getpid():
+        _scheduler_pid = os.getpid()
+        reminder_scheduler.start()
+
+def shutdown():
+    """Write out everything this process still holds in memory. Safe to call more than once."""
+    if not tg_updates.drain(SHUTDOWN_DRAIN_TIMEOUT):
+        print(f"[TG] shutdown: {tg_updates.snapshot()['depth']} update(s) not processed")
+    else:
+        tg_poller.save()   # a batch interrupted mid-drain is finished now
+    group_ingest.flush()
+    tg_sessions.flush()
+    activity_log.flush()   # last of the DB buffers: the others may still log
+    if tg_outbox.snapshot()['depth'] and not tg_outbox.flush(SHUTDOWN_DRAIN_TIMEOUT):
+        print(f"[TG] shutdown: {tg_outbox.snapshot()['depth']} message(s) not delivered")
+
+atexit.register(shutdown)
+
+def _rebuild_for_gevent(worker):
+    # The gevent worker patches threading after the fork hooks have already built
+    # this process's locks and thread-locals; real ones would stall the event loop.
+    global _db_meter, _group_sync_lock, _metrics_gauges_lock
+    _db_meter, _group_sync_lock, _metrics_gauges_lock = _DbMeter(), threading.Lock(), threading.Lock()
+    for reset in (_reset_db_pool, metrics._reset, activity_log._reset, event_hub._reset, response_cache._reset,
+                  gzip_cache._reset, tg_outbox._reset, tg_updates._reset, tg_sessions._reset, group_ingest._reset,
+                  reminder_scheduler._reset, bot_timings._reset):
+        reset()
+    reminder_scheduler.start()
+
+def serve_options():
+    """Gunicorn settings for `serve`, sized from the CPUs this process may run on."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    opts = {
+        'bind':             f'0.0.0.0:{PORT}',
+        'workers':          SERVE_WORKERS or min(2 * cpus + 1, SERVE_MAX_WORKERS),
+        'worker_class':     SERVE_WORKER_CLASS,
+        'preload_app':      True,
+        'timeout':          SERVE_TIMEOUT,
+        'graceful_timeout': SERVE_GRACEFUL_TIMEOUT,
+        'keepalive':        5,
+        'worker_exit':      lambda server, worker: shutdown(),
+    }
+    if SERVE_WORKER_CLASS == 'gevent':
+        opts['worker_connections'] = SERVE_CONNECTIONS
+        opts['post_worker_init']   = _rebuild_for_gevent   # also starts the scheduler
+    else:
+        opts['threads']   = SERVE_THREADS
+        opts['post_fork'] = lambda server, worker: reminder_scheduler.start()
+    return opts
+
+def serve():
+    from gunicorn.app.base import BaseApplication
+
+    opts = serve_options()
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for k, v in opts.items():
+                self.cfg.set(k, v)
+
+        def load(self):
+            return create_app(opts['workers'], opts.get('threads', 0))
+
+    print(f"[SERVE] {opts['workers']} {opts['worker_class']} worker(s) on {opts['bind']}")
+    Server().run()
 
 if __name__ == '__main__':
-    init_db()
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8090)), debug=False)
+    init_app()
+    if sys.argv[1:] == ['rebuild-counters']:
+        with db() as conn:
+            rebuild_counters(conn)
+        print('[DB] counters rebuilt')
+    elif sys.argv[1:] == ['prune-activity']:
+        print(f'[DB] pruned {prune_activity()} activity rows')
+    elif sys.argv[1:] == ['check-indexes']:
+        with db() as conn:
+            bad = check_query_plans(conn)
+        for name, plan in bad.items():
+            print(f'[DB] {name} is not index-backed: ' + '; '.join(plan))
+        print(f'[DB] {len(HOT_QUERIES) - len(bad)}/{len(HOT_QUERIES)} hot queries use an index')
+        sys.exit(1 if bad else 0)
+    elif sys.argv[1:] == ['serve']:
+        serve()
+    elif sys.argv[1:] == ['poll']:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        print(f'[TG] polling {TG_API_URL} for updates')
+        reminder_scheduler.start()
+        tg_poller.run()
+    else:
+        # Development server. SIGTERM exits through atexit so buffers are flushed
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        reminder_scheduler.start()
+        app.run(host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,782 @@
+"""
+Load benchmarks for the CRM API and the Telegram bot.
+
+    python bench.py seed --db /tmp/bench.db                     # production-sized data set
+    python bench.py seed --db /tmp/bench.db --scale 0.05        # same mix, 5% of the volume
+    python bench.py run  --db /tmp/bench.db --out before.json   # in-process, through Flask's test client
+    python bench.py run  --url http://127.0.0.1:8090 --out after.json
+    python bench.py bot  --db /tmp/bench.db --out bot.json      # webhook replay against a local Bot API
+    python bench.py tg-stub --port 8081                         # just the local Bot API, for offline work
+    python bench.py compare before.json after.json
+
+The seeder is deterministic for a given --seed, so two commits benchmarked
+against freshly seeded databases see the same data. Results are JSON:
+throughput and p50/p95/p99 latency per route (or for the bot), plus enough
+metadata (commit, row counts, concurrency) to tell whether two runs are comparable.
+"""
+import argparse, http.client, http.server, itertools, json, os, platform, random, sqlite3, subprocess, sys, threading, time
+import tempfile, urllib.parse
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+# ── SEEDER ────────────────────────────────────────────────────────────────────
+SEED_BATCH = 10000   # rows per executemany / transaction
+
+WORDS = ('client invoice deploy release budget review design logo website homepage campaign launch meeting '
+         'standup report sprint backlog bug fix login payment gateway api server database backup migration '
+         'onboarding docs contract proposal quote supplier shipment order customer support ticket refund '
+         'feedback survey analytics dashboard metrics roadmap hiring interview offer training policy audit '
+         'security password access vpn laptop office rent lunch travel visa flight hotel schedule deadline '
+         'friday monday tomorrow today morning afternoon please thanks urgent asap update status done blocked '
+         'waiting approved rejected draft final version copy photo video banner newsletter social post').split()
+FIRST   = ('Alex Sam Jordan Taylor Morgan Casey Riley Jamie Avery Quinn Drew Parker Reese Rowan Skyler '
+           'Devon Emerson Finley Harper Kai Logan Micah Noor Priya Ravi Sofia Tomas Yuki Zara Omar').split()
+LAST    = 'Rivera Chen Lee Kim Patel Garcia Novak Okafor Silva Haddad Berg Ito Moreau Rossi Walsh'.split()
+ROLES   = ('Lead', 'Manager', 'Editor', 'Developer', 'Designer', 'Support', 'Sales')
+STATUS  = ('todo',) * 3 + ('in_progress',) * 2 + ('done',) * 5
+PRIO    = ('low',) * 2 + ('medium',) * 4 + ('high',) * 3 + ('urgent',)
+TAGS    = ('marketing', 'website', 'finance', 'hr', 'dev', 'api', 'design', 'sales', 'ops', 'legal')
+KB_CATS = ('WhatsApp Import', 'Team Conversations', 'Processes', 'Development', 'Brand', 'Clients', 'General')
+ACTIONS = ('Task created', 'Task updated', 'Task deleted', 'Note created', 'KB entry added', 'Comment added',
+           'Task created via Telegram', 'Note created via Telegram', 'Reminder via Telegram', 'WhatsApp import')
+
+# Volumes at --scale 1: what a busy team accumulates over a couple of years
+VOLUMES = {'members': 50, 'tasks': 100000, 'comments': 50000, 'notes': 10000, 'kb': 50000,
+           'reminders': 2000, 'group_messages': 1000000, 'group_chats': 25, 'activity': 1000000}
+
+def _sentence(rng, lo=4, hi=14):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(lo, hi))).capitalize()
+
+def _stamp(rng, now, days):
+    return (now - timedelta(seconds=rng.randint(0, days * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+def _chat_log(rng, names, lines):
+    # A day of WhatsApp-export-sized conversation, as the importer stores it
+    t = rng.randint(7 * 60, 10 * 60)
+    out = []
+    for _ in range(lines):
+        t += rng.randint(0, 25)
+        out.append(f'[{t // 60 % 24:02d}:{t % 60:02d}] {rng.choice(names)}: {_sentence(rng, 3, 30)}')
+    return '\n'.join(out)
+
+def _insert(app, sql, rows, label):
+    started, done, batch = time.perf_counter(), 0, []
+    def flush():
+        with app.db() as conn:
+            conn.executemany(sql, batch)
+    for row in rows:
+        batch.append(row)
+        if len(batch) == SEED_BATCH:
+            flush()
+            done += len(batch)
+            batch.clear()
+            print(f'\r[SEED] {label}: {done:,}', end='', flush=True)
+    if batch:
+        flush()
+        done += len(batch)
+    print(f'\r[SEED] {label}: {done:,} in {time.perf_counter() - started:.1f}s')
+
+def seed(app, volumes, rng):
+    now = datetime.utcnow()
+    with app.db() as conn:
+        conn.execute('PRAGMA synchronous=OFF')   # a seed that dies halfway is simply re-run
+        base_member = conn.execute('SELECT COALESCE(MAX(id), 0) FROM team_members').fetchone()[0]
+        base_task   = conn.execute('SELECT COALESCE(MAX(id), 0) FROM tasks').fetchone()[0]
+    names = [f'{rng.choice(FIRST)} {rng.choice(LAST)}' for _ in range(volumes['members'])]
+
+    _insert(app, 'INSERT INTO team_members (name,role,avatar_url,email) VALUES (?,?,?,?)',
+            ((n, rng.choice(ROLES), f'https://api.dicebear.com/7.x/adventurer/svg?seed={i}',
+              f"{n.split()[0].lower()}{i}@team.com") for i, n in enumerate(names)), 'team_members')
+    members = range(base_member + 1, base_member + len(names) + 1)
+
+    def tasks():
+        for _ in range(volumes['tasks']):
+            created = _stamp(rng, now, 730)
+            due     = (now + timedelta(days=rng.randint(-60, 90))).strftime('%Y-%m-%d') if rng.random() < 0.7 else None
+            yield (_sentence(rng, 3, 8), _sentence(rng, 8, 40), rng.choice(STATUS), rng.choice(PRIO),
+                   rng.choice(members) if rng.random() < 0.85 else None, rng.choice(names), due,
+                   ','.join(rng.sample(TAGS, rng.randint(0, 3))), created, created)
+    _insert(app, 'INSERT INTO tasks (title,description,status,priority,assigned_to,assigned_by,due_date,tags,'
+                 'created_at,updated_at) VALUES (?,?,?,?,?,?,?,?,?,?)', tasks(), 'tasks')
+    n_tasks = volumes['tasks']
+    _insert(app, 'INSERT INTO comments (task_id,author,content,created_at) VALUES (?,?,?,?)',
+            ((base_task + rng.randint(1, max(n_tasks, 1)), rng.choice(names), _sentence(rng), _stamp(rng, now, 365))
+             for _ in range(volumes['comments'] if n_tasks else 0)), 'comments')
+    _insert(app, 'INSERT INTO notes (title,content,created_at,updated_at) VALUES (?,?,?,?)',
+            ((_sentence(rng, 2, 6), '\n'.join(_sentence(rng) for _ in range(rng.randint(1, 12))),
+              *([_stamp(rng, now, 365)] * 2)) for _ in range(volumes['notes'])), 'notes')
+
+    def kb():
+        for _ in range(volumes['kb']):
+            day = (now - timedelta(days=rng.randint(0, 1000))).strftime('%Y-%m-%d')
+            yield (f'WhatsApp: {rng.choice(WORDS).capitalize()} team — {day}',
+                   _chat_log(rng, names[:8], rng.randint(10, 80)), rng.choice(KB_CATS), f'{day} 20:00:00')
+    _insert(app, 'INSERT INTO kb_entries (title,content,category,created_at) VALUES (?,?,?,?)', kb(), 'kb_entries')
+
+    def reminders():
+        for _ in range(volumes['reminders']):
+            at     = now + timedelta(minutes=rng.randint(-60 * 24 * 30, 60 * 24 * 60))
+            repeat = rng.choice(('none',) * 6 + ('daily', 'weekly', 'monthly'))
+            if at < now and repeat != 'none':
+                at = now + timedelta(minutes=rng.randint(1, 60 * 24 * 7))
+            yield (_sentence(rng, 2, 6), 'Seeded', at.strftime('%Y-%m-%dT%H:%M:%S'), repeat,
+                   at.strftime('%Y-%m-%dT%H:%M:%S') if at < now else None)
+    _insert(app, 'INSERT INTO reminders (title,description,remind_at,repeat_type,fired_at) VALUES (?,?,?,?,?)',
+            reminders(), 'reminders')
+
+    # Group chat: the oldest 90% of messages already synced to the KB, the rest backlog
+    chats  = [(f'-100{1000000 + i}', f'{rng.choice(WORDS).capitalize()} Group') for i in range(volumes['group_chats'])]
+    n_msgs = volumes['group_messages']
+    start  = now - timedelta(days=365)
+    def group():
+        for i in range(n_msgs):
+            chat_id, title = rng.choice(chats)
+            ts = (start + timedelta(seconds=365 * 86400 * i // max(n_msgs, 1))).strftime('%Y-%m-%d %H:%M:%S')
+            yield chat_id, title, rng.choice(names), _sentence(rng, 2, 25), i + 1, int(i < n_msgs * 0.9), ts
+    _insert(app, 'INSERT INTO group_knowledge (chat_id,chat_title,speaker,message,message_id,synced_to_kb,timestamp) '
+                 'VALUES (?,?,?,?,?,?,?)', group(), 'group_knowledge')
+    with app.db() as conn:
+        conn.execute('''
+            INSERT INTO group_sync_state (chat_id,last_id,updated_at)
+            SELECT chat_id, MAX(id), datetime('now') FROM group_knowledge WHERE synced_to_kb=1 GROUP BY chat_id
+            ON CONFLICT(chat_id) DO UPDATE SET last_id=excluded.last_id, updated_at=excluded.updated_at
+        ''')
+
+    # Inside ACTIVITY_MAX_DAYS so the app's pruner keeps them (given a large enough ACTIVITY_MAX_ROWS)
+    n_act = volumes['activity']
+    astart = now - timedelta(days=min(app.ACTIVITY_MAX_DAYS - 1, 89))
+    span = (now - astart).total_seconds()
+    _insert(app, 'INSERT INTO activity_log (action,details,timestamp) VALUES (?,?,?)',
+            ((rng.choice(ACTIONS), _sentence(rng, 2, 8),
+              (astart + timedelta(seconds=span * i / max(n_act, 1))).strftime('%Y-%m-%d %H:%M:%S'))
+             for i in range(n_act)), 'activity_log')
+    with app.db() as conn:
+        app._init_activity_rollups(conn)   # rebuilds hourly/daily rollups from the raw rows
+        conn.execute('ANALYZE')
+
+def cmd_seed(args):
+    app = _load_app(args.db)
+    volumes = {k: int(round(v * args.scale)) for k, v in VOLUMES.items()}
+    for k in VOLUMES:
+        if getattr(args, k) is not None:
+            volumes[k] = getattr(args, k)
+    volumes['members'], volumes['group_chats'] = max(volumes['members'], 1), max(volumes['group_chats'], 1)
+    print(f'[SEED] {args.db}: ' + ', '.join(f'{k}={v:,}' for k, v in volumes.items()))
+    started = time.perf_counter()
+    seed(app, volumes, random.Random(args.seed))
+    app.activity_log.flush()
+    print(f'[SEED] done in {time.perf_counter() - started:.1f}s, {os.path.getsize(args.db) / 2**20:.0f} MiB')
+
+# ── LOAD DRIVER ───────────────────────────────────────────────────────────────
+# (name, path, needs X-Bot-Key). {q} is replaced by a rotating search term.
+ROUTES = (
+    ('index',            '/', False),
+    ('tasks',            '/api/tasks', False),
+    ('tasks_filtered',   '/api/tasks?status=todo,in_progress&priority=high,urgent', False),
+    ('tasks_count',      '/api/tasks?status=todo&count=1', False),
+    ('team',             '/api/team', False),
+    ('stats',            '/api/stats', False),
+    ('notes',            '/api/notes', False),
+    ('kb',               '/api/kb', False),
+    ('activity',         '/api/activity', False),
+    ('activity_trends',  '/api/activity/trends?bucket=day', False),
+    ('changes',          '/api/changes?since=0&limit=500', False),
+    ('group_knowledge',  '/api/group-knowledge', False),
+    ('bot_kb_search',    '/bot/kb?q={q}', True),
+    ('bot_kb',           '/bot/kb', True),
+    ('bot_tasks',        '/bot/tasks', True),
+    ('bot_stats',        '/bot/stats', True),
+    ('bot_team',         '/bot/team', True),
+)
+SEARCH_TERMS = ('invoice', 'deploy', 'client meeting', 'payment gateway', 'onboarding', 'budget review',
+                'release', 'logo design', 'refund', 'roadmap')
+
+class InProcessClient:
+    """Flask test client: measures the app without a network or WSGI server in the way."""
+    def __init__(self, app, password, bot_key, encoding=None):
+        self.client, self.bot_key = app.app.test_client(), bot_key
+        self.extra = {'Accept-Encoding': encoding} if encoding else {}
+        self.client.post('/api/login', json={'password': password})
+
+    def get(self, path, bot):
+        r = self.client.get(path, headers=dict(self.extra, **({'X-Bot-Key': self.bot_key} if bot else {})))
+        return r.status_code, len(r.get_data())
+
+class HttpClient:
+    """One keep-alive connection per worker against a running server."""
+    def __init__(self, url, password, bot_key, encoding=None):
+        u = urllib.parse.urlsplit(url)
+        self.extra = {'Accept-Encoding': encoding} if encoding else {}
+        self.conn = (http.client.HTTPSConnection if u.scheme == 'https' else http.client.HTTPConnection)(u.netloc, timeout=60)
+        self.prefix, self.bot_key, self.cookie = u.path.rstrip('/'), bot_key, ''
+        self.conn.request('POST', self.prefix + '/api/login', json.dumps({'password': password}),
+                          {'Content-Type': 'application/json'})
+        r = self.conn.getresponse()
+        r.read()
+        self.cookie = (r.getheader('Set-Cookie') or '').split(';')[0]
+
+    def get(self, path, bot):
+        headers = {'X-Bot-Key': self.bot_key} if bot else {'Cookie': self.cookie}
+        self.conn.request('GET', self.prefix + path, headers=dict(self.extra, **headers))
+        r = self.conn.getresponse()
+        return r.status, len(r.read())
+
+def _percentile(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))] if sorted_vals else None
+
+def bench_route(clients, path, bot, duration, warmup, bust):
+    """Run every client against one route for `duration` seconds; returns the route's result dict."""
+    latencies, errors, sizes, lock = [], [0], [0], threading.Lock()
+    counter = itertools.count()
+    def url():
+        n = next(counter)
+        p = path.replace('{q}', urllib.parse.quote(SEARCH_TERMS[n % len(SEARCH_TERMS)]))
+        # A unique query arg defeats the server's response cache so every request does the real work
+        return p + ('&' if '?' in p else '?') + f'_bench={n}' if bust else p
+    def worker(client):
+        for _ in range(warmup):
+            client.get(url(), bot)
+        barrier.wait()
+        mine, errs, size = [], 0, 0
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status, n = client.get(url(), bot)
+            mine.append(time.perf_counter() - started)
+            errs += status != 200
+            size += n
+        with lock:
+            latencies.extend(mine)
+            errors[0] += errs
+            sizes[0]  += size
+    barrier  = threading.Barrier(len(clients) + 1)
+    threads  = [threading.Thread(target=worker, args=(c,), daemon=True) for c in clients]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started  = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {'requests': len(latencies), 'errors': errors[0], 'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': ms(_percentile(latencies, 0.50)), 'p95_ms': ms(_percentile(latencies, 0.95)),
+            'p99_ms': ms(_percentile(latencies, 0.99)), 'max_ms': ms(latencies[-1] if latencies else None),
+            'avg_bytes': round(sizes[0] / len(latencies)) if latencies else 0}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def cmd_run(args):
+    routes = [r for r in ROUTES if not args.routes or r[0] in args.routes.split(',')]
+    meta = {'commit': _git_commit(), 'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'concurrency': args.concurrency,
+            'duration_s': args.duration, 'response_cache': args.response_cache,
+            'accept_encoding': args.accept_encoding}
+    if args.url:
+        meta['target'] = args.url
+        make = lambda: HttpClient(args.url, args.password, args.bot_key, args.accept_encoding)
+    else:
+        app = _load_app(args.db)
+        meta['target'] = 'in-process'
+        with app.db() as conn:
+            meta['rows'] = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+                            for t in ('tasks', 'team_members', 'comments', 'notes', 'kb_entries',
+                                      'group_knowledge', 'activity_log', 'reminders')}
+        password, bot_key = args.password or app.PASSWORD, args.bot_key or app.BOT_API_KEY
+        make = lambda: InProcessClient(app, password, bot_key, args.accept_encoding)
+    clients = [make() for _ in range(args.concurrency)]
+    results = {}
+    print(f"{'route':18} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, path, bot in routes:
+        r = results[name] = bench_route(clients, path, bot, args.duration, args.warmup, not args.response_cache)
+        print(f"{name:18} {r['rps']:>9} {r['p50_ms']!s:>9} {r['p95_ms']!s:>9} {r['p99_ms']!s:>9} {r['errors']:>7}")
+    with open(args.out, 'w') as f:
+        json.dump({'meta': meta, 'routes': results}, f, indent=2)
+    print(f'[BENCH] wrote {args.out}')
+    return 1 if any(r['errors'] for r in results.values()) else 0
+
+def cmd_compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    for key in ('target', 'concurrency', 'rows'):
+        if before['meta'].get(key) != after['meta'].get(key):
+            print(f"[BENCH] warning: runs differ in {key}: {before['meta'].get(key)} vs {after['meta'].get(key)}")
+    delta = lambda a, b: f'{(b - a) / a * 100:+.1f}%' if a and b is not None else 'n/a'
+    print(f"{before['meta'].get('commit')} → {after['meta'].get('commit')}")
+    if 'bot' in before and 'bot' in after:
+        for key in ('updates_per_s', 'webhook_p50_ms', 'webhook_p99_ms', 'reply_p50_ms', 'reply_p99_ms', 'db_statements'):
+            b, a = before['bot'].get(key), after['bot'].get(key)
+            print(f"{key:18} {a!s:>10} {delta(b, a):>9}")
+        return
+    print(f"{'route':18} {'rps':>18} {'p50 ms':>20} {'p99 ms':>20}")
+    for name, b in before['routes'].items():
+        a = after['routes'].get(name)
+        if a is None:
+            continue
+        print(f"{name:18} {a['rps']:>9} {delta(b['rps'], a['rps']):>8} "
+              f"{a['p50_ms']!s:>10} {delta(b['p50_ms'], a['p50_ms']):>9} "
+              f"{a['p99_ms']!s:>10} {delta(b['p99_ms'], a['p99_ms']):>9}")
+
+# ── COMPRESSION LEVELS ────────────────────────────────────────────────────────
+def cmd_compress(args):
+    """Fetch each route's body once, then time every compression level on it."""
+    import gzip
+    app = _load_app(args.db)
+    client = InProcessClient(app, args.password or app.PASSWORD, args.bot_key or app.BOT_API_KEY)
+    codecs = [(f'gzip-{n}', lambda b, n=n: gzip.compress(b, n, mtime=0)) for n in map(int, args.levels.split(','))]
+    if app.brotli:
+        codecs += [(f'br-{n}', lambda b, n=n: app.brotli.compress(b, quality=n)) for n in (4, 6)]
+    routes = [r for r in ROUTES if not args.routes or r[0] in args.routes.split(',')]
+    results = {}
+    print(f"{'route':18} {'bytes':>9}  " + '  '.join(f'{name:>16}' for name, _ in codecs))
+    for name, path, bot in routes:
+        url = path.replace('{q}', SEARCH_TERMS[0])
+        r = client.client.get(url, headers={'X-Bot-Key': client.bot_key} if bot else {})
+        body = r.get_data()
+        row = results[name] = {'bytes': len(body)}
+        for codec, fn in codecs:
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                out = fn(body)
+            row[codec] = {'bytes': len(out), 'ratio': round(len(body) / max(len(out), 1), 2),
+                          'us': round((time.perf_counter() - started) / args.repeat * 1e6, 1)}
+        print(f"{name:18} {len(body):>9}  " + '  '.join(
+            f"{row[c]['ratio']:>6}x {row[c]['us']:>7}µs" for c, _ in codecs))
+    with open(args.out, 'w') as f:
+        json.dump({'meta': {'commit': _git_commit(), 'compress_level': app.COMPRESS_LEVEL,
+                            'min_bytes': app.COMPRESS_MIN_BYTES}, 'routes': results}, f, indent=2)
+    print(f'[BENCH] wrote {args.out}')
+
+# ── TELEGRAM STAND-IN ─────────────────────────────────────────────────────────
+# A local Bot API that answers like Telegram, counts every call and can add
+# latency or throttle with 429s. Point the app at it with TELEGRAM_API_URL.
+class BotApiStub:
+    def __init__(self, port=0, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, retry_after=1, record=None, verbose=False):
+        self.latency_ms, self.jitter_ms, self.rate_429, self.retry_after = latency_ms, jitter_ms, rate_429, retry_after
+        self.verbose    = verbose
+        self.calls      = Counter()   # method -> calls answered (429s included)
+        self.throttled  = 0
+        self.on_message = None        # fn(chat_id, text, received_at) for each accepted sendMessage
+        self._record    = open(record, 'a') if record else None
+        self._lock      = threading.Lock()
+        self._pending   = threading.Condition()
+        self._updates   = deque()       # pushed updates not yet confirmed by a getUpdates offset
+        self.pushed_at  = {}            # update_id -> perf_counter when pushed
+        self._ids       = itertools.count(1)
+        self._rng       = random.Random()
+        stub = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'   # keep-alive, like the real API
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+            def do_POST(self):
+                stub._handle(self)
+            do_GET = do_POST
+            def log_message(self, *args):
+                pass
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='bot-api-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        if self._record:
+            self._record.close()
+
+    def push(self, update):
+        """Queue an update for the app's getUpdates long poll."""
+        with self._pending:
+            self.pushed_at[update['update_id']] = time.perf_counter()
+            self._updates.append(update)
+            self._pending.notify_all()
+
+    def wait_confirmed(self, timeout):
+        """Wait until the poller has confirmed every pushed update."""
+        with self._pending:
+            return self._pending.wait_for(lambda: not self._updates, timeout)
+
+    def _get_updates(self, payload):
+        # Like Telegram: an offset confirms everything below it; an empty queue is held open up to `timeout`
+        offset, limit = payload.get('offset'), min(int(payload.get('limit') or 100), 100)
+        with self._pending:
+            while offset is not None and self._updates and self._updates[0]['update_id'] < int(offset):
+                self._updates.popleft()
+            self._pending.notify_all()
+            self._pending.wait_for(lambda: self._updates, float(payload.get('timeout') or 0))
+            return list(itertools.islice(self._updates, limit))
+
+    def _handle(self, req):
+        received = time.perf_counter()
+        url      = urllib.parse.urlsplit(req.path)
+        method   = url.path.rsplit('/', 1)[-1]
+        body     = req.rfile.read(int(req.headers.get('Content-Length') or 0))
+        try:
+            payload = json.loads(body) if body else dict(urllib.parse.parse_qsl(url.query))
+        except ValueError:
+            payload = {}
+        delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+        with self._lock:
+            self.calls[method] += 1
+            throttle = self.rate_429 > 0 and self._rng.random() < self.rate_429
+            self.throttled += throttle
+            if not throttle and self._record and method != 'getUpdates':
+                self._record.write(json.dumps({'method': method, 'payload': payload}) + '\n')
+        if throttle:
+            status, resp = 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': self.retry_after},
+                                 'description': f'Too Many Requests: retry after {self.retry_after}'}
+        elif method == 'getUpdates':
+            status, resp = 200, {'ok': True, 'result': self._get_updates(payload)}
+        elif method == 'sendMessage':
+            status, resp = 200, {'ok': True, 'result': {'message_id': next(self._ids), 'date': int(time.time()),
+                                                       'chat': {'id': payload.get('chat_id')}, 'text': payload.get('text')}}
+        else:
+            status, resp = 200, {'ok': True, 'result': True}
+        data = json.dumps(resp).encode()
+        req.send_response(status)
+        req.send_header('Content-Type', 'application/json')
+        req.send_header('Content-Length', str(len(data)))
+        req.end_headers()
+        req.wfile.write(data)
+        if throttle or method != 'sendMessage':
+            return
+        if self.verbose:
+            print(f"[STUB] → {payload.get('chat_id')}: {str(payload.get('text', '')).splitlines()[0][:80]}")
+        if self.on_message:
+            self.on_message(str(payload.get('chat_id')), payload.get('text', ''), received)
+
+def cmd_tg_stub(args):
+    stub = BotApiStub(args.port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after,
+                      args.record, verbose=True)
+    if args.updates:
+        with open(args.updates) as f:
+            for line in f:
+                if line.strip():
+                    stub.push(json.loads(line))
+        print(f'[STUB] serving {len(stub.pushed_at)} update(s) to getUpdates (run `python app.py poll`)')
+    print(f'[STUB] Bot API stand-in on {stub.url}: run the app with TELEGRAM_API_URL={stub.url}')
+    stub.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+        print(f'[STUB] calls: {dict(stub.calls)}, throttled: {stub.throttled}')
+
+# ── BOT REPLAY ────────────────────────────────────────────────────────────────
+# Virtual users each own a private chat and run scripted conversations,
+# waiting for the bot's reply to every step before sending the next. A share
+# of traffic is group chatter, which the bot absorbs without replying.
+# Reply latency runs from posting an update to the stub receiving the answer.
+SCENARIOS = (
+    ('summary',     ('/tasks',)),
+    ('stats',       ('/stats',)),
+    ('kb_search',   ('/kb {word}',)),
+    ('quick_task',  ('add task {sentence}',)),
+    ('quick_note',  ('note: {sentence}',)),
+    ('reminder',    ('remind me {sentence} at 5pm',)),
+    ('guided_task', ('/newtask', '{sentence}', 'high', 'skip')),
+    ('guided_kb',   ('/addkb', '{word} | {sentence} | Bench')),
+    ('done_button', ('callback:done:{task}',)),
+)
+
+class ReplyTracker:
+    """Matches each reply to the latest update posted to the same chat."""
+    def __init__(self):
+        self._lock    = threading.Lock()
+        self._sent    = {}   # chat_id -> perf_counter() of the latest update
+        self._waiting = {}   # chat_id -> Event for a closed-loop user
+        self.latencies, self.replies, self.unmatched = [], 0, 0
+
+    def sent(self, chat_id, event=None):
+        with self._lock:
+            self._sent[chat_id] = time.perf_counter()
+            if event is not None:
+                event.clear()
+                self._waiting[chat_id] = event
+
+    def received(self, chat_id, text, at):
+        with self._lock:
+            self.replies += 1
+            t0 = self._sent.get(chat_id)
+            if t0 is None or at < t0:
+                self.unmatched += 1
+                return
+            self.latencies.append(at - t0)
+            event = self._waiting.pop(chat_id, None)
+        if event is not None:
+            event.set()
+
+def _update(n, chat, text, user_id, username):
+    if text.startswith('callback:'):
+        return {'update_id': n, 'callback_query': {'id': str(n), 'data': text[len('callback:'):],
+                'from': {'id': user_id, 'is_bot': False, 'username': username},
+                'message': {'message_id': n, 'chat': chat}}}
+    return {'update_id': n, 'message': {'message_id': n, 'date': int(time.time()), 'chat': chat, 'text': text,
+                                         'from': {'id': user_id, 'is_bot': False, 'username': username}}}
+
+class WebhookPoster:
+    def __init__(self, app=None, url=None):
+        if url:
+            u = urllib.parse.urlsplit(url)
+            self.conn = (http.client.HTTPSConnection if u.scheme == 'https' else http.client.HTTPConnection)(u.netloc, timeout=60)
+            self.path = u.path.rstrip('/') + '/telegram/webhook'
+        else:
+            self.client = app.app.test_client()
+
+    def post(self, update):
+        if hasattr(self, 'client'):
+            return self.client.post('/telegram/webhook', json=update).status_code
+        self.conn.request('POST', self.path, json.dumps(update), {'Content-Type': 'application/json'})
+        r = self.conn.getresponse()
+        r.read()
+        return r.status
+
+def _write_counts(db_path):
+    # Rows written since the database was created: per-table version counters
+    # (bumped by trigger on every insert/update/delete), group messages, session saves.
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        counts = dict(conn.execute('SELECT name, value FROM resource_versions'))
+        counts['group_knowledge']   = conn.execute('SELECT COALESCE(MAX(id), 0) FROM group_knowledge').fetchone()[0]
+        counts['telegram_sessions'] = conn.execute('SELECT COUNT(*) + COALESCE(SUM(version), 0) '
+                                                   'FROM telegram_sessions').fetchone()[0]
+        counts['telegram_updates']  = conn.execute('SELECT COUNT(*) FROM telegram_updates').fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+def cmd_bot(args):
+    stub = BotApiStub(args.stub_port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after).start()
+    tracker = ReplyTracker()
+    stub.on_message = tracker.received
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='crm-bench-'), 'bot.db')
+    app = None
+    polling = args.transport == 'poll'
+    if args.url and polling:
+        print(f'[BOT] run `python app.py poll` on {db_path} with TELEGRAM_API_URL={stub.url} and a TELEGRAM_BOT_TOKEN set')
+    elif args.url:
+        print(f'[BOT] the server at {args.url} must run with TELEGRAM_API_URL={stub.url} and a TELEGRAM_BOT_TOKEN set')
+    else:
+        env = {'TELEGRAM_API_URL': stub.url, 'TELEGRAM_BOT_TOKEN': 'bench:token', 'TELEGRAM_ALLOWED_USERS': '',
+               'TG_POLL_TIMEOUT': '1'}
+        if not args.telegram_limits:
+            env.update(TG_GLOBAL_RATE='1000000', TG_PRIVATE_GAP='0', TG_GROUP_GAP='0')
+        app = _load_app(db_path, env)
+        if polling:
+            app.tg_poller.start()
+    with sqlite3.connect(db_path) as conn:
+        task_ids = [r[0] for r in conn.execute('SELECT id FROM tasks ORDER BY id DESC LIMIT 1000')] or [1]
+        # The webhook drops update_ids it has seen, so number this run's updates after the last one
+        first_id = conn.execute('SELECT COALESCE(MAX(update_id), 0) FROM telegram_updates').fetchone()[0] + 1
+    writes_before  = _write_counts(db_path)
+    queries_before = app.metrics.db_queries if app else None
+
+    updates, webhook_ms, timeouts, errors = [], [], [0], [0]
+    ids, lock = itertools.count(first_id), threading.Lock()
+    recorded = None
+    if args.updates:
+        with open(args.updates) as f:
+            recorded = [dict(json.loads(line), update_id=next(ids)) for line in f if line.strip()]
+
+    def post(poster, update, chat_id, event=None):
+        tracker.sent(chat_id, event)
+        if polling:
+            stub.push(update)
+            return
+        started = time.perf_counter()
+        status  = poster.post(update)
+        with lock:
+            webhook_ms.append(time.perf_counter() - started)
+            errors[0] += status != 200
+
+    def virtual_user(i):
+        rng, poster = random.Random(args.seed * 1000 + i), WebhookPoster(app, args.url)
+        chat  = {'id': 900000000 + i, 'type': 'private'}
+        group = {'id': -1009000000 - i % max(args.groups, 1), 'type': 'supergroup', 'title': f'Bench Group {i % max(args.groups, 1)}'}
+        event = threading.Event()
+        fill  = lambda t: t.format(word=rng.choice(WORDS), sentence=_sentence(rng, 3, 8), task=rng.choice(task_ids))
+        barrier.wait()
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            if rng.random() < args.group_share:
+                post(poster, _update(next(ids), group, _sentence(rng, 2, 20), chat['id'], f'user{i}'), str(group['id']))
+                continue
+            for step in rng.choice(SCENARIOS)[1]:
+                post(poster, _update(next(ids), chat, fill(step), chat['id'], f'user{i}'), str(chat['id']), event)
+                if not event.wait(args.reply_timeout):
+                    with lock:
+                        timeouts[0] += 1
+                    break
+
+    def replayer(i):
+        # Recorded streams are split by chat so each chat keeps its order; nothing waits for replies
+        poster = WebhookPoster(app, args.url)
+        barrier.wait()
+        for update in recorded:
+            msg  = update.get('message') or update.get('edited_message') or (update.get('callback_query') or {}).get('message') or {}
+            chat = str((msg.get('chat') or {}).get('id'))
+            if hash(chat) % args.concurrency == i:
+                post(poster, update, chat)
+
+    barrier = threading.Barrier(args.concurrency + 1)
+    threads = [threading.Thread(target=replayer if recorded is not None else virtual_user, args=(i,), daemon=True)
+               for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    # Let queued replies and write-behind buffers drain before counting
+    if polling:
+        stub.wait_confirmed(args.reply_timeout)
+        if app:
+            app.tg_poller.stop()
+    if app:
+        app.tg_updates.drain(args.reply_timeout)
+        app.tg_outbox.flush(args.reply_timeout)
+        app.group_ingest.flush()
+        app.tg_sessions.flush()
+        app.activity_log.flush()
+    else:
+        time.sleep(min(args.reply_timeout, 2))
+    writes_after = _write_counts(db_path)
+    stub.stop()
+
+    webhook_ms.sort()
+    latencies = sorted(tracker.latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    updates = len(stub.pushed_at) if polling else len(webhook_ms)
+    result = {
+        'updates': updates, 'updates_per_s': round(updates / elapsed, 1), 'http_errors': errors[0],
+        'webhook_p50_ms': ms(_percentile(webhook_ms, 0.50)), 'webhook_p95_ms': ms(_percentile(webhook_ms, 0.95)),
+        'webhook_p99_ms': ms(_percentile(webhook_ms, 0.99)),
+        'replies': tracker.replies, 'reply_timeouts': timeouts[0],
+        'reply_p50_ms': ms(_percentile(latencies, 0.50)), 'reply_p95_ms': ms(_percentile(latencies, 0.95)),
+        'reply_p99_ms': ms(_percentile(latencies, 0.99)),
+        'db_rows_written': {k: writes_after[k] - writes_before.get(k, 0) for k in writes_after
+                            if writes_after[k] != writes_before.get(k, 0)},
+        'db_statements': app.metrics.db_queries - queries_before if app else None,
+        'bot_api_calls': dict(stub.calls), 'bot_api_throttled': stub.throttled,
+    }
+    if polling and app:
+        poll = app.tg_poller.snapshot()
+        result.update(poll_batches=poll['batches'], poll_max_batch=poll['max_batch'],
+                      poll_mean_batch=round(poll['updates'] / poll['batches'], 1) if poll['batches'] else None)
+    meta = {'commit': _git_commit(), 'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'target': args.url or 'in-process', 'transport': args.transport,
+            'concurrency': args.concurrency, 'duration_s': args.duration,
+            'mode': 'replay' if recorded is not None else 'synthetic', 'group_share': args.group_share,
+            'stub_latency_ms': args.latency_ms, 'stub_rate_429': args.rate_429, 'telegram_limits': args.telegram_limits}
+    for k, v in result.items():
+        print(f'{k:18} {v}')
+    with open(args.out, 'w') as f:
+        json.dump({'meta': meta, 'bot': result}, f, indent=2)
+    print(f'[BENCH] wrote {args.out}')
+    return 1 if errors[0] else 0
+
+def _load_app(db_path, env=None):
+    # app reads its settings at import time
+    os.environ['DB_PATH'] = os.path.abspath(db_path)
+    os.environ.update(env or {})
+    os.environ.setdefault('ACTIVITY_MAX_ROWS', str(10**9))   # don't let the pruner eat the seeded history
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    app.init_db()
+    return app
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Seed and load-test the CRM API.')
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    s = sub.add_parser('seed', help='bulk-load a database with realistic volumes')
+    s.add_argument('--db', required=True, help='SQLite file to create or extend')
+    s.add_argument('--scale', type=float, default=1.0, help='multiply every default volume by this')
+    s.add_argument('--seed', type=int, default=1, help='random seed (same seed, same data)')
+    for k, v in VOLUMES.items():
+        s.add_argument(f"--{k.replace('_', '-')}", dest=k, type=int, help=f'rows to insert (default {v:,} × scale)')
+
+    r = sub.add_parser('run', help='drive each route at fixed concurrency and record latency')
+    r.add_argument('--db', help='database for in-process runs (seed it first)')
+    r.add_argument('--url', help='benchmark a running server instead, e.g. http://127.0.0.1:8090')
+    r.add_argument('--password', help='dashboard password (default: CRM_PASSWORD as the app sees it)')
+    r.add_argument('--bot-key', help='X-Bot-Key for /bot routes (default: BOT_API_KEY as the app sees it)')
+    r.add_argument('--concurrency', type=int, default=4)
+    r.add_argument('--duration', type=float, default=5.0, help='seconds per route')
+    r.add_argument('--warmup', type=int, default=5, help='untimed requests per client before each route')
+    r.add_argument('--routes', help='comma-separated subset of: ' + ','.join(n for n, _, _ in ROUTES))
+    r.add_argument('--response-cache', action='store_true',
+                   help='let repeated requests hit the response cache (default: bypass it)')
+    r.add_argument('--accept-encoding', help="send this Accept-Encoding, e.g. 'gzip' (default: none)")
+    r.add_argument('--out', default='bench.json')
+
+    z = sub.add_parser('compress', help='size and time each compression level on every route\'s response')
+    z.add_argument('--db', required=True, help='database to read (seed it first)')
+    z.add_argument('--password', help='dashboard password (default: CRM_PASSWORD as the app sees it)')
+    z.add_argument('--bot-key', help='X-Bot-Key for /bot routes (default: BOT_API_KEY as the app sees it)')
+    z.add_argument('--levels', default='1,3,6,9', help='comma-separated gzip levels')
+    z.add_argument('--routes', help='comma-separated subset of the run routes')
+    z.add_argument('--repeat', type=int, default=20, help='compressions per level, averaged')
+    z.add_argument('--out', default='bench-compress.json')
+
+    def stub_args(parser):
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every Bot API call')
+        parser.add_argument('--jitter-ms', type=float, default=0.0, help='random extra latency, 0..N ms')
+        parser.add_argument('--rate-429', type=float, default=0.0, help='share of calls answered with 429')
+        parser.add_argument('--retry-after', type=int, default=1, help='retry_after sent with each 429')
+
+    t = sub.add_parser('tg-stub', help='run a local stand-in for the Telegram Bot API')
+    t.add_argument('--port', type=int, default=8081)
+    t.add_argument('--record', help='append every accepted call to this JSONL file')
+    t.add_argument('--updates', help='JSONL file of updates to hand out through getUpdates')
+    stub_args(t)
+
+    b = sub.add_parser('bot', help='replay Telegram updates at /telegram/webhook against the stand-in')
+    b.add_argument('--db', help='database for in-process runs (default: a fresh temporary one)')
+    b.add_argument('--url', help='drive a running server instead (start it with TELEGRAM_API_URL pointing at the stub)')
+    b.add_argument('--stub-port', type=int, default=0, help='port for the stand-in (0 = any free port)')
+    b.add_argument('--updates', help='JSONL file of recorded updates to replay instead of synthetic traffic')
+    b.add_argument('--transport', choices=('webhook', 'poll'), default='webhook',
+                   help='post to /telegram/webhook, or serve the updates to the app\'s getUpdates poller')
+    b.add_argument('--concurrency', type=int, default=8, help='virtual users (or replay threads)')
+    b.add_argument('--duration', type=float, default=10.0, help='seconds of synthetic traffic')
+    b.add_argument('--group-share', type=float, default=0.5, help='share of synthetic updates that are group chatter')
+    b.add_argument('--groups', type=int, default=4, help='group chats the chatter is spread over')
+    b.add_argument('--reply-timeout', type=float, default=5.0, help='seconds to wait for each reply')
+    b.add_argument('--telegram-limits', action='store_true',
+                   help="keep the outbox's real per-chat and global rate limits (default: lifted)")
+    b.add_argument('--seed', type=int, default=1)
+    b.add_argument('--out', default='bench-bot.json')
+    stub_args(b)
+
+    c = sub.add_parser('compare', help='compare two run results')
+    c.add_argument('before')
+    c.add_argument('after')
+
+    args = p.parse_args(argv)
+    if args.cmd == 'run' and not (args.db or args.url):
+        p.error('run needs --db or --url')
+    if args.cmd == 'run' and args.url and not (args.password and args.bot_key):
+        args.password = args.password or os.environ.get('CRM_PASSWORD', 'admin123')
+        args.bot_key  = args.bot_key or os.environ.get('BOT_API_KEY', 'crm-bot-secret-key-change-me')
+    return {'seed': cmd_seed, 'run': cmd_run, 'bot': cmd_bot, 'tg-stub': cmd_tg_stub,
+            'compress': cmd_compress, 'compare': cmd_compare}[args.cmd](args) or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
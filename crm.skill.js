@@ -41,8 +41,7 @@ export default {
         }
       },
       async execute({ status = 'all' }) {
-        const tasks = await crmFetch('/bot/tasks');
-        const filtered = status === 'all' ? tasks : tasks.filter(t => t.status === status);
+        const filtered = await crmFetch(status === 'all' ? '/bot/tasks' : `/bot/tasks?status=${status}`);
         if (!filtered.length) return `No ${status === 'all' ? '' : status + ' '}tasks found.`;
         return filtered.map(t =>
           `#${t.id} [${t.priority.toUpperCase()}] ${t.title} — ${t.status}` +
@@ -98,6 +97,43 @@ export default {
       }
     },
 
+    {
+      name:        'crm_bulk_tasks',
+      description: 'Create, update or delete several tasks at once. Either every change is applied or none is.',
+      parameters:  {
+        type:       'object',
+        required:   ['ops'],
+        properties: {
+          ops: {
+            type:  'array',
+            items: {
+              type:       'object',
+              required:   ['op'],
+              properties: {
+                op:       { type: 'string', enum: ['create','update','delete'] },
+                id:       { type: 'number', description: 'Task ID (update/delete)' },
+                title:    { type: 'string' },
+                status:   { type: 'string', enum: ['todo','in_progress','done'] },
+                priority: { type: 'string', enum: ['low','medium','high','urgent'] },
+                due_date: { type: 'string', description: 'YYYY-MM-DD' },
+              }
+            }
+          }
+        }
+      },
+      async execute({ ops }) {
+        const res = await crmFetch('/bot/tasks/bulk', {
+          method: 'POST',
+          body:   JSON.stringify({ ops })
+        });
+        if (!res.success) {
+          const bad = (res.results || []).map((r, i) => r.ok ? null : `#${i + 1}: ${r.error}`).filter(Boolean);
+          return `❌ ${res.error}${bad.length ? '\n' + bad.join('\n') : ''}`;
+        }
+        return `✅ ${res.created} created, ${res.updated} updated, ${res.deleted} deleted.`;
+      }
+    },
+
     {
       name:        'crm_get_stats',
       description: 'Get dashboard stats: total tasks, in progress, overdue, notes, KB entries.',
@@ -129,7 +165,7 @@ export default {
         const results = await crmFetch(`/bot/kb?q=${encodeURIComponent(query)}`);
         if (!results.length) return `No KB results for "${query}".`;
         return results.map(e =>
-          `📚 **${e.title}** [${e.category}]\n${e.preview}`
+          `📚 **${e.title}** [${e.category}]\n${e.snippet || e.preview}`
         ).join('\n\n');
       }
     },